@@ -0,0 +1,309 @@
+"""
+Scaling benchmark for CIDRE on synthetic citation networks
+
+The benchmark generates degree-corrected SBM networks with planted cartels
+(see cidre.synthetic), runs each stage of the detection, and records the
+wall time, CPU time, peak memory allocated during the stage, and the
+maximum resident set size of the process. The recovery of the planted
+cartels is reported alongside.
+
+Usage:
+
+    python libs/cidre/benchmarks/run_benchmarks.py --sizes 1000 10000 100000 1000000 --output report.json
+    python libs/cidre/benchmarks/run_benchmarks.py --output report.json --baseline baseline.json
+    python libs/cidre/benchmarks/run_benchmarks.py --sizes 10000000 --num-threads 32 --output report.json
+
+The command exits with status 1 if a stage is slower than the baseline by
+more than the tolerance, or if the recovery of the cartels drops.
+"""
+import os
+import sys
+import gc
+import json
+import time
+import shutil
+import tempfile
+import platform
+import argparse
+import resource
+import tracemalloc
+import numpy as np
+import pandas as pd
+import scipy
+from scipy import sparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from cidre import cidre, filters, kernels, synthetic
+
+WORKFLOW_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../../workflow")
+
+# Stages shorter than this are not compared with the baseline as they are dominated by noise
+MIN_COMPARED_WALL_TIME = 0.05
+
+
+def profile(stages, name, func, *args, **kwargs):
+    """
+    Run func(*args, **kwargs) and record its cost in stages[name]
+    """
+    gc.collect()
+    tracemalloc.start()
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    result = func(*args, **kwargs)
+    cpu = time.process_time() - cpu
+    wall = time.perf_counter() - wall
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stages[name] = {
+        "wall": wall,
+        "cpu": cpu,
+        "peak_mem": peak,
+        "max_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    }
+    return result
+
+
+def run(num_nodes, args):
+    rng = np.random.default_rng(args.seed)
+    num_communities = max(2, int(np.sqrt(num_nodes) / 2))
+    num_cartels = max(1, min(args.num_cartels, num_nodes // 100))
+
+    stages = {}
+    A, community_ids, cartel_ids = profile(
+        stages,
+        "generate",
+        synthetic.generate_planted_cartels,
+        num_nodes,
+        num_communities,
+        mean_degree=args.mean_degree,
+        num_cartels=num_cartels,
+        cartel_strength=args.cartel_strength,
+        rng=rng,
+    )
+
+    if args.load_network:
+        load_network(A, stages)
+
+    # Filtering
+    pvals, src, trg, w = profile(
+        stages, "p_values", filters.calc_p_values_dcsbm, A, community_ids
+    )
+    is_significant = profile(
+        stages, "bh_test", filters.benjamini_hochberg_test, pvals, args.alpha
+    )
+    is_excessive = filters.get_threshold_filter(A, 0.5)
+    dcsbm_filter = filters.make_filter_func(
+        src[is_significant], trg[is_significant], None, A.shape[0]
+    )
+    A_pruned = profile(
+        stages,
+        "filtering",
+        cidre._prune,
+        A,
+        lambda s, t, w: dcsbm_filter(s, t, w) * is_excessive(s, t, w),
+    )
+
+    # Detection
+    U, donor_score, recipient_score = profile(
+        stages, "peeling", cidre._peel, A, A_pruned, args.theta
+    )
+    try:
+        groups = profile(
+            stages,
+            "components",
+            cidre._extract_groups,
+            A,
+            A_pruned,
+            U,
+            donor_score,
+            recipient_score,
+            args.theta,
+            0,
+        )
+    except ValueError:  # No group is found
+        groups = pd.DataFrame({"node_id": [], "group_id": []}, dtype=int)
+
+    return {
+        "num_nodes": num_nodes,
+        "num_edges": int(A.nnz),
+        "num_communities": num_communities,
+        "num_cartels": num_cartels,
+        "stages": stages,
+        "recovery": calc_recovery(cartel_ids, groups),
+    }
+
+
+def load_network(A, stages):
+    """
+    Time utils.load_network of the workflow on the network written in the
+    format of the workflow
+    """
+    sys.path.insert(0, WORKFLOW_DIR)
+    try:
+        import utils
+    except ImportError as e:
+        print("Skip load_network: %s" % e, file=sys.stderr)
+        return
+    finally:
+        sys.path.remove(WORKFLOW_DIR)
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        src, trg, w = sparse.find(A)
+        edges = pd.DataFrame({"source": src, "target": trg, "w": w.astype(int)})
+        edges.to_csv(os.path.join(tmp_dir, "edges-0.csv"), sep="\t", index=False)
+        edges.to_csv(os.path.join(tmp_dir, "raw-edges-0.csv"), sep="\t", index=False)
+        pd.DataFrame({"id": np.arange(A.shape[0])}).to_csv(
+            os.path.join(tmp_dir, "nodes-0.csv"), sep="\t", index=False
+        )
+        os.environ.pop("CIDRE_CACHE_DIR", None)
+        profile(stages, "load_network", utils.load_network, 0, tmp_dir)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def calc_recovery(cartel_ids, groups):
+    """
+    Match the planted cartels with the detected groups by the Jaccard index
+
+    Returns
+    -------
+    recovery : dict
+        - mean_jaccard : Average of the Jaccard index between each planted
+          cartel and the detected group most similar to it
+        - recall : Fraction of the planted cartels with the Jaccard index >= 0.5
+        - precision : Fraction of the detected groups that match a planted
+          cartel with the Jaccard index >= 0.5
+    """
+    num_cartels = np.max(cartel_ids) + 1
+    num_groups = groups["group_id"].nunique()
+    if num_groups == 0:
+        return {"mean_jaccard": 0.0, "recall": 0.0, "precision": 0.0, "num_groups": 0}
+
+    node_ids = groups["node_id"].values
+    group_ids = groups["group_id"].values
+    planted = cartel_ids[node_ids]
+    s = planted >= 0
+    overlap = sparse.csr_matrix(
+        (np.ones(np.sum(s)), (planted[s], group_ids[s])),
+        shape=(num_cartels, num_groups),
+    ).toarray()
+    cartel_size = np.bincount(cartel_ids[cartel_ids >= 0], minlength=num_cartels)
+    group_size = np.bincount(group_ids, minlength=num_groups)
+    jaccard = overlap / (cartel_size[:, None] + group_size[None, :] - overlap)
+    return {
+        "mean_jaccard": float(np.mean(np.max(jaccard, axis=1))),
+        "recall": float(np.mean(np.max(jaccard, axis=1) >= 0.5)),
+        "precision": float(np.mean(np.max(jaccard, axis=0) >= 0.5)),
+        "num_groups": int(num_groups),
+    }
+
+
+def compare(report, baseline, tolerance, recovery_tolerance):
+    """
+    Compare the report with the baseline
+
+    Returns
+    -------
+    regressions : list
+        Descriptions of the regressions
+    """
+    regressions = []
+    runs = {r["num_nodes"]: r for r in baseline["runs"]}
+    print("%10s %-14s %10s %10s %8s" % ("nodes", "stage", "baseline", "current", "ratio"))
+    for r in report["runs"]:
+        b = runs.get(r["num_nodes"])
+        if b is None:
+            continue
+        for stage, cost in r["stages"].items():
+            if stage not in b["stages"]:
+                continue
+            t0, t1 = b["stages"][stage]["wall"], cost["wall"]
+            ratio = t1 / max(t0, 1e-9)
+            print("%10d %-14s %9.3fs %9.3fs %8.2f" % (r["num_nodes"], stage, t0, t1, ratio))
+            if ratio > tolerance and t1 > MIN_COMPARED_WALL_TIME:
+                regressions.append(
+                    "%s for %d nodes: %.3fs -> %.3fs" % (stage, r["num_nodes"], t0, t1)
+                )
+        j0, j1 = b["recovery"]["mean_jaccard"], r["recovery"]["mean_jaccard"]
+        if j1 < j0 - recovery_tolerance:
+            regressions.append(
+                "recovery for %d nodes: mean Jaccard %.3f -> %.3f"
+                % (r["num_nodes"], j0, j1)
+            )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    parser.add_argument("--mean-degree", type=float, default=20)
+    parser.add_argument("--num-cartels", type=int, default=50)
+    parser.add_argument("--cartel-strength", type=float, default=1.0)
+    parser.add_argument("--theta", type=float, default=0.15)
+    parser.add_argument("--alpha", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--num-threads",
+        type=int,
+        default=kernels.get_num_threads(),
+        help="Number of threads of the sparse kernels (see cidre.kernels)",
+    )
+    parser.add_argument(
+        "--load-network",
+        action="store_true",
+        help="Also time load_network of the workflow on the network saved in files",
+    )
+    parser.add_argument("--output", help="JSON file for the report")
+    parser.add_argument("--baseline", help="JSON report to compare with")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=1.5,
+        help="A stage is regarded as a regression if it is slower than tolerance x baseline",
+    )
+    parser.add_argument("--recovery-tolerance", type=float, default=0.05)
+    args = parser.parse_args(argv)
+    kernels.set_num_threads(args.num_threads)
+
+    report = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "scipy": scipy.__version__,
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args),
+        },
+        "runs": [],
+    }
+    for num_nodes in args.sizes:
+        r = run(num_nodes, args)
+        report["runs"].append(r)
+        print(
+            "%d nodes, %d edges: %s, mean Jaccard %.3f"
+            % (
+                r["num_nodes"],
+                r["num_edges"],
+                ", ".join("%s %.3fs" % (k, v["wall"]) for k, v in r["stages"].items()),
+                r["recovery"]["mean_jaccard"],
+            )
+        )
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance, args.recovery_tolerance)
+        for r in regressions:
+            print("Regression: %s" % r)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
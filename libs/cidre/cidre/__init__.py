@@ -3,7 +3,21 @@ CIDRE algorithm
 """
 from cidre import utils
 from cidre import filters 
+from cidre import kernels
 from cidre import draw
 from cidre import cidre
-__all__ = ["utils", "filters", "draw", "cidre"]
-
+from cidre import sharedmem
+from cidre import parallel
+from cidre import render
+from cidre import cache
+from cidre import synthetic
+from cidre import community
+from cidre import groups
+from cidre import store
+from cidre import incremental
+from cidre import lineage
+from cidre import significance
+from cidre import stability
+from cidre import outofcore
+from cidre import citegraph
+__all__ = ["utils", "filters", "kernels", "draw", "cidre", "sharedmem", "parallel", "render", "cache", "synthetic", "community", "groups", "store", "incremental", "lineage", "significance", "stability", "outofcore", "citegraph"]
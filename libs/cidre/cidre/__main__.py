@@ -0,0 +1,14 @@
+"""
+Command line tools
+
+    python -m cidre cache info|prune [options]
+"""
+import sys
+from cidre import cache
+
+COMMANDS = {"cache": cache.main}
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in COMMANDS:
+        sys.exit("usage: python -m cidre {%s} ..." % ",".join(COMMANDS))
+    sys.exit(COMMANDS[sys.argv[1]](sys.argv[2:]))
@@ -0,0 +1,359 @@
+"""
+Content-addressed cache of intermediate results
+
+An artifact is a set of numpy arrays stored under a key computed from the
+hashes of the input arrays and the parameters that determine it. The arrays
+are saved as .npy files and loaded as read-only memory maps. The least
+recently used artifacts are evicted when the cache exceeds its size limit.
+
+The cache directory and the size limit are read from the environment
+variables CIDRE_CACHE_DIR and CIDRE_CACHE_MAX_BYTES by from_env.
+
+Usage from the command line:
+
+    python -m cidre cache info [--dir DIR]
+    python -m cidre cache prune [--max-size 20G] [--dir DIR]
+
+prune uses CIDRE_CACHE_MAX_BYTES if --max-size is not given.
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import numpy as np
+from scipy import sparse
+
+CACHE_DIR_ENV = "CIDRE_CACHE_DIR"
+MAX_BYTES_ENV = "CIDRE_CACHE_MAX_BYTES"
+META_FILE = "meta.json"
+
+
+class ArtifactCache:
+    """
+    Content-addressed store of numpy arrays
+
+    Parameters
+    ----------
+    root : str
+        Directory of the cache
+    max_bytes : int (Optional; Default None)
+        Size limit of the cache. If None, artifacts are never evicted.
+    """
+
+    def __init__(self, root, max_bytes=None):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def key(self, namespace, *inputs):
+        """
+        Key of the artifact computed from the inputs
+
+        Parameters
+        ----------
+        namespace : str
+            Name of the computation, e.g., "dcsbm_filter"
+        inputs : numpy.ndarray, scipy sparse matrix, or any object with a stable repr
+            Inputs that determine the artifact
+
+        Returns
+        -------
+        key : str
+        """
+        h = hashlib.blake2b(digest_size=20)
+        h.update(namespace.encode())
+        for x in inputs:
+            h.update(b"\0")
+            h.update(hash_input(x).encode())
+        return "%s-%s" % (namespace, h.hexdigest())
+
+    def load(self, key):
+        """
+        Load an artifact
+
+        Returns
+        -------
+        arrays : dict or None
+            Read-only memory maps of the arrays. None if the key is not in the cache.
+        """
+        path = self._path(key)
+        meta_file = os.path.join(path, META_FILE)
+        try:
+            with open(meta_file, "r") as f:
+                meta = json.load(f)
+            arrays = {
+                name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+                for name in meta["arrays"]
+            }
+        except (OSError, ValueError, KeyError):
+            return None
+
+        # Record the access for the eviction
+        try:
+            os.utime(meta_file)
+        except OSError:
+            pass
+        return arrays
+
+    def save(self, key, arrays):
+        """
+        Save an artifact
+
+        Parameters
+        ----------
+        key : str
+            Key given by ArtifactCache.key
+        arrays : dict
+            Arrays to save
+        """
+        path = self._path(key)
+        if os.path.exists(path):
+            return
+
+        # Write to a temporary directory first since other processes may
+        # read or write the same artifact
+        tmp_path = "%s.tmp.%d" % (path, os.getpid())
+        os.makedirs(tmp_path, exist_ok=True)
+        try:
+            for name, arr in arrays.items():
+                np.save(os.path.join(tmp_path, name + ".npy"), np.asarray(arr))
+            with open(os.path.join(tmp_path, META_FILE), "w") as f:
+                json.dump({"arrays": list(arrays.keys()), "created": time.time()}, f)
+            os.rename(tmp_path, path)
+        except OSError:
+            # Another process saved the artifact first
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+        if self.max_bytes is not None:
+            self.prune(self.max_bytes)
+
+    def entries(self):
+        """
+        Artifacts in the cache
+
+        Returns
+        -------
+        entries : list
+            List of (key, size in bytes, last access time), from the least
+            recently used one
+        """
+        entries = []
+        if not os.path.isdir(self.root):
+            return entries
+        for shard in os.listdir(self.root):
+            shard_dir = os.path.join(self.root, shard)
+            if not os.path.isdir(shard_dir):
+                continue
+            for key in os.listdir(shard_dir):
+                path = os.path.join(shard_dir, key)
+                try:
+                    atime = os.stat(os.path.join(path, META_FILE)).st_mtime
+                except OSError:
+                    continue  # Being written
+                size = sum(
+                    os.path.getsize(os.path.join(path, f)) for f in os.listdir(path)
+                )
+                entries.append((key, size, atime))
+        return sorted(entries, key=lambda x: x[2])
+
+    def prune(self, max_bytes):
+        """
+        Evict the least recently used artifacts until the cache size
+        is at most max_bytes
+
+        Returns
+        -------
+        removed : list
+            Keys of the evicted artifacts
+        """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = []
+        for key, size, _ in entries:
+            if total <= max_bytes:
+                break
+            shutil.rmtree(self._path(key), ignore_errors=True)
+            total -= size
+            removed.append(key)
+        return removed
+
+    def _path(self, key):
+        namespace, digest = key.rsplit("-", 1)
+        return os.path.join(self.root, digest[:2], key)
+
+
+def from_env():
+    """
+    Cache specified by the environment variables
+
+    Returns
+    -------
+    cache : ArtifactCache or None
+        None if CIDRE_CACHE_DIR is not set
+    """
+    root = os.environ.get(CACHE_DIR_ENV)
+    if not root:
+        return None
+    max_bytes = os.environ.get(MAX_BYTES_ENV)
+    return ArtifactCache(root, parse_size(max_bytes) if max_bytes else None)
+
+
+def cached(cache, key, compute):
+    """
+    Load the artifact for the key or compute and save it
+
+    Parameters
+    ----------
+    cache : ArtifactCache or None
+        Cache. If None, the artifact is computed without caching.
+    key : str
+        Key given by ArtifactCache.key
+    compute : function
+        compute() returns the artifact as a dict of numpy arrays
+
+    Returns
+    -------
+    arrays : dict
+        Artifact
+    """
+    if cache is None:
+        return compute()
+    arrays = cache.load(key)
+    if arrays is None:
+        arrays = compute()
+        cache.save(key, arrays)
+    return arrays
+
+
+def hash_input(x):
+    """
+    Hash of a numpy array, a scipy sparse matrix, or a parameter
+    """
+    h = hashlib.blake2b(digest_size=20)
+    if sparse.issparse(x):
+        x = _canonical_csr(x)
+        h.update(("csr%r" % (x.shape,)).encode())
+        for arr in [x.indptr, x.indices, x.data]:
+            _update_array(h, arr)
+    elif isinstance(x, np.ndarray):
+        _update_array(h, x)
+    else:
+        h.update(repr(x).encode())
+    return h.hexdigest()
+
+
+def hash_files(filenames):
+    """
+    Hash of the contents of files
+    """
+    h = hashlib.blake2b(digest_size=20)
+    for filename in filenames:
+        h.update(b"\0")
+        with open(filename, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+    return h.hexdigest()
+
+
+def csr_to_arrays(A, prefix):
+    """
+    Arrays of a csr matrix to be saved in an artifact
+    """
+    A = _canonical_csr(A)
+    return {
+        prefix + "_data": A.data,
+        prefix + "_indices": A.indices,
+        prefix + "_indptr": A.indptr,
+        prefix + "_shape": np.array(A.shape),
+    }
+
+
+def csr_from_arrays(arrays, prefix):
+    """
+    Inverse of csr_to_arrays
+    """
+    A = sparse.csr_matrix(
+        (
+            arrays[prefix + "_data"],
+            arrays[prefix + "_indices"],
+            arrays[prefix + "_indptr"],
+        ),
+        shape=tuple(arrays[prefix + "_shape"]),
+    )
+    # The saved matrix is in the canonical format, which prevents scipy
+    # from sorting the read-only indices in place
+    A.has_canonical_format = True
+    return A
+
+
+def parse_size(s):
+    """
+    Parse a size such as "500M" or "20G" into bytes
+    """
+    s = str(s).strip().upper().rstrip("B")
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+    if s and s[-1] in units:
+        return int(float(s[:-1]) * units[s[-1]])
+    return int(float(s))
+
+
+def format_size(n):
+    for unit in ["B", "K", "M", "G"]:
+        if n < 1024:
+            return "%.1f%s" % (n, unit)
+        n /= 1024
+    return "%.1fT" % n
+
+
+def _canonical_csr(A):
+    A = sparse.csr_matrix(A)
+    if not A.has_canonical_format:
+        A = A.copy()
+        A.sum_duplicates()
+    return A
+
+
+def _update_array(h, arr):
+    arr = np.ascontiguousarray(arr)
+    h.update(("%s%r" % (arr.dtype.str, arr.shape)).encode())
+    h.update(memoryview(arr).cast("B"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m cidre cache", description="Inspect and prune the cache"
+    )
+    parser.add_argument("command", choices=["info", "prune"])
+    parser.add_argument(
+        "--dir", default=os.environ.get(CACHE_DIR_ENV), help="Cache directory"
+    )
+    parser.add_argument(
+        "--max-size",
+        default=os.environ.get(MAX_BYTES_ENV),
+        help="Size limit for prune, e.g., 500M or 20G (Default %s)" % MAX_BYTES_ENV,
+    )
+    args = parser.parse_args(argv)
+    if args.dir is None:
+        parser.error("Specify --dir or set %s" % CACHE_DIR_ENV)
+    if args.command == "prune" and not args.max_size:
+        parser.error("Specify --max-size or set %s" % MAX_BYTES_ENV)
+
+    cache = ArtifactCache(args.dir)
+    if args.command == "info":
+        entries = cache.entries()
+        by_namespace = {}
+        for key, size, _ in entries:
+            namespace = key.rsplit("-", 1)[0]
+            count, total = by_namespace.get(namespace, (0, 0))
+            by_namespace[namespace] = (count + 1, total + size)
+        print("cache directory: %s" % args.dir)
+        for namespace, (count, total) in sorted(by_namespace.items()):
+            print("%-24s %6d artifacts %10s" % (namespace, count, format_size(total)))
+        print(
+            "%-24s %6d artifacts %10s"
+            % ("total", len(entries), format_size(sum(e[1] for e in entries)))
+        )
+    elif args.command == "prune":
+        removed = cache.prune(parse_size(args.max_size))
+        print("removed %d artifacts" % len(removed))
@@ -3,10 +3,12 @@ from scipy import sparse
 import pandas as pd
 import networkx as nx
 from cidre import utils
+from cidre import kernels
+from cidre import cache as artifact_cache
 
 
 def detect(
-    A, threshold, is_excessive, min_group_edge_num=0,
+    A, threshold, is_excessive, min_group_edge_num=0, cache=None,
 ):
     """
     CIDRE algorithm 
@@ -25,6 +27,10 @@ def detect(
         The minimum number of edges that the detected group has. 
         If the algoirthm finds a group of nodes that contain less than or equal to min_edge_num, 
         the algorithm exlcudes the group from the list of detected groups.
+    cache : cidre.cache.ArtifactCache (Optional; Default None)
+        Cache for the detected groups. The groups are cached only if
+        is_excessive has the attribute cache_key, e.g., the function given by
+        filters.get_dcsbm_threshold_filter with a cache.
 
     Returns
     -------
@@ -37,26 +43,345 @@ def detect(
         - is_donor : True if the node is a donor. Otherwise False.
         - is_recipient : True if the node is a recipient. Otherwise False.
     """
+    filter_key = getattr(is_excessive, "cache_key", None)
+    if cache is None or filter_key is None:
+        return _detect(A, threshold, is_excessive, min_group_edge_num)
 
-    # Filter edges before grouping
+    key = cache.key("detect", A, threshold, min_group_edge_num, filter_key)
+    columns = artifact_cache.cached(
+        cache,
+        key,
+        lambda: {
+            k: v.values
+            for k, v in _detect(A, threshold, is_excessive, min_group_edge_num).items()
+        },
+    )
+    return pd.DataFrame({k: np.array(v) for k, v in columns.items()})
+
+
+def summarize(A, cartel_table, group_col="group_id", quantiles=(0.25, 0.5, 0.75)):
+    """
+    Statistics of the detected groups
+
+    Parameters
+    ----------
+    A : scipy sparse matrix or None
+        Adjacency matrix in which the groups are detected. If None, the
+        statistics of the edges are NaN.
+    cartel_table : pandas.DataFrame
+        Table given by detect
+    group_col : str (Optional; Default "group_id")
+        Column of the group IDs
+    quantiles : tuple (Optional; Default (0.25, 0.5, 0.75))
+        Quantiles of the donor and recipient scores
+
+    Returns
+    -------
+    stats : pandas.DataFrame
+        One row per group with the following columns:
+        - size : number of nodes
+        - num_donors, num_recipients : number of the donors and the recipients
+        - internal_weight, num_internal_edges : total weight and number of
+          the edges within the group, excluding self-loops
+        - in_weight, out_weight : total weight of the edges from and to the
+          nodes outside the group, excluding self-loops
+        - density : num_internal_edges / (size * (size - 1))
+        - reciprocity : fraction of the edges within the group whose
+          reverse edge is also in the group
+        - donor_score_q<q>, recipient_score_q<q> : quantiles of the scores,
+          e.g., donor_score_q50 for the median
+    """
+    gids, g = np.unique(cartel_table[group_col].values, return_inverse=True)
+    K = gids.size
+    stats = pd.DataFrame({group_col: gids, "size": np.bincount(g, minlength=K)})
+    for col, name in [("is_donor", "num_donors"), ("is_recipient", "num_recipients")]:
+        if col in cartel_table:
+            stats[name] = np.bincount(
+                g, weights=cartel_table[col].values, minlength=K
+            ).astype(int)
+
+    if A is None:
+        for name in [
+            "internal_weight",
+            "num_internal_edges",
+            "in_weight",
+            "out_weight",
+            "density",
+            "reciprocity",
+        ]:
+            stats[name] = np.nan
+    else:
+        # Label the end points of the edges with the groups
+        N = A.shape[0]
+        member = -np.ones(N, dtype=int)
+        member[cartel_table["node_id"].values] = g
+        src, trg, w = utils.find_non_self_loop_edges(A)
+        g_src, g_trg = member[src], member[trg]
+        internal = (g_src >= 0) & (g_src == g_trg)
+        outgoing = (g_src >= 0) & ~internal
+        incoming = (g_trg >= 0) & ~internal
+
+        num_internal_edges = np.bincount(g_src[internal], minlength=K)
+        stats["internal_weight"] = np.bincount(
+            g_src[internal], weights=w[internal], minlength=K
+        )
+        stats["num_internal_edges"] = num_internal_edges
+        stats["in_weight"] = np.bincount(g_trg[incoming], weights=w[incoming], minlength=K)
+        stats["out_weight"] = np.bincount(g_src[outgoing], weights=w[outgoing], minlength=K)
+
+        size = stats["size"].values
+        stats["density"] = num_internal_edges / np.maximum(size * (size - 1), 1)
+
+        # An internal edge is reciprocated if its reverse is also an internal edge
+        keys = np.sort(src[internal].astype(np.int64) * N + trg[internal])
+        reverse = trg[internal].astype(np.int64) * N + src[internal]
+        pos = np.minimum(np.searchsorted(keys, reverse), max(keys.size - 1, 0))
+        reciprocated = keys[pos] == reverse if keys.size > 0 else np.zeros(0, dtype=bool)
+        num_reciprocated = np.bincount(
+            g_src[internal], weights=reciprocated, minlength=K
+        )
+        stats["reciprocity"] = np.where(
+            num_internal_edges > 0,
+            num_reciprocated / np.maximum(num_internal_edges, 1),
+            np.nan,
+        )
+
+    for col in ["donor_score", "recipient_score"]:
+        if col not in cartel_table:
+            continue
+        grouped = pd.Series(cartel_table[col].values).groupby(g)
+        for q in quantiles:
+            stats["%s_q%d" % (col, round(100 * q))] = grouped.quantile(q).values
+    return stats
+
+
+def score_groups(A, groups, is_excessive=None, threshold=None):
+    """
+    Donor and recipient scores of the members of given groups
+
+    The scores are computed for each group as it is, without peeling,
+    which gives the scores of the groups not found by detect, e.g., the
+    journal groups suspended by Thomson Reuters.
+
+    Parameters
+    ----------
+    A : scipy sparse matrix
+        Adjacency matrix
+    groups : scipy sparse matrix
+        Membership matrix of shape (number of nodes, number of groups), where
+        groups[i, k] != 0 if node i belongs to group k. A node can belong to
+        more than one group.
+    is_excessive : filtering function (Optional; Default None)
+        Filter of the excessive edges as in detect. If None, all edges
+        except self-loops are counted.
+    threshold : float (Optional; Default None)
+        If given, the members with a donor (recipient) score larger than or
+        equal to the threshold are counted as donors (recipients).
+
+    Returns
+    -------
+    member_table : pandas.DataFrame
+        One row per member of a group with the columns node_id, group_id,
+        donor_score and recipient_score, and is_donor and is_recipient if
+        the threshold is given
+    group_table : pandas.DataFrame
+        One row per group with the columns group_id, size, internal_weight
+        (total weight of the excessive edges within the group), the mean
+        and the minimum of the donor and recipient scores, min_cartel_score
+        (the minimum over the members of the larger of the two scores; the
+        group is kept by the peeling at a threshold at most this value), and
+        num_donors and num_recipients if the threshold is given
+    """
+    if is_excessive is None:
+        src, dst, w = utils.find_non_self_loop_edges(A)
+        A_pruned = utils.construct_adjacency_matrix(src, dst, w, A.shape[0])
+    else:
+        A_pruned = _prune(A, is_excessive)
+
+    U = sparse.csr_matrix(groups, dtype=float)
+    U.data = np.ones_like(U.data)
+    U.eliminate_zeros()
+    indeg_zero_truncated = np.maximum(np.array(A.sum(axis=0)).ravel(), 1.0)
+    outdeg_zero_truncated = np.maximum(np.array(A.sum(axis=1)).ravel(), 1.0)
+
+    # Weight from each node to each group and from each group to each node
+    to_group = sparse.csr_matrix(A_pruned @ U)
+    from_group = sparse.csr_matrix(A_pruned.T @ U)
+
+    node_ids, group_ids = U.nonzero()
+    w_out = np.asarray(to_group[node_ids, group_ids]).ravel()
+    w_in = np.asarray(from_group[node_ids, group_ids]).ravel()
+    member_table = pd.DataFrame(
+        {
+            "node_id": node_ids,
+            "group_id": group_ids,
+            "donor_score": w_out / outdeg_zero_truncated[node_ids],
+            "recipient_score": w_in / indeg_zero_truncated[node_ids],
+        }
+    )
+    if threshold is not None:
+        member_table["is_donor"] = (member_table["donor_score"] >= threshold).astype(int)
+        member_table["is_recipient"] = (
+            member_table["recipient_score"] >= threshold
+        ).astype(int)
+
+    # Aggregate over the members
+    K = U.shape[1]
+    grouped = member_table.assign(
+        cartel_score=np.maximum(member_table["donor_score"], member_table["recipient_score"])
+    ).groupby("group_id")
+    group_table = pd.DataFrame({"group_id": np.arange(K)})
+    group_table["size"] = np.bincount(group_ids, minlength=K)
+    group_table["internal_weight"] = np.bincount(group_ids, weights=w_out, minlength=K)
+    aggregated = grouped.agg(
+        donor_score_mean=("donor_score", "mean"),
+        donor_score_min=("donor_score", "min"),
+        recipient_score_mean=("recipient_score", "mean"),
+        recipient_score_min=("recipient_score", "min"),
+        min_cartel_score=("cartel_score", "min"),
+    )
+    group_table = group_table.join(aggregated, on="group_id")
+    if threshold is not None:
+        for col, name in [("is_donor", "num_donors"), ("is_recipient", "num_recipients")]:
+            group_table[name] = np.bincount(
+                group_ids, weights=member_table[col].values, minlength=K
+            ).astype(int)
+    return member_table, group_table
+
+
+def critical_thresholds(A, is_excessive):
+    """
+    Donor and recipient ratios and critical thresholds of all nodes
+
+    The critical threshold of a node is the largest threshold at which the
+    node remains in the group U found by the peeling of detect, i.e., node
+    i is in U for a threshold t if and only if t <= critical_threshold[i].
+    All critical thresholds are found by one peeling, which removes the
+    nodes with the smallest score in U at each step while keeping track of
+    the largest score at which a node has been removed.
+
+    Parameters
+    ----------
+    A : scipy sparse matrix
+        Adjacency matrix
+    is_excessive : filtering function
+        Filter of the excessive edges as in detect
+
+    Returns
+    -------
+    donor_ratio : numpy.ndarray
+        Fraction of the citations given by each node through the
+        excessive edges, i.e., the donor score when U contains all nodes
+    recipient_ratio : numpy.ndarray
+        Fraction of the citations received by each node through the
+        excessive edges
+    critical_threshold : numpy.ndarray
+        Critical threshold of each node
+    """
+    return _critical_thresholds(A, _prune(A, is_excessive))
+
+
+def _critical_thresholds(A, A_pruned):
+    """
+    critical_thresholds for the network pruned by the filter
+    """
+    A_pruned = kernels.as_csr(A_pruned)
+    indeg_zero_truncated = np.maximum(kernels.col_sums(A), 1.0)
+    outdeg_zero_truncated = np.maximum(kernels.row_sums(A), 1.0)
+    w_out = kernels.row_sums(A_pruned)
+    w_in = kernels.col_sums(A_pruned)
+    donor_ratio = w_out / outdeg_zero_truncated
+    recipient_ratio = w_in / indeg_zero_truncated
+
+    # Only the nodes with excessive edges have a positive critical threshold
+    critical_threshold = np.zeros(A.shape[0])
+    nodes = np.where((w_out + w_in) > 0)[0]
+    if nodes.size == 0:
+        return donor_ratio, recipient_ratio, critical_threshold
+    A_sub = kernels.as_csr(A_pruned[nodes, :][:, nodes])
+    A_sub_T = kernels.transpose(A_sub)
+    outdeg = outdeg_zero_truncated[nodes]
+    indeg = indeg_zero_truncated[nodes]
+
+    w_out = kernels.row_sums(A_sub)
+    w_in = kernels.row_sums(A_sub_T)
+    in_U = np.ones(nodes.size, dtype=bool)
+    level = 0.0
+    while np.any(in_U):
+        score = np.maximum(w_out / outdeg, w_in / indeg)
+        level = max(level, np.min(score[in_U]))
+
+        # Remove the nodes with a score at most the current level
+        removed = np.where(in_U & (score <= level))[0]
+        critical_threshold[nodes[removed]] = level
+        in_U[removed] = False
+
+        # Citations to and from the removed nodes no longer count
+        is_removed = np.zeros(nodes.size)
+        is_removed[removed] = 1
+        w_out -= kernels.row_sums(A_sub, is_removed)
+        w_in -= kernels.row_sums(A_sub_T, is_removed)
+
+    return donor_ratio, recipient_ratio, critical_threshold
+
+
+def _detect(A, threshold, is_excessive, min_group_edge_num):
+    A_pruned = _prune(A, is_excessive)
+    U, donor_score, recipient_score = _peel(A, A_pruned, threshold)
+    return _extract_groups(
+        A, A_pruned, U, donor_score, recipient_score, threshold, min_group_edge_num
+    )
+
+
+def _prune(A, is_excessive):
+    """
+    Remove the self-loops and the edges that are not excessive
+    """
     src, dst, w = utils.find_non_self_loop_edges(A)
     excessive_edges = is_excessive(src, dst, w)
 
-    A_pruned = utils.construct_adjacency_matrix(
+    return utils.construct_adjacency_matrix(
         src[excessive_edges], dst[excessive_edges], w[excessive_edges], A.shape[0]
     )
 
-    # Find the group of nodes U with
-    # a donor score or a recipient score
-    # larger than or equal to the threshold
-    num_nodes = A.shape[0]
-    U = np.ones(num_nodes)
-    indeg_zero_truncated = np.maximum(np.array(A.sum(axis=0)).ravel(), 1.0)
-    outdeg_zero_truncated = np.maximum(np.array(A.sum(axis=1)).ravel(), 1.0)
+
+def _peel(A, A_pruned, threshold, U=None):
+    """
+    Find the group of nodes U with a donor score or a recipient score
+    larger than or equal to the threshold
+
+    The peeling starts from U if given, which must contain the group to
+    be found (see cidre.incremental). Otherwise, it starts from all nodes.
+
+    Returns
+    -------
+    U : numpy.ndarray
+        U[i] = 1 if node i is in U. Otherwise U[i] = 0.
+    donor_score : numpy.ndarray
+        Donor score of the nodes computed for U
+    recipient_score : numpy.ndarray
+        Recipient score of the nodes computed for U
+    """
+    indeg_zero_truncated = np.maximum(kernels.col_sums(A), 1.0)
+    outdeg_zero_truncated = np.maximum(kernels.row_sums(A), 1.0)
+    return _peel_pruned(A_pruned, indeg_zero_truncated, outdeg_zero_truncated, threshold, U)
+
+
+def _peel_pruned(A_pruned, indeg_zero_truncated, outdeg_zero_truncated, threshold, U=None):
+    """
+    _peel with the degrees of the nodes in the network given, e.g., by
+    cidre.outofcore for a network that does not fit in memory
+    """
+    num_nodes = A_pruned.shape[0]
+    U = np.ones(num_nodes) if U is None else np.asarray(U, dtype=float).copy()
+
+    # U @ A_pruned is computed as A_pruned.T @ U, row by row as A_pruned @ U
+    A_pruned = kernels.as_csr(A_pruned)
+    A_pruned_T = kernels.transpose(A_pruned)
     while True:
         # Compute the donor score, recipient score and cartel score
-        donor_score = np.multiply(U, (A_pruned @ U) / outdeg_zero_truncated)
-        recipient_score = np.multiply(U, (U @ A_pruned) / indeg_zero_truncated)
+        donor_score = np.multiply(U, kernels.matvec(A_pruned, U) / outdeg_zero_truncated)
+        recipient_score = np.multiply(U, kernels.matvec(A_pruned_T, U) / indeg_zero_truncated)
 
         # Drop the nodes with a cartel score < threshold
         drop_from_U = (U > 0) * (np.maximum(donor_score, recipient_score) < threshold)
@@ -68,6 +393,16 @@ def detect(
         # Otherwise, drop the nodes from the cartel
         U[drop_from_U] = 0
 
+    return U, donor_score, recipient_score
+
+
+def _extract_groups(
+    A, A_pruned, U, donor_score, recipient_score, threshold, min_group_edge_num
+):
+    """
+    Partition U into the disjoint groups and pack them into a table
+    """
+
     # Find the nodes in U
     nodes_in_U = np.where(U)[0]
 
@@ -99,5 +434,19 @@ def detect(
             }
         )
         df_Ul_list += [df_Ul]
+
+    # No group is found
+    if len(df_Ul_list) == 0:
+        empty = np.zeros(0, dtype=int)
+        return pd.DataFrame(
+            {
+                "node_id": empty,
+                "group_id": empty,
+                "recipient_score": np.zeros(0),
+                "donor_score": np.zeros(0),
+                "is_recipient": empty,
+                "is_donor": empty,
+            }
+        )
     df_U = pd.concat(df_Ul_list, ignore_index=True)
     return df_U
@@ -0,0 +1,238 @@
+"""
+Community detection built on numpy and scipy
+
+A Louvain-style maximization of the degree-corrected modularity, where the
+local moves of all nodes are computed at once with sparse matrix products.
+It is a light-weight alternative to the blockmodel inference with
+graph-tool for producing the community_ids of the dcSBM filter.
+"""
+import numpy as np
+from scipy import sparse
+
+
+def louvain(
+    A,
+    resolution=1.0,
+    init=None,
+    max_levels=10,
+    max_sweeps=50,
+    move_prob=0.5,
+    rng=None,
+):
+    """
+    Detect communities by the Louvain method with synchronous local moves
+
+    In each sweep, every node finds the community of its neighbours that
+    increases the modularity most, and a random fraction move_prob of
+    the nodes that can increase the modularity moves at once. A sweep that
+    decreases the modularity is undone and retried with half the fraction.
+    The communities are then merged into nodes and the procedure is repeated
+    on the aggregated network.
+
+    Parameters
+    ----------
+    A : scipy sparse matrix
+        Adjacency matrix. The direction of the edges is ignored.
+    resolution : float (Optional; Default 1.0)
+        Resolution parameter. Larger values yield smaller communities.
+    init : numpy.ndarray (Optional; Default None)
+        Initial community of each node. If None, each node starts in its own community.
+    max_levels : int (Optional; Default 10)
+        Maximum number of aggregations
+    max_sweeps : int (Optional; Default 50)
+        Maximum number of sweeps of the local moves at each level
+    move_prob : float (Optional; Default 0.5)
+        Fraction of the improvable nodes moved in a sweep
+    rng : numpy.random.Generator, int or None (Optional; Default None)
+        Random number generator or its seed
+
+    Returns
+    -------
+    community_ids : numpy.ndarray
+        community_ids[i] is the ID of the community of node i. The IDs are
+        contiguous integers starting from 0.
+    """
+    rng = np.random.default_rng(rng)
+    W = sparse.csr_matrix(A, dtype=float)
+    W = sparse.csr_matrix(W + W.T)
+    N = W.shape[0]
+    if N == 0:
+        return np.zeros(0, dtype=int)
+
+    if init is None:
+        labels = np.arange(N)
+    else:
+        _, labels = np.unique(np.asarray(init), return_inverse=True)
+
+    community_ids = np.arange(N)
+    for _ in range(max_levels):
+        labels = _local_moves(W, labels, resolution, max_sweeps, move_prob, rng)
+        community_ids = labels[community_ids]
+
+        # Stop if no node is merged
+        if labels.max() + 1 == W.shape[0]:
+            break
+
+        W = _aggregate(W, labels)
+        labels = np.arange(W.shape[0])
+
+    _, community_ids = np.unique(community_ids, return_inverse=True)
+    return community_ids
+
+
+def modularity(A, community_ids, resolution=1.0):
+    """
+    Modularity of the communities in the network
+
+    Parameters
+    ----------
+    A : scipy sparse matrix
+        Adjacency matrix. The direction of the edges is ignored.
+    community_ids : numpy.ndarray
+        community_ids[i] is the ID of the community of node i
+    resolution : float (Optional; Default 1.0)
+        Resolution parameter
+
+    Returns
+    -------
+    q : float
+        Modularity
+    """
+    W = sparse.csr_matrix(A, dtype=float)
+    W = sparse.csr_matrix(W + W.T)
+    _, labels = np.unique(np.asarray(community_ids), return_inverse=True)
+    deg = np.array(W.sum(axis=1)).reshape(-1)
+    return _modularity(W.tocoo(), deg, labels, deg.sum(), resolution)
+
+
+def compare_partitions(community_ids_a, community_ids_b):
+    """
+    Agreement between two partitions of the same nodes
+
+    Parameters
+    ----------
+    community_ids_a : numpy.ndarray
+        community_ids_a[i] is the ID of the community of node i in the first partition
+    community_ids_b : numpy.ndarray
+        Same as community_ids_a for the second partition
+
+    Returns
+    -------
+    scores : dict
+        - nmi : Normalized mutual information (arithmetic normalization)
+        - ari : Adjusted Rand index
+    """
+    _, a = np.unique(np.asarray(community_ids_a), return_inverse=True)
+    _, b = np.unique(np.asarray(community_ids_b), return_inverse=True)
+    n = a.size
+    if n == 0:
+        return {"nmi": 1.0, "ari": 1.0}
+
+    # Contingency table
+    C = sparse.csr_matrix((np.ones(n), (a, b)), shape=(a.max() + 1, b.max() + 1))
+    C.sum_duplicates()
+    n_ab = C.data
+    n_a = np.bincount(a).astype(float)
+    n_b = np.bincount(b).astype(float)
+
+    # Normalized mutual information
+    h_a = -np.sum(n_a / n * np.log(n_a / n))
+    h_b = -np.sum(n_b / n * np.log(n_b / n))
+    r, c = C.nonzero()
+    mi = np.sum(n_ab / n * np.log(n * n_ab / (n_a[r] * n_b[c])))
+    nmi = 1.0 if h_a + h_b == 0 else 2 * mi / (h_a + h_b)
+
+    # Adjusted Rand index
+    def pairs(x):
+        return np.sum(x * (x - 1) / 2)
+
+    index = pairs(n_ab)
+    expected = pairs(n_a) * pairs(n_b) / max(n * (n - 1) / 2, 1)
+    max_index = (pairs(n_a) + pairs(n_b)) / 2
+    ari = 1.0 if max_index == expected else (index - expected) / (max_index - expected)
+    return {"nmi": float(nmi), "ari": float(ari)}
+
+
+def _local_moves(W, labels, resolution, max_sweeps, move_prob, rng):
+    """
+    Move the nodes between the communities to increase the modularity
+
+    Returns
+    -------
+    labels : numpy.ndarray
+        Community of each node, relabeled to contiguous integers
+    """
+    N = W.shape[0]
+    deg = np.array(W.sum(axis=1)).reshape(-1)
+    two_m = deg.sum()
+    if two_m == 0:
+        return np.unique(labels, return_inverse=True)[1]
+
+    # Self-loops do not change by the moves
+    W_out = W - sparse.diags(W.diagonal())
+    W_out.eliminate_zeros()
+
+    W_coo = W.tocoo()
+    q = _modularity(W_coo, deg, labels, two_m, resolution)
+    prob = move_prob
+    for _ in range(max_sweeps):
+        _, labels = np.unique(labels, return_inverse=True)
+        K = np.bincount(labels, weights=deg)
+
+        # Weight of the edges from each node to each community
+        C = sparse.csr_matrix(
+            (np.ones(N), (np.arange(N), labels)), shape=(N, K.size)
+        )
+        M = (W_out @ C).tocoo()
+        i, c, w = M.row, M.col, M.data
+        is_own = c == labels[i]
+
+        # Modularity gain of placing node i in community c, up to a constant
+        score = w - resolution * deg[i] * (K[c] - deg[i] * is_own) / two_m
+        own_score = -resolution * deg * (K[labels] - deg) / two_m
+        own_score[i[is_own]] = score[is_own]
+
+        # Best community for each node
+        order = np.lexsort((-score, i))
+        first = order[np.r_[True, i[order][1:] != i[order][:-1]]]
+        nodes, best, best_score = i[first], c[first], score[first]
+        improvable = best_score > own_score[nodes] + 1e-12 * two_m
+        nodes, best = nodes[improvable], best[improvable]
+        if nodes.size == 0:
+            break
+
+        # Move a random subset of the nodes at once
+        while True:
+            s = rng.random(nodes.size) < prob
+            new_labels = labels.copy()
+            new_labels[nodes[s]] = best[s]
+            new_q = _modularity(W_coo, deg, new_labels, two_m, resolution)
+            if new_q > q or prob < 1e-3:
+                break
+            prob /= 2
+        if new_q <= q:
+            break
+        labels, q = new_labels, new_q
+        prob = move_prob
+
+    return np.unique(labels, return_inverse=True)[1]
+
+
+def _aggregate(W, labels):
+    """
+    Network between the communities, where the self-loops are the weights within the communities
+    """
+    N = W.shape[0]
+    C = sparse.csr_matrix(
+        (np.ones(N), (np.arange(N), labels)), shape=(N, labels.max() + 1)
+    )
+    return sparse.csr_matrix(C.T @ W @ C)
+
+
+def _modularity(W, deg, labels, two_m, resolution):
+    """
+    Modularity for the adjacency matrix W in the coo format
+    """
+    internal = W.data[labels[W.row] == labels[W.col]].sum()
+    K = np.bincount(labels, weights=deg)
+    return internal / two_m - resolution * np.sum(K ** 2) / two_m ** 2
@@ -4,6 +4,8 @@ from scipy import sparse
 import seaborn as sns
 import matplotlib.pyplot as plt
 from matplotlib import patches
+from matplotlib.collections import PatchCollection, PathCollection
+from matplotlib.path import Path
 import matplotlib.colors as colors
 import textwrap
 import re
@@ -18,13 +20,18 @@ class DrawCartel:
         self.radius = 2
         self.label_node_margin = 0.35
         self.group_arc_node_margin = 0.1
-        self.edge_norm = lambda x: np.power(x, 1 / 2)
+        self.edge_norm = np.sqrt
         self.max_edge_width = 15
         self.font_size = 15 
         self.node_size = 0.25
         self.label_width = 15
         self.max_label_width = 35
         self.group_order = {"source": 0, "target": 1, "reciprocal": 2, "other": 3}
+        self.batch_rendering = False
+        self.edge_curvature = 0.2
+        self.edge_shrink = 2
+        self.edge_head_length = 0.5
+        self.edge_resolution = 24
 
     def draw(
         self,
@@ -36,6 +43,8 @@ class DrawCartel:
         node_names,
         cmap=None,
         ax=None,
+        context_ids=None,
+        context_names=None,
     ):
         """
         Draw citation networks within a citation cartel
@@ -62,11 +71,56 @@ class DrawCartel:
         cmap : matplotlib color map or list 
             Color map or List of strings indicating hex code
         ax : axis
+        context_ids : np.array or list (Optional; Default None)
+            The node ids of the nodes outside the cartel to draw
+            next to the 'Other' node, e.g., those given by find_context_nodes
+        context_names : list (Optional; Default None)
+            Names of the context nodes. If not given, the node ids are used.
         
         Return 
         ------
         ax : axis
         """
+        layout = self.layout(
+            A,
+            node_ids,
+            donor_score,
+            recipient_score,
+            theta,
+            node_names,
+            context_ids=context_ids,
+            context_names=context_names,
+        )
+        return self.render(layout, cmap=cmap, ax=ax)
+
+    def layout(
+        self,
+        A,
+        node_ids,
+        donor_score,
+        recipient_score,
+        theta,
+        node_names,
+        context_ids=None,
+        context_names=None,
+        As=None,
+    ):
+        """
+        Compute the geometry of the drawing of a citation cartel
+
+        The parameters are the same as those for draw, except for As,
+        the subgraph given by extract_subgraph for the cartel and the context
+        nodes, which is computed from A if not given.
+        The geometry depends on radius, angle_margin, label_width,
+        max_label_width and edge_norm but not on the other style
+        parameters (e.g., colors, font and node sizes), so that
+        the layout can be reused after changing the style.
+
+        Return
+        ------
+        layout : dict
+            Input for render
+        """
 
         #
         # Input formatting
@@ -87,16 +141,22 @@ class DrawCartel:
         else:
             self.theta_1 = np.pi * 0.7
 
+        # Add the context nodes to the 'Other' group
+        node_names = list(node_names)
+        if context_ids is not None:
+            context_ids = np.array(context_ids, dtype=node_ids.dtype)
+            if context_names is None:
+                context_names = [str(x) for x in context_ids]
+            node_ids = np.concatenate([node_ids, context_ids])
+            node_types += ["other"] * context_ids.size
+            node_names += list(context_names)
+
         #
         # Construct the adjacency matrix with 'Other' node
         #
-        brow = A[:, node_ids].sum(axis=0)
-        bcol = A[node_ids, :].sum(axis=1)
-        As = A[:, node_ids][node_ids, :].toarray()
-
-        # Add 'Other' node to the adjacency matrix
-        As = np.block([[As, bcol], [brow, np.array([0])]])
-        As = np.array(As)
+        if As is None:
+            As = self.extract_subgraph(A, node_ids)
+        indeg = As[-1, :-1].toarray().reshape(-1)
         node_types += ["other"]
         node_names += ["Other"]
 
@@ -122,17 +182,62 @@ class DrawCartel:
         # Compute the edge positions based on the nodes
         edge_table = self.make_edge_table(node_table, As)
 
+        return {
+            "node_table": node_table,
+            "edge_table": edge_table,
+            "As": As,
+            "indeg": indeg,
+            "angles": self.angles,
+            "theta_1": self.theta_1,
+        }
+
+    def render(self, layout, cmap=None, ax=None):
+        """
+        Draw a citation cartel from its layout
+
+        Parameters
+        ----------
+        layout : dict
+            Geometry computed by layout
+        cmap : matplotlib color map or list 
+            Color map or List of strings indicating hex code
+        ax : axis
+
+        Return 
+        ------
+        ax : axis
+        """
+        node_table = layout["node_table"]
+        edge_table = layout["edge_table"]
+        As = layout["As"]
+        indeg = layout["indeg"]
+        self.angles = layout["angles"]
+        self.theta_1 = layout["theta_1"]
+
         # make color map
         self.make_color_map(node_table, cmap)
 
         #
         # Plot
         #
-        self.plot_edges(node_table, edge_table, ax)
+        if self.batch_rendering:
+            # Fix the scale of the axis first since the widths of
+            # the edges are given in points
+            self.trim(ax)
+            ax.set_aspect("equal")
+            ax.apply_aspect()
+
+            self.plot_edges_batch(node_table, edge_table, ax)
+
+            self.plot_node_label(node_table, ax)
+
+            self.plot_nodes_batch(node_table, As, indeg, ax)
+        else:
+            self.plot_edges(node_table, edge_table, ax)
 
-        self.plot_node_label(node_table, ax)
+            self.plot_node_label(node_table, ax)
 
-        self.plot_nodes(node_table, A, As, node_ids, ax)
+            self.plot_nodes(node_table, As, indeg, ax)
 
         self.plot_group_arc(node_table, ax)
 
@@ -140,6 +245,61 @@ class DrawCartel:
 
         return ax
 
+    def extract_subgraph(self, A, node_ids):
+        """
+        Adjacency matrix among the given nodes with the 'Other' node
+
+        Parameters
+        ----------
+        A : scipy.sparse matrix
+            The adjacency matrix for the network with all nodes
+        node_ids : np.array
+            The node ids of the nodes to draw
+
+        Return
+        ------
+        As : scipy.sparse.csr_matrix
+            Adjacency matrix of size len(node_ids) + 1, where the last row and
+            column give the total number of citations that each node receives
+            and provides, respectively.
+        """
+        A = sparse.csr_matrix(A)
+        brow = np.array(A[:, node_ids].sum(axis=0)).reshape((1, -1))
+        bcol = np.array(A[node_ids, :].sum(axis=1)).reshape((-1, 1))
+        As = A[node_ids, :][:, node_ids]
+        return sparse.bmat(
+            [[As, sparse.csr_matrix(bcol)], [sparse.csr_matrix(brow), None]],
+            format="csr",
+        )
+
+    def find_context_nodes(self, A, node_ids, num_nodes):
+        """
+        Nodes outside the cartel that exchange the most citations with it
+
+        Parameters
+        ----------
+        A : scipy.sparse matrix
+            The adjacency matrix for the network with all nodes
+        node_ids : np.array or list
+            The node ids of the nodes in the cartel
+        num_nodes : int
+            Maximum number of context nodes
+
+        Return
+        ------
+        context_ids : np.array
+            Node ids of the context nodes in descending order of the
+            number of citations exchanged with the cartel
+        """
+        A = sparse.csr_matrix(A)
+        node_ids = np.array(node_ids)
+        w = np.array(A[node_ids, :].sum(axis=0)).reshape(-1)
+        w += np.array(A[:, node_ids].sum(axis=1)).reshape(-1)
+        w[node_ids] = 0
+        candidates = np.nonzero(w)[0]
+        order = np.argsort(-w[candidates], kind="stable")[:num_nodes]
+        return candidates[order]
+
     def classify_nodes(self, donor_score, recipient_score, threshold):
         is_recipient = recipient_score >= threshold
         is_donor = donor_score >= threshold
@@ -213,11 +373,10 @@ class DrawCartel:
 
     def make_edge_table(self, node_table, As):
 
-        # Compute the edge table
-        src, trg = np.where(As)
+        # Compute the edge table from the non-zero entries
+        src, trg, w = sparse.find(As)
         selfloop = src != trg
-        src, trg = src[selfloop], trg[selfloop]
-        w = As[(src, trg)]
+        src, trg, w = src[selfloop], trg[selfloop], w[selfloop]
         edge_table = pd.DataFrame({"src": src, "trg": trg, "w": w})
 
         edges = edge_table.copy()
@@ -237,14 +396,10 @@ class DrawCartel:
         ).rename(columns={"x": "trg_x", "y": "trg_y"})
 
         # Normalize the maximum to be one
-        wmax = np.maximum(
-            np.max(np.triu(As[:, :-1][:-1, :], 1)),
-            np.max(np.tril(As[:, :-1][:-1, :], 1)),
-        )
+        wmax = sparse.csr_matrix(As)[:-1, :-1].max()
         edges["w"] = edges["w"] / wmax
         edges["w"] = self.edge_norm(edges["w"])
         edges["w"] = edges["w"] / edges["w"].max()
-        n = As.shape[0] - 1
         return edges
 
     def make_color_map(self, node_table, cmap):
@@ -338,6 +493,135 @@ class DrawCartel:
 
             ax.add_patch(a3)
 
+    def plot_edges_batch(self, node_table, edge_table, ax):
+        """
+        Draw all edges as one PathCollection.
+
+        The curved arrows drawn by plot_edges are computed for all edges at
+        once and added to the axis as a single artist.
+        """
+        _edges = edge_table[edge_table.src != edge_table.trg]
+        _edges = _edges.sort_values(by=["src", "trg"], ascending=False)
+        if _edges.shape[0] == 0:
+            return
+
+        # Number of points in a unit of the data coordinate
+        pixels = ax.transData.transform([[0, 0], [1, 0]])
+        pt_per_unit = (pixels[1, 0] - pixels[0, 0]) * 72.0 / ax.figure.dpi
+
+        w = _edges["w"].values * self.max_edge_width / pt_per_unit
+        paths = self.calc_edge_paths(
+            _edges[["src_x", "src_y"]].values,
+            _edges[["trg_x", "trg_y"]].values,
+            tail_width=w,
+            head_width=2 * w,
+            head_length=self.edge_head_length / pt_per_unit,
+            shrink=self.edge_shrink / pt_per_unit,
+        )
+
+        is_other = node_table.set_index("id").loc[_edges.src.values, "group"].values == "other"
+        edge_colors = [
+            self.node2color[int(src)] + ("66" if other else "cc")
+            for src, other in zip(_edges.src.values, is_other)
+        ]
+        ax.add_collection(
+            PathCollection(paths, facecolors=edge_colors, linewidths=0), autolim=False
+        )
+
+    def calc_edge_paths(
+        self, src_pos, trg_pos, tail_width, head_width, head_length, shrink
+    ):
+        """
+        Outline of the curved arrows from src_pos to trg_pos
+
+        The edges follow the quadratic Bezier curve of the "arc3" connection
+        style. As in the "Simple" arrow style, each outline consists of a tail
+        of width tail_width, bounded by two quadratic Bezier curves, followed
+        by a head of length head_length.
+
+        Parameters
+        ----------
+        src_pos : numpy.ndarray (num_edges, 2)
+            Position of the source nodes
+        trg_pos : numpy.ndarray (num_edges, 2)
+            Position of the target nodes
+        tail_width : numpy.ndarray (num_edges,)
+            Width of the tail
+        head_width : numpy.ndarray (num_edges,)
+            Width of the head at its base
+        head_length : float
+            Length of the head
+        shrink : float
+            Length cut off from both ends of the curve
+
+        Return
+        ------
+        paths : list of matplotlib.path.Path
+            Outlines of the edges
+        """
+        p0, p2 = src_pos, trg_pos
+        d = p2 - p0
+        p1 = 0.5 * (p0 + p2) + self.edge_curvature * np.stack([d[:, 1], -d[:, 0]], axis=1)
+
+        def bezier(t):
+            t = t[:, None]
+            return (1 - t) ** 2 * p0 + 2 * (1 - t) * t * p1 + t ** 2 * p2
+
+        def tangent(t):
+            t = t[:, None]
+            return 2 * (1 - t) * (p1 - p0) + 2 * t * (p2 - p1)
+
+        def normal(t):
+            v = tangent(t)
+            v = v / np.maximum(np.linalg.norm(v, axis=1, keepdims=True), 1e-12)
+            return np.stack([-v[:, 1], v[:, 0]], axis=1)
+
+        # Parameters of the curve where the tail starts, the head starts and
+        # the head ends, converted from the arc length
+        t = np.linspace(0, 1, self.edge_resolution)
+        pts = np.stack([bezier(np.full(p0.shape[0], ti)) for ti in t], axis=1)
+        length = np.sum(np.linalg.norm(np.diff(pts, axis=1), axis=2), axis=1)
+        length = np.maximum(length, 1e-12)
+        t_start = np.minimum(shrink / length, 0.5)
+        t_end = np.maximum(1 - shrink / length, t_start)
+        t_head = np.maximum(t_end - head_length / length, t_start)
+
+        # Control points of the tail, i.e., the segment of the
+        # curve between t_start and t_head
+        q0 = bezier(t_start)
+        q2 = bezier(t_head)
+        q1 = q0 + 0.5 * (t_head - t_start)[:, None] * tangent(t_start)
+
+        # Curves parallel to the tail. The control point is the
+        # intersection of the tangent lines at the shifted end points
+        def parallel(h):
+            a = q0 + normal(t_start) * h[:, None]
+            b = q2 + normal(t_head) * h[:, None]
+            da, db = q1 - q0, q2 - q1
+            cross = da[:, 0] * db[:, 1] - da[:, 1] * db[:, 0]
+            straight = np.abs(cross) < 1e-12
+            s = ((b - a)[:, 0] * db[:, 1] - (b - a)[:, 1] * db[:, 0]) / np.where(
+                straight, 1, cross
+            )
+            c = a + s[:, None] * da
+            c[straight] = 0.5 * (a + b)[straight]
+            return a, c, b
+
+        r0, r1, r2 = parallel(-tail_width / 2)
+        l0, l1, l2 = parallel(tail_width / 2)
+
+        # Head
+        head_offset = normal(t_head) * head_width[:, None] / 2
+        tip = bezier(t_end)
+
+        verts = np.stack(
+            [r0, r1, r2, q2 - head_offset, tip, q2 + head_offset, l2, l1, l0, r0],
+            axis=1,
+        )
+        codes = [Path.MOVETO, Path.CURVE3, Path.CURVE3] + [Path.LINETO] * 4
+        codes += [Path.CURVE3, Path.CURVE3, Path.CLOSEPOLY]
+        return [Path(v, codes) for v in verts]
+
     def plot_node_label(self, node_table, ax):
         reciprocal_num = np.sum(node_table["group"].values == "reciprocal")
 
@@ -403,11 +687,11 @@ class DrawCartel:
         ax.set_ylim(bottom=-R, top=R)
         ax.axis("off")
 
-    def plot_nodes(self, node_table, A, As, node_ids, ax):
+    def plot_nodes(self, node_table, As, indeg, ax):
 
         # Calculate the angle of pie
-        indeg = np.array(A[:, node_ids].sum(axis=0)).reshape(-1)
-        share = As[:-1, :-1] @ np.diag(1.0 / np.maximum(1, indeg))
+        share = sparse.csc_matrix(As)[:-1, :-1] @ sparse.diags(1.0 / np.maximum(1, indeg))
+        share = sparse.csc_matrix(share)
 
         for i, row in node_table.iterrows():
             if row["group"] == "other":
@@ -420,13 +704,14 @@ class DrawCartel:
                     wedgeprops={"edgecolor": self.node2color[i], "linewidth": 3},
                 )
             else:
-                order = np.argsort(share[:, i])
+                share_i = share[:, i].toarray().reshape(-1)
+                order = np.argsort(share_i)
 
                 node_color_list = [self.node2color[j] for j in order]
 
                 ax.pie(
-                    [1 - np.sum(share[:, i])]
-                    + np.array(share[order, i]).reshape(-1).tolist(),
+                    [1 - np.sum(share_i)]
+                    + share_i[order].tolist(),
                     startangle=90,
                     colors=["#ffffffff"] + node_color_list,
                     center=(row["x"], row["y"]),
@@ -442,6 +727,55 @@ class DrawCartel:
                 )
                 ax.add_patch(c)
 
+    def plot_nodes_batch(self, node_table, As, indeg, ax):
+        """
+        Draw all nodes as two PatchCollections, one for the pie
+        wedges and one for the outlines.
+        """
+
+        # Calculate the angle of pie
+        share = sparse.csc_matrix(As)[:-1, :-1] @ sparse.diags(1.0 / np.maximum(1, indeg))
+        share = sparse.csc_matrix(share)
+
+        wedges, wedge_colors = [], []
+        circles, circle_colors = [], []
+        for i, group, x, y in zip(
+            node_table["id"].values,
+            node_table["group"].values,
+            node_table["x"].values,
+            node_table["y"].values,
+        ):
+            if group == "other":
+                wedges += [patches.Circle((x, y), self.node_size)]
+                wedge_colors += [self.node2color[i]]
+                circles += [patches.Circle((x, y), self.node_size)]
+                circle_colors += [self.node2color[i]]
+                continue
+
+            # Same wedges as ax.pie with startangle=90, except the empty ones
+            share_i = share[:, i].toarray().reshape(-1)
+            order = np.argsort(share_i)
+            fracs = np.concatenate([[1 - np.sum(share_i)], share_i[order]])
+            fracs = fracs / max(np.sum(fracs), 1.0)
+            theta = 90 + 360 * np.concatenate([[0], np.cumsum(fracs)])
+            pie_colors = ["#ffffffff"] + [self.node2color[j] for j in order]
+            for k in np.nonzero(fracs > 0)[0]:
+                wedges += [patches.Wedge((x, y), self.node_size, theta[k], theta[k + 1])]
+                wedge_colors += [pie_colors[k]]
+            circles += [patches.Circle((x, y), self.node_size)]
+            circle_colors += [self.node2color[i]]
+
+        ax.add_collection(
+            PatchCollection(wedges, facecolors=wedge_colors, linewidths=0),
+            autolim=False,
+        )
+        ax.add_collection(
+            PatchCollection(
+                circles, facecolors="none", edgecolors=circle_colors, linewidths=3
+            ),
+            autolim=False,
+        )
+
     def fold_node_name(self, node_table):
         for g, dg in node_table.groupby("group"):
             if dg.shape[0] < 8:
@@ -4,11 +4,13 @@ import sys
 import pandas as pd
 import networkx as nx
 from cidre import utils
+from cidre import kernels
+from cidre import cache as artifact_cache
 from functools import partial
 
 
 def get_dcsbm_threshold_filter(
-    A, A_ref, community_ids, ref_frac_weight=1.0, alpha=0.01
+    A, A_ref, community_ids, ref_frac_weight=1.0, alpha=0.01, cache=None
 ):
     """
     Filtering function used in the original CIDRE algorithm.
@@ -28,6 +30,9 @@ def get_dcsbm_threshold_filter(
     ref_frac_weight : float
     alpha : float
         Significance level for the statistical test based on the stochastic block model
+    cache : cidre.cache.ArtifactCache (Optional; Default None)
+        Cache for the significant edges. The returned function has an
+        attribute cache_key, with which cidre.detect caches the detected groups.
 
     Returns
     -------
@@ -35,16 +40,20 @@ def get_dcsbm_threshold_filter(
         Filtering function 
     """
 
-    dcsbm_filter = get_dcSBM_filter(A, community_ids, alpha)
+    dcsbm_filter = get_dcSBM_filter(A, community_ids, alpha, cache=cache)
     threshold_filter = get_threshold_filter(A_ref, ref_frac_weight)
 
     def cidre_filter(src, trg, w):
         return dcsbm_filter(src, trg, w) * threshold_filter(src, trg, w)
 
+    if cache is not None:
+        cidre_filter.cache_key = cache.key(
+            "dcsbm_threshold_filter", dcsbm_filter.cache_key, A_ref, ref_frac_weight
+        )
     return cidre_filter
 
 
-def get_dcSBM_filter(A, community_ids, alpha):
+def get_dcSBM_filter(A, community_ids, alpha, cache=None):
     """
     Filtering edges based on the dcSBM
 
@@ -57,6 +66,8 @@ def get_dcSBM_filter(A, community_ids, alpha):
         the names of nodes and IDs of groups to which the nodes belong.
     alpha : float 
         Significance level for the statistical test based on the stochastic block model
+    cache : cidre.cache.ArtifactCache (Optional; Default None)
+        Cache for the significant edges
 
     Returns
     -------
@@ -65,9 +76,18 @@ def get_dcSBM_filter(A, community_ids, alpha):
     """
 
     # Find the edges whose weights are larger than that expected for the null model
-    src, trg, weight = find_significant_edges_dcSBM(A, community_ids, alpha)
+    def compute():
+        src, trg, weight = find_significant_edges_dcSBM(A, community_ids, alpha)
+        return {"src": src, "trg": trg}
 
-    return make_filter_func(src, trg, None, A.shape[0])
+    key = None
+    if cache is not None:
+        key = cache.key("dcsbm_filter", A, np.asarray(community_ids), alpha)
+    edges = artifact_cache.cached(cache, key, compute)
+
+    dcSBM_filter = make_filter_func(edges["src"], edges["trg"], None, A.shape[0])
+    dcSBM_filter.cache_key = key
+    return dcSBM_filter
 
 
 def get_threshold_filter(A, frac_weight=0.5):
@@ -168,28 +188,56 @@ def calc_p_values_dcsbm(A, community_ids):
     ---
     """
 
-    N = A.shape[0]
-    indeg = np.array(A.sum(axis=0)).reshape(-1)
-    outdeg = np.array(A.sum(axis=1)).reshape(-1)
+    indeg = kernels.col_sums(A)
+    outdeg = kernels.row_sums(A)
     C_SBM = utils.to_community_matrix(community_ids)
-
     Lambda = C_SBM.T @ A @ C_SBM
+
+    src, dst, w = utils.find_non_self_loop_edges(A)
+    pvals = calc_edge_p_values_dcsbm(src, dst, w, community_ids, indeg, outdeg, Lambda)
+
+    return pvals, src, dst, w
+
+
+def calc_edge_p_values_dcsbm(src, dst, w, community_ids, indeg, outdeg, Lambda):
+    """
+    Calculate the p-values of the given edges using the degree-corrected
+    stochastic block model fitted to a network
+
+    Parameters
+    ----------
+    src : numpy.ndarray
+        Source nodes
+    dst : numpy.ndarray
+        Target nodes
+    w : numpy.ndarray
+        Weight of the edges
+    community_ids : numpy.ndarray
+        community_ids[i] indicates the ID of the group to which node i belongs
+    indeg : numpy.ndarray
+        In-degree (total weight of the incoming edges) of the nodes in the network
+    outdeg : numpy.ndarray
+        Out-degree of the nodes in the network
+    Lambda : scipy sparse matrix
+        Lambda[k, l] is the total weight of the edges from group k to group l
+
+    Returns
+    -------
+    p-value : p-values
+    """
     Din = np.array(Lambda.sum(axis=0)).reshape(-1)
     Dout = np.array(Lambda.sum(axis=1)).reshape(-1)
 
-    theta_in = indeg / np.maximum(C_SBM @ Din, 1.0)
-    theta_out = outdeg / np.maximum(C_SBM @ Dout, 1.0)
+    theta_in = indeg[dst] / np.maximum(Din[community_ids[dst]], 1.0)
+    theta_out = outdeg[src] / np.maximum(Dout[community_ids[src]], 1.0)
 
-    src, dst, w = utils.find_non_self_loop_edges(A)
     lam = (
-        np.array(Lambda[community_ids[src], community_ids[dst]]).reshape(-1)
-        * theta_out[src]
-        * theta_in[dst]
+        kernels.gather(Lambda, community_ids[src], community_ids[dst])
+        * theta_out
+        * theta_in
     )
     lam = np.maximum(lam, 1.0)
-    pvals = 1.0 - stats.poisson.cdf(w - 1, lam)
-
-    return pvals, src, dst, w
+    return 1.0 - stats.poisson.cdf(w - 1, lam)
 
 
 def benjamini_hochberg_test(pvals, alpha):
@@ -212,7 +260,8 @@ def benjamini_hochberg_test(pvals, alpha):
     """
     order = np.argsort(pvals)
     M = pvals.size
-    last_true_id = np.where(pvals[order] <= (alpha * np.arange(1, M + 1) / M))[0][-1]
+    passed = np.where(pvals[order] <= (alpha * np.arange(1, M + 1) / M))[0]
     is_sig = np.zeros(M)
-    is_sig[order[: (last_true_id + 1)]] = 1
+    if passed.size > 0:
+        is_sig[order[: (passed[-1] + 1)]] = 1
     return is_sig > 0
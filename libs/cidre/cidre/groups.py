@@ -0,0 +1,210 @@
+"""
+Comparison of groups of nodes
+
+The groups are represented by sparse membership matrices, where U[i, k] = 1
+if node i belongs to group k. The intersections between two collections of
+groups are computed by a sparse product and kept sparse, so that many
+groups can be compared at once.
+"""
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+def encode_ids(*ids):
+    """
+    Map the labels in one or more arrays to contiguous integers
+
+    Parameters
+    ----------
+    ids : numpy.ndarray
+        Arrays of labels
+
+    Returns
+    -------
+    labels : numpy.ndarray
+        Sorted unique labels. labels[codes[i]] = ids[i].
+    codes : list of numpy.ndarray
+        codes[k] is the integer ids for ids[k]
+    """
+    ids = [np.asarray(x) for x in ids]
+    labels, codes = np.unique(np.concatenate(ids), return_inverse=True)
+    return labels, np.split(codes, np.cumsum([x.size for x in ids])[:-1])
+
+
+def membership_matrix(node_ids, group_ids, num_nodes=None, num_groups=None):
+    """
+    Membership matrix
+
+    Parameters
+    ----------
+    node_ids : numpy.ndarray
+        Integer ids of the nodes
+    group_ids : numpy.ndarray
+        group_ids[i] is the integer id of the group to which node_ids[i] belongs
+    num_nodes : int (Optional; Default None)
+        Number of nodes. If None, max(node_ids) + 1.
+    num_groups : int (Optional; Default None)
+        Number of groups. If None, max(group_ids) + 1.
+
+    Returns
+    -------
+    U : scipy.sparse.csc_matrix
+        U[i, k] = 1 if node i belongs to group k. Otherwise U[i, k] = 0.
+    """
+    node_ids = np.asarray(node_ids)
+    group_ids = np.asarray(group_ids)
+    if num_nodes is None:
+        num_nodes = np.max(node_ids, initial=-1) + 1
+    if num_groups is None:
+        num_groups = np.max(group_ids, initial=-1) + 1
+    U = sparse.csc_matrix(
+        (np.ones(node_ids.size), (node_ids, group_ids)), shape=(num_nodes, num_groups)
+    )
+    # A node listed twice in a group is a member once
+    U.data = np.minimum(U.data, 1)
+    return U
+
+
+def intersection(U_a, U_b, min_intersection=1):
+    """
+    Number of nodes shared by the groups
+
+    Parameters
+    ----------
+    U_a : scipy sparse matrix
+        Membership matrix of the groups a (nodes x groups)
+    U_b : scipy sparse matrix
+        Membership matrix of the groups b with the same nodes as U_a
+    min_intersection : int (Optional; Default 1)
+        Intersections smaller than this are set to zero
+
+    Returns
+    -------
+    I : scipy.sparse.csr_matrix
+        I[k, l] is the number of nodes shared by group k in a and group l in b
+    """
+    I = sparse.csr_matrix(U_a.T @ U_b)
+    if min_intersection > 1:
+        I.data[I.data < min_intersection] = 0
+        I.eliminate_zeros()
+    return I
+
+
+def overlap(U_a, U_b, min_intersection=1):
+    """
+    Fraction of the members of each group in b shared with each group in a
+
+    Returns
+    -------
+    S : scipy.sparse.csr_matrix
+        S[k, l] = |a_k \\cap b_l| / |b_l|
+    """
+    S = intersection(U_a, U_b, min_intersection).astype(float)
+    sz_b = group_sizes(U_b)
+    S.data /= sz_b[S.indices]
+    return S
+
+
+def jaccard(U_a, U_b, min_intersection=1):
+    """
+    Jaccard index between the groups
+
+    Returns
+    -------
+    J : scipy.sparse.csr_matrix
+        J[k, l] = |a_k \\cap b_l| / |a_k \\cup b_l|
+    """
+    J = intersection(U_a, U_b, min_intersection).astype(float)
+    sz_a = group_sizes(U_a)
+    sz_b = group_sizes(U_b)
+    rows = np.repeat(np.arange(J.shape[0]), np.diff(J.indptr))
+    J.data /= sz_a[rows] + sz_b[J.indices] - J.data
+    return J
+
+
+def best_match(S):
+    """
+    Column with the largest score in each row
+
+    Parameters
+    ----------
+    S : scipy sparse matrix
+        Scores, e.g., given by overlap or jaccard
+
+    Returns
+    -------
+    best : numpy.ndarray
+        best[k] is the column of the largest score in row k, or -1 if the
+        row has no non-zero score. Ties go to the smallest column.
+    score : numpy.ndarray
+        score[k] is the largest score in row k, or 0 if the row has no
+        non-zero score
+    """
+    S = sparse.coo_matrix(S)
+    best = -np.ones(S.shape[0], dtype=int)
+    score = np.zeros(S.shape[0])
+    if S.nnz == 0:
+        return best, score
+    order = np.lexsort((S.col, -S.data, S.row))
+    row = S.row[order]
+    first = order[np.r_[True, row[1:] != row[:-1]]]
+    best[S.row[first]] = S.col[first]
+    score[S.row[first]] = S.data[first]
+    return best, score
+
+
+def group_sizes(U):
+    """
+    Number of members of each group
+    """
+    return np.array(U.sum(axis=0)).reshape(-1)
+
+
+def compare(table_a, table_b, node_id_col, group_id_col, min_intersection=1):
+    """
+    Compare two collections of groups given as tables
+
+    Parameters
+    ----------
+    table_a : pandas.DataFrame
+        Table with one row per member of a group
+    table_b : pandas.DataFrame
+        Same as table_a
+    node_id_col : str
+        Column of the node labels
+    group_id_col : str
+        Column of the group labels
+    min_intersection : int (Optional; Default 1)
+        Pairs sharing fewer nodes than this are not reported
+
+    Returns
+    -------
+    pairs : pandas.DataFrame
+        One row per pair of groups sharing at least min_intersection
+        nodes, with the columns group_id_a, group_id_b, intersection,
+        size_a, size_b, overlap_a (= intersection / size_a), overlap_b
+        (= intersection / size_b) and jaccard
+    """
+    _, (node_a, node_b) = encode_ids(table_a[node_id_col].values, table_b[node_id_col].values)
+    labels_a, (group_a,) = encode_ids(table_a[group_id_col].values)
+    labels_b, (group_b,) = encode_ids(table_b[group_id_col].values)
+    num_nodes = np.max(np.concatenate([node_a, node_b]), initial=-1) + 1
+
+    U_a = membership_matrix(node_a, group_a, num_nodes, labels_a.size)
+    U_b = membership_matrix(node_b, group_b, num_nodes, labels_b.size)
+    I = intersection(U_a, U_b, min_intersection).tocoo()
+    sz_a = group_sizes(U_a)[I.row]
+    sz_b = group_sizes(U_b)[I.col]
+    return pd.DataFrame(
+        {
+            "group_id_a": labels_a[I.row],
+            "group_id_b": labels_b[I.col],
+            "intersection": I.data.astype(int),
+            "size_a": sz_a.astype(int),
+            "size_b": sz_b.astype(int),
+            "overlap_a": I.data / sz_a,
+            "overlap_b": I.data / sz_b,
+            "jaccard": I.data / (sz_a + sz_b - I.data),
+        }
+    )
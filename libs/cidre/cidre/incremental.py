@@ -0,0 +1,460 @@
+"""
+Incremental detection of the cartels from edge deltas
+
+A full run of CIDRE computes the p-values of all edges under the dcSBM,
+the cutoff of the Benjamini-Hochberg test, the excessive edges, and the
+peeling. When a small batch of citations is added to a network, most of
+them do not change. DetectionState keeps the intermediate results of a
+run, and DetectionState.update applies an edge delta by
+
+- updating the degrees and the block matrix of the dcSBM by the delta,
+- recomputing the p-values only for the edges from the groups whose
+  out-degree changed or to the groups whose in-degree changed,
+- moving the cutoff of the Benjamini-Hochberg test on the sorted p-values,
+- restarting the peeling from the previous group U together with the
+  candidate nodes connected to the nodes whose excessive edges or degrees
+  changed.
+
+The result is the same as that of filters.get_dcsbm_threshold_filter and
+cidre.detect run on the updated network if the weights are integers, e.g.,
+citation counts, for which the degrees are updated without rounding errors.
+
+Usage:
+
+    state = DetectionState.from_network(
+        A, A_ref, community_ids, threshold=0.15, alpha=0.01, ref_frac_weight=0.5
+    )
+    state.update(dA, dA_ref)  # Add dA to A and dA_ref to A_ref
+    cartel_table = state.table()
+"""
+import os
+import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
+from cidre import cidre, filters, utils
+from cidre import cache as artifact_cache
+
+EDGE_ARRAYS = ["src", "dst", "w", "w_th", "p_value", "sorted_p_value", "is_excessive"]
+NODE_ARRAYS = ["indeg", "outdeg", "U", "donor_score", "recipient_score"]
+PARAMS = ["threshold", "alpha", "ref_frac_weight", "min_group_edge_num"]
+
+
+class DetectionState:
+    """
+    Intermediate results of CIDRE for a network
+
+    Parameters
+    ----------
+    A : scipy.sparse.csr_matrix
+        Adjacency matrix in the canonical format
+    A_ref : scipy.sparse.csr_matrix
+        Adjacency matrix of the reference network of the threshold filter
+    community_ids : numpy.ndarray
+        community_ids[i] is the ID of the group of node i in the dcSBM
+    Lambda : scipy.sparse.csr_matrix
+        Lambda[k, l] is the total weight of the edges from group k to group l
+    params : dict
+        threshold, alpha, ref_frac_weight and min_group_edge_num
+    arrays : dict
+        Arrays of the edges (EDGE_ARRAYS) sorted by the source and the
+        target, and the arrays of the nodes (NODE_ARRAYS)
+    node_labels : numpy.ndarray (Optional; Default None)
+        Labels of the nodes, e.g., the MAG journal ids
+    """
+
+    def __init__(self, A, A_ref, community_ids, Lambda, params, arrays, node_labels=None):
+        self.A = A
+        self.A_ref = A_ref
+        self.community_ids = community_ids
+        self.Lambda = Lambda
+        self.params = params
+        self.arrays = arrays
+        self.node_labels = node_labels
+
+    @classmethod
+    def from_network(
+        cls,
+        A,
+        A_ref,
+        community_ids,
+        threshold,
+        alpha,
+        ref_frac_weight=1.0,
+        min_group_edge_num=0,
+        node_labels=None,
+    ):
+        """
+        Run CIDRE with the dcSBM and threshold filters on a network
+
+        The parameters are those of filters.get_dcsbm_threshold_filter and
+        cidre.detect.
+
+        Returns
+        -------
+        state : DetectionState
+        """
+        A = _canonical(A)
+        A_ref = _canonical(A_ref)
+        community_ids = np.asarray(community_ids)
+        C_SBM = utils.to_community_matrix(community_ids)
+        Lambda = sparse.csr_matrix(C_SBM.T @ A @ C_SBM)
+        indeg = np.array(A.sum(axis=0)).reshape(-1)
+        outdeg = np.array(A.sum(axis=1)).reshape(-1)
+
+        src, dst, w = utils.find_non_self_loop_edges(A)
+        p_value = filters.calc_edge_p_values_dcsbm(
+            src, dst, w, community_ids, indeg, outdeg, Lambda
+        )
+        arrays = {
+            "src": src,
+            "dst": dst,
+            "w": w,
+            "w_th": np.array(A_ref[src, dst]).reshape(-1) * ref_frac_weight,
+            "p_value": p_value,
+            "sorted_p_value": np.sort(p_value),
+            "indeg": indeg,
+            "outdeg": outdeg,
+        }
+        params = {
+            "threshold": threshold,
+            "alpha": alpha,
+            "ref_frac_weight": ref_frac_weight,
+            "min_group_edge_num": min_group_edge_num,
+        }
+        state = cls(A, A_ref, community_ids, Lambda, params, arrays, node_labels)
+        state.arrays["is_excessive"] = state._find_excessive_edges()
+        state._peel(np.ones(A.shape[0]))
+        return state
+
+    @property
+    def num_nodes(self):
+        return self.A.shape[0]
+
+    def update(self, dA, dA_ref=None):
+        """
+        Add an edge delta to the network and update the results
+
+        Parameters
+        ----------
+        dA : scipy sparse matrix
+            Change in the weights of the edges of A. Edges not in A are added.
+            An edge whose weight becomes zero is removed.
+        dA_ref : scipy sparse matrix (Optional; Default None)
+            Change in the weights of the edges of the reference network
+
+        Returns
+        -------
+        self : DetectionState
+        """
+        N = self.num_nodes
+        dA = _delta(dA, N)
+        dA_ref = _delta(dA_ref, N) if dA_ref is not None else _delta(None, N)
+        cids = self.community_ids
+        old_excessive = self._excessive_edge_table()
+
+        self.A = _add(self.A, dA)
+        self.A_ref = _add(self.A_ref, dA_ref)
+
+        # Degrees and the block matrix of the dcSBM
+        a = self.arrays
+        a["outdeg"] = a["outdeg"] + np.bincount(dA.row, weights=dA.data, minlength=N)
+        a["indeg"] = a["indeg"] + np.bincount(dA.col, weights=dA.data, minlength=N)
+        self.Lambda = sparse.csr_matrix(
+            self.Lambda
+            + sparse.csr_matrix(
+                (dA.data, (cids[dA.row], cids[dA.col])), shape=self.Lambda.shape
+            )
+        )
+
+        # Merge the delta into the edges
+        d_src, d_dst, d_w = utils.find_non_self_loop_edges(dA)
+        changed = self._merge_edges(d_src, d_dst, d_w)
+
+        # The threshold weights of the edges whose reference weight changed
+        r_src, r_dst, _ = utils.find_non_self_loop_edges(dA_ref)
+        changed_ref = self._find_edges(r_src, r_dst)
+        changed_ref = changed_ref[changed_ref >= 0]
+        for pos in [changed, changed_ref]:
+            a["w_th"][pos] = (
+                np.array(self.A_ref[a["src"][pos], a["dst"][pos]]).reshape(-1)
+                * self.params["ref_frac_weight"]
+            )
+
+        # p-values of the edges from the groups whose out-degrees changed
+        # or to the groups whose in-degrees changed
+        src_groups = np.zeros(self.Lambda.shape[0], dtype=bool)
+        dst_groups = np.zeros(self.Lambda.shape[0], dtype=bool)
+        src_groups[cids[dA.row]] = True
+        dst_groups[cids[dA.col]] = True
+        affected = np.where(src_groups[cids[a["src"]]] | dst_groups[cids[a["dst"]]])[0]
+        affected = np.union1d(affected, changed)
+        old_p_value = a["p_value"][affected]
+        a["p_value"][affected] = filters.calc_edge_p_values_dcsbm(
+            a["src"][affected],
+            a["dst"][affected],
+            a["w"][affected],
+            cids,
+            a["indeg"],
+            a["outdeg"],
+            self.Lambda,
+        )
+        a["sorted_p_value"] = _replace_sorted(
+            a["sorted_p_value"], old_p_value[~np.isnan(old_p_value)], a["p_value"][affected]
+        )
+        a["is_excessive"] = self._find_excessive_edges()
+
+        # Nodes whose scores can increase
+        new_excessive = self._excessive_edge_table()
+        touched = _changed_edges(old_excessive, new_excessive)
+        touched = np.unique(np.concatenate([touched, dA.row, dA.col]))
+        self._peel(self._peel_start(touched))
+        return self
+
+    def table(self):
+        """
+        Table of the detected groups as given by cidre.detect
+        """
+        a = self.arrays
+        return cidre._extract_groups(
+            self.A,
+            self._pruned_adjacency_matrix(),
+            a["U"],
+            a["donor_score"],
+            a["recipient_score"],
+            self.params["threshold"],
+            self.params["min_group_edge_num"],
+        )
+
+    def save(self, path):
+        """
+        Save the state into a .npz file
+        """
+        arrays = {"community_ids": self.community_ids}
+        arrays.update({"edge_" + k: self.arrays[k] for k in EDGE_ARRAYS})
+        arrays.update({"node_" + k: self.arrays[k] for k in NODE_ARRAYS})
+        arrays.update({"param_" + k: np.array(self.params[k]) for k in PARAMS})
+        arrays.update(artifact_cache.csr_to_arrays(self.A, "A"))
+        arrays.update(artifact_cache.csr_to_arrays(self.A_ref, "A_ref"))
+        arrays.update(artifact_cache.csr_to_arrays(self.Lambda, "Lambda"))
+        if self.node_labels is not None:
+            arrays["node_labels"] = np.asarray(self.node_labels)
+
+        tmp_path = "%s.tmp.%d.npz" % (path, os.getpid())
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a state saved by DetectionState.save
+        """
+        with np.load(path) as data:
+            arrays = {k: data[k] for k in data.files}
+        return cls(
+            A=artifact_cache.csr_from_arrays(arrays, "A"),
+            A_ref=artifact_cache.csr_from_arrays(arrays, "A_ref"),
+            community_ids=arrays["community_ids"],
+            Lambda=artifact_cache.csr_from_arrays(arrays, "Lambda"),
+            params={k: arrays["param_" + k].item() for k in PARAMS},
+            arrays={
+                **{k: arrays["edge_" + k] for k in EDGE_ARRAYS},
+                **{k: arrays["node_" + k] for k in NODE_ARRAYS},
+            },
+            node_labels=arrays.get("node_labels"),
+        )
+
+    def _find_edges(self, src, dst):
+        """
+        Positions of the edges, or -1 for the edges not in the network
+        """
+        keys = _edge_keys(self.arrays["src"], self.arrays["dst"], self.num_nodes)
+        query = _edge_keys(src, dst, self.num_nodes)
+        pos = np.minimum(np.searchsorted(keys, query), max(keys.size - 1, 0))
+        found = keys[pos] == query if keys.size > 0 else np.zeros(query.size, dtype=bool)
+        return np.where(found, pos, -1)
+
+    def _merge_edges(self, d_src, d_dst, d_w):
+        """
+        Add the weights to the edges, insert the new edges and remove the
+        edges with zero weight, keeping the edges sorted
+
+        Returns
+        -------
+        changed : numpy.ndarray
+            Positions of the edges whose weights changed
+        """
+        a = self.arrays
+        N = self.num_nodes
+        pos = self._find_edges(d_src, d_dst)
+        found = pos >= 0
+        a["w"] = a["w"].copy()
+        a["w"][pos[found]] += d_w[found]
+
+        # Insert the new edges, whose p-values are computed later
+        keys = _edge_keys(a["src"], a["dst"], N)
+        new = ~found
+        at = np.searchsorted(keys, _edge_keys(d_src[new], d_dst[new], N))
+        inserted = {
+            "src": d_src[new],
+            "dst": d_dst[new],
+            "w": d_w[new],
+            "w_th": np.zeros(np.sum(new)),
+            "p_value": np.full(np.sum(new), np.nan),
+            "is_excessive": np.zeros(np.sum(new), dtype=bool),
+        }
+        for k, v in inserted.items():
+            a[k] = np.insert(a[k], at, v.astype(a[k].dtype))
+
+        # Remove the edges with zero weight
+        removed = np.where(a["w"] == 0)[0]
+        if removed.size > 0:
+            a["sorted_p_value"] = _replace_sorted(
+                a["sorted_p_value"], a["p_value"][removed], np.zeros(0)
+            )
+            for k in inserted.keys():
+                a[k] = np.delete(a[k], removed)
+
+        changed = self._find_edges(d_src, d_dst)
+        return np.unique(changed[changed >= 0])
+
+    def _find_excessive_edges(self):
+        """
+        Edges that pass both the dcSBM filter and the threshold filter
+        """
+        a = self.arrays
+        is_significant = _benjamini_hochberg_test(
+            a["p_value"], a["sorted_p_value"], self.params["alpha"]
+        )
+        return is_significant & (a["w"] >= a["w_th"]) & (a["w_th"] > 0)
+
+    def _excessive_edge_table(self):
+        """
+        Source, target and weight of the excessive edges
+        """
+        a = self.arrays
+        s = a["is_excessive"]
+        return a["src"][s], a["dst"][s], a["w"][s]
+
+    def _pruned_adjacency_matrix(self):
+        src, dst, w = self._excessive_edge_table()
+        return utils.construct_adjacency_matrix(src, dst, w, self.num_nodes)
+
+    def _peel_start(self, touched):
+        """
+        Nodes from which the peeling restarts
+
+        A node not in the previous U can be in the new U only if it is
+        connected, through the nodes that can be in U, to a node whose
+        excessive edges or degrees changed. Otherwise, its edges and those of
+        the nodes it depends on are the same as before, and it would have been
+        in the previous U. A node can be in U only if its score for U
+        containing all nodes is at least the threshold.
+        """
+        a = self.arrays
+        A_pruned = self._pruned_adjacency_matrix()
+        donor_ratio = np.array(A_pruned.sum(axis=1)).ravel() / np.maximum(a["outdeg"], 1.0)
+        recipient_ratio = np.array(A_pruned.sum(axis=0)).ravel() / np.maximum(a["indeg"], 1.0)
+        is_candidate = np.maximum(donor_ratio, recipient_ratio) >= self.params["threshold"] * (
+            1 - 1e-9
+        )
+
+        candidates = np.where(is_candidate)[0]
+        _, labels = csgraph.connected_components(
+            A_pruned[candidates, :][:, candidates], directed=True, connection="weak"
+        )
+        reached = np.isin(labels, labels[np.isin(candidates, touched)])
+
+        U = np.asarray(a["U"], dtype=float).copy()
+        U[candidates[reached]] = 1
+        return U
+
+    def _peel(self, U):
+        U, donor_score, recipient_score = cidre._peel(
+            self.A, self._pruned_adjacency_matrix(), self.params["threshold"], U=U
+        )
+        self.arrays.update(
+            {"U": U, "donor_score": donor_score, "recipient_score": recipient_score}
+        )
+
+
+def _canonical(A):
+    A = sparse.csr_matrix(A, dtype=float, copy=True)
+    A.sum_duplicates()
+    A.eliminate_zeros()
+    return A
+
+
+def _delta(dA, N):
+    """
+    Delta in the coo format without duplicates and zeros
+    """
+    if dA is None:
+        return sparse.coo_matrix((N, N))
+    dA = sparse.coo_matrix(dA, dtype=float, copy=True)
+    if dA.shape != (N, N):
+        raise ValueError(
+            "The delta has shape %s, but the network has %d nodes" % (dA.shape, N)
+        )
+    dA.sum_duplicates()
+    dA.eliminate_zeros()
+    return dA
+
+
+def _add(A, dA):
+    A = _canonical(A + dA)
+    if np.any(A.data < 0):
+        raise ValueError("The delta makes the weights of edges negative")
+    return A
+
+
+def _edge_keys(src, dst, N):
+    return np.asarray(src, dtype=np.int64) * N + np.asarray(dst, dtype=np.int64)
+
+
+def _replace_sorted(sorted_values, removed, added):
+    """
+    Remove the values from a sorted array and insert other values
+    """
+    removed, counts = np.unique(removed, return_counts=True)
+    start = np.searchsorted(sorted_values, removed, side="left")
+    offset = np.arange(np.sum(counts)) - np.repeat(np.cumsum(counts) - counts, counts)
+    sorted_values = np.delete(sorted_values, np.repeat(start, counts) + offset)
+    added = np.sort(added)
+    return np.insert(sorted_values, np.searchsorted(sorted_values, added), added)
+
+
+def _benjamini_hochberg_test(pvals, sorted_pvals, alpha):
+    """
+    filters.benjamini_hochberg_test with the sorted p-values given
+
+    All p-values at most the largest p-value that passes the test are
+    significant, which is the same as the set marked by
+    filters.benjamini_hochberg_test, since the p-values tied with the
+    largest passing one also pass.
+    """
+    M = sorted_pvals.size
+    passed = np.where(sorted_pvals <= (alpha * np.arange(1, M + 1) / M))[0]
+    if passed.size == 0:
+        return np.zeros(M, dtype=bool)
+    return pvals <= sorted_pvals[passed[-1]]
+
+
+def _changed_edges(old, new):
+    """
+    End points of the edges that are added, removed, or reweighted between
+    two tables of edges (src, dst, w) sorted by the source and the target
+    """
+    src = np.concatenate([old[0], new[0]])
+    dst = np.concatenate([old[1], new[1]])
+    w = np.concatenate([old[2], new[2]])
+    N = np.max(np.concatenate([src, dst]), initial=-1) + 1
+    keys = _edge_keys(src, dst, max(N, 1))
+    order = np.lexsort((w, keys))
+    keys, w = keys[order], w[order]
+
+    # An edge is unchanged if it appears twice with the same weight
+    same = np.zeros(keys.size, dtype=bool)
+    pair = (keys[1:] == keys[:-1]) & (w[1:] == w[:-1])
+    same[1:] |= pair
+    same[:-1] |= pair
+    return np.unique(np.concatenate([src[order][~same], dst[order][~same]]))
@@ -0,0 +1,269 @@
+"""
+Multithreaded sparse kernels of CIDRE
+
+The kernels partition the rows of a csr matrix into contiguous slabs with
+about the same number of edges and process the slabs in a pool of threads.
+The slabs are views of the matrix, and the work on a slab is done by
+scipy's sparse matrix-vector product and numpy, which release the GIL, so
+the threads run in parallel. Each slab writes its own part of the output,
+and the sums are taken in the same order as by scipy, so the results do
+not depend on the number of threads. The exception is col_sums, which adds
+up partial sums and can differ in rounding for non-integer weights.
+
+The number of threads is read from the environment variable
+CIDRE_NUM_THREADS (Default 1) and can be changed by set_num_threads.
+Matrices with fewer than MIN_EDGES_PER_THREAD edges per thread are
+processed with fewer threads, down to a single thread without the pool.
+
+    kernels.set_num_threads(32)
+    y = kernels.matvec(A, x)  # A @ x
+"""
+import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from scipy import sparse
+
+NUM_THREADS_ENV = "CIDRE_NUM_THREADS"
+
+# Below this number of edges per thread, the threads cost more than they save
+MIN_EDGES_PER_THREAD = 250000
+
+_num_threads = max(1, int(os.environ.get(NUM_THREADS_ENV, 1)))
+_executor = None
+
+
+def set_num_threads(num_threads):
+    """
+    Set the number of threads of the kernels
+
+    Parameters
+    ----------
+    num_threads : int
+        Number of threads. If None, the number of CPUs.
+    """
+    global _num_threads
+    if num_threads is None:
+        num_threads = os.cpu_count()
+    num_threads = max(1, int(num_threads))
+    if num_threads != _num_threads:
+        _shutdown()
+    _num_threads = num_threads
+
+
+def get_num_threads():
+    """
+    Number of threads of the kernels
+    """
+    return _num_threads
+
+
+def row_partition(A, num_parts):
+    """
+    Split the rows of a csr matrix into slabs with about the same number of edges
+
+    Parameters
+    ----------
+    A : scipy.sparse.csr_matrix
+    num_parts : int
+        Number of slabs
+
+    Returns
+    -------
+    bounds : numpy.ndarray
+        The rows bounds[p] to bounds[p + 1] - 1 form the pth slab
+    """
+    targets = np.linspace(0, A.nnz, num_parts + 1)
+    bounds = np.searchsorted(A.indptr, targets, side="left")
+    bounds[0], bounds[-1] = 0, A.shape[0]
+    return np.maximum.accumulate(np.minimum(bounds, A.shape[0]))
+
+
+def matvec(A, x):
+    """
+    Multithreaded A @ x
+
+    Parameters
+    ----------
+    A : scipy.sparse.csr_matrix
+    x : numpy.ndarray
+        Vector of length A.shape[1]
+
+    Returns
+    -------
+    y : numpy.ndarray
+        y[i] = sum_j A[i, j] x[j]
+    """
+    A = as_csr(A)
+    x = np.asarray(x).ravel()
+    num_parts = _num_parts(A.nnz)
+    if num_parts == 1:
+        return np.asarray(A @ x).ravel()
+
+    bounds = row_partition(A, num_parts)
+    y = np.empty(A.shape[0], dtype=np.result_type(A.dtype, x.dtype))
+
+    def run(p):
+        y[bounds[p] : bounds[p + 1]] = _slab(A, bounds[p], bounds[p + 1]) @ x
+
+    _map(run, range(num_parts))
+    return y
+
+
+def row_sums(A, mask=None):
+    """
+    Multithreaded sums of the rows of a csr matrix
+
+    Parameters
+    ----------
+    A : scipy.sparse.csr_matrix
+    mask : numpy.ndarray (Optional; Default None)
+        If given, the sums are over the columns j with mask[j] != 0
+
+    Returns
+    -------
+    sums : numpy.ndarray
+        sums[i] = sum_j A[i, j] (mask[j] != 0)
+    """
+    A = as_csr(A)
+    x = np.ones(A.shape[1]) if mask is None else (np.asarray(mask).ravel() != 0) * 1.0
+    return matvec(A, x)
+
+
+def col_sums(A, mask=None):
+    """
+    Multithreaded sums of the columns of a csr matrix
+
+    The slabs are summed into partial sums, which are then added up. For
+    repeated column sums of the same matrix, apply row_sums to transpose(A).
+
+    Parameters
+    ----------
+    A : scipy.sparse.csr_matrix
+    mask : numpy.ndarray (Optional; Default None)
+        If given, the sums are over the rows i with mask[i] != 0
+
+    Returns
+    -------
+    sums : numpy.ndarray
+        sums[j] = sum_i A[i, j] (mask[i] != 0)
+    """
+    A = as_csr(A)
+    x = np.ones(A.shape[0]) if mask is None else (np.asarray(mask).ravel() != 0) * 1.0
+    num_parts = _num_parts(A.nnz)
+    if num_parts == 1:
+        return np.asarray(x @ A).ravel()
+
+    bounds = row_partition(A, num_parts)
+
+    def run(p):
+        return x[bounds[p] : bounds[p + 1]] @ _slab(A, bounds[p], bounds[p + 1])
+
+    return np.sum(_map(run, range(num_parts)), axis=0)
+
+
+def transpose(A):
+    """
+    Transpose of a csr matrix in the csr format
+    """
+    return sparse.csr_matrix(as_csr(A).T)
+
+
+def gather(Lambda, rows, cols):
+    """
+    Multithreaded Lambda[rows, cols] for a small sparse matrix Lambda
+    and many pairs of indices, e.g., the rates of the blocks of the edges
+    in the degree-corrected SBM
+
+    Parameters
+    ----------
+    Lambda : scipy sparse matrix
+    rows : numpy.ndarray
+        Row indices
+    cols : numpy.ndarray
+        Column indices
+
+    Returns
+    -------
+    values : numpy.ndarray
+        values[k] = Lambda[rows[k], cols[k]]
+    """
+    Lambda = as_csr(Lambda)
+    rows = np.asarray(rows, dtype=np.int64)
+    cols = np.asarray(cols, dtype=np.int64)
+    num_cols = Lambda.shape[1]
+
+    # Keys of the non-zero entries in the row-major order
+    keys = np.repeat(np.arange(Lambda.shape[0], dtype=np.int64), np.diff(Lambda.indptr))
+    keys = keys * num_cols + Lambda.indices
+    values = np.zeros(rows.size, dtype=Lambda.dtype)
+    if keys.size == 0:
+        return values
+
+    def run(span):
+        s, e = span
+        query = rows[s:e] * num_cols + cols[s:e]
+        pos = np.minimum(np.searchsorted(keys, query), keys.size - 1)
+        found = keys[pos] == query
+        values[s:e][found] = Lambda.data[pos[found]]
+
+    num_parts = _num_parts(rows.size)
+    bounds = np.linspace(0, rows.size, num_parts + 1).astype(int)
+    _map(run, zip(bounds[:-1], bounds[1:]))
+    return values
+
+
+def as_csr(A):
+    """
+    A in the canonical csr format, without a copy if it already is
+    """
+    if not sparse.isspmatrix_csr(A):
+        A = sparse.csr_matrix(A)
+    if not A.has_canonical_format:
+        A = A.copy()
+        A.sum_duplicates()
+    return A
+
+
+def _slab(A, start, stop):
+    """
+    Rows start to stop - 1 of a csr matrix as a view
+    """
+    s, e = A.indptr[start], A.indptr[stop]
+    return sparse.csr_matrix(
+        (A.data[s:e], A.indices[s:e], A.indptr[start : stop + 1] - s),
+        shape=(stop - start, A.shape[1]),
+        copy=False,
+    )
+
+
+def _num_parts(num_items):
+    return int(max(1, min(_num_threads, num_items // MIN_EDGES_PER_THREAD)))
+
+
+def _map(func, tasks):
+    tasks = list(tasks)
+    if len(tasks) == 1:
+        return [func(tasks[0])]
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(_num_threads)
+    return list(_executor.map(func, tasks))
+
+
+def _shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+    _executor = None
+
+
+def _forget_executor():
+    """
+    Drop the pool inherited from the parent process, whose threads do
+    not exist in the child
+    """
+    global _executor
+    _executor = None
+
+
+os.register_at_fork(after_in_child=_forget_executor)
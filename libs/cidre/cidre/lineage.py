@@ -0,0 +1,161 @@
+"""
+Tracking of the groups across years
+
+The groups of consecutive years are linked if they share enough members.
+The links between all groups of two years are found by one sparse product
+of the membership matrices (see cidre.groups), and each group is given a
+lineage id that persists over the years:
+
+- A group continues the lineage of a group in the preceding year if each
+  is the most similar group of the other. Otherwise, it starts a new lineage.
+- The linked groups in the preceding year are the predecessors of the
+  group, and the event of the group is one of
+
+    birth         : the group has no predecessor
+    continuation  : the group has one predecessor, which has one successor
+    split         : the group has one predecessor, which has two or more successors
+    merge         : the group has two or more predecessors
+
+Usage:
+
+    lineage_table, link_table = lineage.track(store.table())
+"""
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from cidre import groups
+
+
+def track(cartel_table, node_col="mag_journal_id", min_jaccard=0.3, min_intersection=1):
+    """
+    Link the groups of consecutive years and assign the lineage ids
+
+    Parameters
+    ----------
+    cartel_table : pandas.DataFrame
+        Table of the groups of all years with the columns year,
+        gross_group_id and node_col, e.g., given by CartelStore.table
+    node_col : str (Optional; Default "mag_journal_id")
+        Column of the node labels shared across the years
+    min_jaccard : float (Optional; Default 0.3)
+        Two groups are linked if the Jaccard index between them is at least this value
+    min_intersection : int (Optional; Default 1)
+        Two groups are linked if they share at least this number of nodes
+
+    Returns
+    -------
+    lineage_table : pandas.DataFrame
+        One row per group with the columns gross_group_id, year,
+        lineage_id, predecessor (gross_group_id of the most similar group
+        in the preceding year, or -1), jaccard (Jaccard index with the
+        predecessor), num_predecessors, num_successors and event
+    link_table : pandas.DataFrame
+        One row per pair of linked groups with the columns
+        gross_group_id_a, gross_group_id_b (the group in the later year),
+        year_a, year_b, intersection and jaccard
+    """
+    gids, first = np.unique(cartel_table["gross_group_id"].values, return_index=True)
+    group_years = cartel_table["year"].values[first]
+    _, (node_ids,) = groups.encode_ids(cartel_table[node_col].values)
+    num_nodes = np.max(node_ids, initial=-1) + 1
+    years = np.unique(group_years)
+
+    # Membership matrix of the groups of a year, and their positions in gids
+    def membership(year):
+        s = cartel_table["year"].values == year
+        cols = np.where(group_years == year)[0]
+        local_ids = np.searchsorted(gids[cols], cartel_table["gross_group_id"].values[s])
+        U = groups.membership_matrix(node_ids[s], local_ids, num_nodes, cols.size)
+        return U, cols
+
+    links = []
+    lineage_ids = -np.ones(gids.size, dtype=int)
+    predecessor = -np.ones(gids.size, dtype=int)
+    jaccard = np.full(gids.size, np.nan)
+    num_predecessors = np.zeros(gids.size, dtype=int)
+    num_successors = np.zeros(gids.size, dtype=int)
+
+    if years.size > 0:
+        U_prev, cols_prev = membership(years[0])
+        lineage_ids[cols_prev] = np.arange(cols_prev.size)
+    next_lineage_id = np.max(lineage_ids, initial=-1) + 1
+    for year_prev, year in zip(years[:-1], years[1:]):
+        U, cols = membership(year)
+
+        # Similarity between all pairs of the groups of the two years
+        I = groups.intersection(U_prev, U, min_intersection).tocoo()
+        sz_prev = groups.group_sizes(U_prev)[I.row]
+        sz = groups.group_sizes(U)[I.col]
+        J = I.data / (sz_prev + sz - I.data)
+        linked = J >= min_jaccard
+        row, col, inter, J = I.row[linked], I.col[linked], I.data[linked], J[linked]
+        links.append(
+            pd.DataFrame(
+                {
+                    "gross_group_id_a": gids[cols_prev[row]],
+                    "gross_group_id_b": gids[cols[col]],
+                    "year_a": year_prev,
+                    "year_b": year,
+                    "intersection": inter.astype(int),
+                    "jaccard": J,
+                }
+            )
+        )
+        num_successors[cols_prev] = np.bincount(row, minlength=cols_prev.size)
+        num_predecessors[cols] = np.bincount(col, minlength=cols.size)
+
+        # Most similar group of each group in the other year
+        S = sparse.csr_matrix((J, (row, col)), shape=(cols_prev.size, cols.size))
+        best_next, _ = groups.best_match(S)
+        best_prev, best_prev_score = groups.best_match(S.T)
+        has_prev = best_prev >= 0
+        predecessor[cols[has_prev]] = gids[cols_prev[best_prev[has_prev]]]
+        jaccard[cols[has_prev]] = best_prev_score[has_prev]
+
+        # Continue the lineage of the most similar group if they match mutually
+        continues = np.zeros(cols.size, dtype=bool)
+        continues[has_prev] = best_next[best_prev[has_prev]] == np.where(has_prev)[0]
+        lineage_ids[cols[continues]] = lineage_ids[cols_prev[best_prev[continues]]]
+        num_new = np.sum(~continues)
+        lineage_ids[cols[~continues]] = next_lineage_id + np.arange(num_new)
+        next_lineage_id += num_new
+
+        U_prev, cols_prev = U, cols
+
+    event = np.full(gids.size, "continuation", dtype=object)
+    pred_pos = np.searchsorted(gids, predecessor)
+    is_split = (predecessor >= 0) & (num_successors[np.maximum(pred_pos, 0)] > 1)
+    event[is_split] = "split"
+    event[num_predecessors > 1] = "merge"
+    event[num_predecessors == 0] = "birth"
+
+    lineage_table = pd.DataFrame(
+        {
+            "gross_group_id": gids,
+            "year": group_years,
+            "lineage_id": lineage_ids,
+            "predecessor": predecessor,
+            "jaccard": jaccard,
+            "num_predecessors": num_predecessors,
+            "num_successors": num_successors,
+            "event": event.astype(str),
+        }
+    )
+    link_table = (
+        pd.concat(links, ignore_index=True)
+        if links
+        else pd.DataFrame(
+            {
+                name: np.zeros(0, dtype=float if name == "jaccard" else int)
+                for name in [
+                    "gross_group_id_a",
+                    "gross_group_id_b",
+                    "year_a",
+                    "year_b",
+                    "intersection",
+                    "jaccard",
+                ]
+            }
+        )
+    )
+    return lineage_table, link_table
@@ -0,0 +1,449 @@
+"""
+Out-of-core CIDRE for networks that do not fit in memory, e.g., author
+citation networks with tens of millions of nodes and billions of edges
+
+The network is kept on disk as a csr matrix with one .npy file per array,
+loaded as read-only memory maps. The indices are int32 as long as the
+number of edges is below 2^31, and the weights are float32, which halves
+the size of the network. The network is built by EdgeAccumulator, which
+spills the edges into buckets of source nodes on disk and merges the
+duplicate edges bucket by bucket.
+
+detect streams the network in slabs of rows with at most chunk_edges edges:
+
+1. The degrees of the nodes and the citations between the communities.
+2. The p-values of the edges under the dcSBM as in
+   filters.calc_p_values_dcsbm. Only the edges with a p-value at most
+   alpha are kept since the others never pass the Benjamini-Hochberg test.
+3. The Benjamini-Hochberg test on the kept edges, which are the smallest
+   p-values of all the edges, gives the pruned network.
+4. The peeling runs on the pruned network held in memory.
+5. The groups are the weakly connected components of the pruned network
+   restricted to U, and the number of edges in a group is counted in
+   another pass.
+
+The memory used beyond the node arrays and the pruned network grows with
+chunk_edges, not with the number of edges. The groups are the same as
+those found by cidre.detect with filters.get_dcSBM_filter.
+
+Usage:
+
+    acc = outofcore.EdgeAccumulator(num_nodes, work_dir)
+    for src, dst, w in chunks:
+        acc.add(src, dst, w)
+    A = acc.save("data/author-network")
+
+    A = outofcore.load_csr("data/author-network")
+    cartel_table = outofcore.detect(A, community_ids, threshold=0.15, alpha=0.01)
+"""
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse import csgraph
+from cidre import cidre, filters, kernels
+
+META_FILE = "meta.json"
+DEFAULT_CHUNK_EDGES = 20000000
+
+
+class EdgeAccumulator:
+    """
+    Sum of weighted edges given in chunks, spilled to disk
+
+    Parameters
+    ----------
+    num_nodes : int
+        Number of nodes
+    work_dir : str
+        Directory for the spilled edges, removed by save
+    num_buckets : int (Optional; Default 64)
+        Number of buckets of source nodes. The edges of a bucket are merged
+        in memory by save, so a bucket should hold at most chunk_edges edges.
+    buffer_edges : int (Optional; Default 10000000)
+        Number of edges held in memory before they are spilled
+    """
+
+    def __init__(self, num_nodes, work_dir, num_buckets=64, buffer_edges=10000000):
+        self.num_nodes = int(num_nodes)
+        self.work_dir = work_dir
+        self.bounds = np.linspace(0, self.num_nodes, num_buckets + 1).astype(np.int64)
+        self.idx_dtype = index_dtype(self.num_nodes, 0)
+        self.buffer_edges = buffer_edges
+        self.buffer = []
+        self.buffered = 0
+        self.num_spilled = np.zeros(num_buckets, dtype=np.int64)
+        os.makedirs(work_dir, exist_ok=True)
+
+    def add(self, src, dst, w=None):
+        """
+        Add edges
+
+        Parameters
+        ----------
+        src : numpy.ndarray
+            Source nodes
+        dst : numpy.ndarray
+            Target nodes
+        w : numpy.ndarray (Optional; Default None)
+            Weight of the edges. If None, all edges have weight one.
+        """
+        src = np.asarray(src, dtype=np.int64)
+        dst = np.asarray(dst, dtype=np.int64)
+        w = np.ones(src.size, dtype=np.float32) if w is None else np.asarray(w, dtype=np.float32)
+        self.buffer += [(src, dst, w)]
+        self.buffered += src.size
+        if self.buffered >= self.buffer_edges:
+            self._spill()
+
+    def save(self, path):
+        """
+        Merge the edges into a csr matrix saved in path
+
+        Returns
+        -------
+        A : scipy.sparse.csr_matrix
+            The saved matrix loaded by load_csr
+        """
+        self._spill()
+        N = self.num_nodes
+        tmp_path = path + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        # Merge the buckets one by one
+        row_nnz = np.zeros(N, dtype=np.int64)
+        for b in range(len(self.num_spilled)):
+            src, dst, w = self._read_bucket(b)
+            src, dst, w = _sum_duplicates(src, dst, w, N)
+            row_nnz[self.bounds[b] : self.bounds[b + 1]] = np.bincount(
+                src - self.bounds[b], minlength=self.bounds[b + 1] - self.bounds[b]
+            )
+            np.save(os.path.join(self.work_dir, "merged-indices-%d.npy" % b), dst)
+            np.save(os.path.join(self.work_dir, "merged-data-%d.npy" % b), w)
+
+        nnz = int(row_nnz.sum())
+        idx_dtype = index_dtype(N, nnz)
+        indptr = np.zeros(N + 1, dtype=idx_dtype)
+        np.cumsum(row_nnz, out=indptr[1:])
+        np.save(os.path.join(tmp_path, "indptr.npy"), indptr)
+        for name, dtype in [("indices", idx_dtype), ("data", np.float32)]:
+            out = np.lib.format.open_memmap(
+                os.path.join(tmp_path, name + ".npy"), mode="w+", dtype=dtype, shape=(nnz,)
+            )
+            for b in range(len(self.num_spilled)):
+                filename = os.path.join(self.work_dir, "merged-%s-%d.npy" % (name, b))
+                out[indptr[self.bounds[b]] : indptr[self.bounds[b + 1]]] = np.load(filename)
+            out.flush()
+            del out
+        with open(os.path.join(tmp_path, META_FILE), "w") as f:
+            json.dump({"shape": [N, N], "nnz": nnz}, f)
+
+        shutil.rmtree(path, ignore_errors=True)
+        os.rename(tmp_path, path)
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+        return load_csr(path)
+
+    def _spill(self):
+        """
+        Append the buffered edges, with the duplicates summed, to the bucket files
+        """
+        if self.buffered == 0:
+            return
+        src, dst, w = [np.concatenate(x) for x in zip(*self.buffer)]
+        self.buffer, self.buffered = [], 0
+        src, dst, w = _sum_duplicates(src, dst, w, self.num_nodes)
+
+        # The edges are sorted by source, so a bucket is a contiguous range
+        cuts = np.searchsorted(src, self.bounds)
+        for b in range(len(self.num_spilled)):
+            s, e = cuts[b], cuts[b + 1]
+            if s == e:
+                continue
+            for name, arr in [("src", src[s:e]), ("dst", dst[s:e]), ("w", w[s:e])]:
+                with open(self._bucket_file(b, name), "ab") as f:
+                    arr.astype(self.idx_dtype if name != "w" else np.float32).tofile(f)
+            self.num_spilled[b] += e - s
+
+    def _read_bucket(self, b):
+        if self.num_spilled[b] == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, np.zeros(0, dtype=np.float32)
+        return (
+            np.fromfile(self._bucket_file(b, "src"), dtype=self.idx_dtype),
+            np.fromfile(self._bucket_file(b, "dst"), dtype=self.idx_dtype),
+            np.fromfile(self._bucket_file(b, "w"), dtype=np.float32),
+        )
+
+    def _bucket_file(self, b, name):
+        return os.path.join(self.work_dir, "bucket-%d-%s.bin" % (b, name))
+
+
+def index_dtype(num_nodes, nnz):
+    """
+    int32 if the indices and the pointers of a csr matrix fit in it, otherwise int64
+    """
+    if max(num_nodes, nnz) < np.iinfo(np.int32).max:
+        return np.int32
+    return np.int64
+
+
+def save_csr(A, path):
+    """
+    Save a csr matrix in the format read by load_csr
+    """
+    A = kernels.as_csr(A)
+    idx_dtype = index_dtype(A.shape[0], A.nnz)
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    np.save(os.path.join(tmp_path, "indptr.npy"), A.indptr.astype(idx_dtype))
+    np.save(os.path.join(tmp_path, "indices.npy"), A.indices.astype(idx_dtype))
+    np.save(os.path.join(tmp_path, "data.npy"), A.data.astype(np.float32))
+    with open(os.path.join(tmp_path, META_FILE), "w") as f:
+        json.dump({"shape": list(A.shape), "nnz": int(A.nnz)}, f)
+    shutil.rmtree(path, ignore_errors=True)
+    os.rename(tmp_path, path)
+
+
+def load_csr(path):
+    """
+    csr matrix backed by read-only memory maps of the files in path
+
+    Returns
+    -------
+    A : scipy.sparse.csr_matrix
+        The matrix saved by EdgeAccumulator.save or save_csr
+    """
+    with open(os.path.join(path, META_FILE)) as f:
+        meta = json.load(f)
+    load = lambda name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+    A = sparse.csr_matrix(
+        (load("data"), load("indices"), load("indptr")), shape=tuple(meta["shape"]), copy=False
+    )
+    # The saved matrix is in the canonical format, which prevents scipy
+    # from sorting the read-only indices in place
+    A.has_canonical_format = True
+    return A
+
+
+def row_slabs(A, chunk_edges=DEFAULT_CHUNK_EDGES):
+    """
+    Consecutive slabs of rows of a csr matrix with at most about chunk_edges edges
+
+    Yields
+    ------
+    start : int
+        First row of the slab
+    rows : numpy.ndarray
+        Row of each edge in the slab
+    cols : numpy.ndarray
+        Column of each edge in the slab
+    w : numpy.ndarray
+        Weight of each edge in the slab
+    """
+    num_parts = max(1, int(np.ceil(A.nnz / chunk_edges)))
+    bounds = kernels.row_partition(A, num_parts)
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        s, e = A.indptr[start], A.indptr[stop]
+        if s == e:
+            continue
+        rows = np.repeat(
+            np.arange(start, stop, dtype=A.indices.dtype), np.diff(A.indptr[start : stop + 1])
+        )
+        yield start, rows, np.asarray(A.indices[s:e]), np.asarray(A.data[s:e], dtype=float)
+
+
+def degrees(A, community_ids, chunk_edges=DEFAULT_CHUNK_EDGES):
+    """
+    Degrees of the nodes and the citations between the communities
+
+    Returns
+    -------
+    indeg : numpy.ndarray
+        Total weight of the incoming edges of the nodes
+    outdeg : numpy.ndarray
+        Total weight of the outgoing edges of the nodes
+    Lambda : scipy.sparse.csr_matrix
+        Lambda[k, l] is the total weight of the edges from community k to community l
+    """
+    N = A.shape[0]
+    K = int(np.max(community_ids)) + 1
+    indeg = np.zeros(N)
+    outdeg = np.zeros(N)
+    Lambda = sparse.csr_matrix((K, K))
+    for start, rows, cols, w in row_slabs(A, chunk_edges):
+        outdeg[start : rows[-1] + 1] += np.bincount(rows - start, weights=w)
+        indeg += np.bincount(cols, weights=w, minlength=N)
+        Lambda += sparse.csr_matrix(
+            (w, (community_ids[rows], community_ids[cols])), shape=(K, K)
+        )
+    return indeg, outdeg, Lambda
+
+
+def prune_dcsbm(A, community_ids, alpha, chunk_edges=DEFAULT_CHUNK_EDGES):
+    """
+    Network of the excessive edges under the dcSBM as in filters.get_dcSBM_filter
+
+    Parameters
+    ----------
+    A : scipy.sparse.csr_matrix
+        Adjacency matrix, e.g., given by load_csr
+    community_ids : numpy.ndarray
+        community_ids[i] is the ID of the community of node i
+    alpha : float
+        Significance level of the Benjamini-Hochberg test
+    chunk_edges : int (Optional; Default DEFAULT_CHUNK_EDGES)
+        Number of edges processed at once
+
+    Returns
+    -------
+    A_pruned : scipy.sparse.csr_matrix
+        Adjacency matrix of the significant edges without the self-loops
+    indeg : numpy.ndarray
+        Total weight of the incoming edges of the nodes in A
+    outdeg : numpy.ndarray
+        Total weight of the outgoing edges of the nodes in A
+    """
+    community_ids = np.asarray(community_ids)
+    indeg, outdeg, Lambda = degrees(A, community_ids, chunk_edges)
+
+    # Keep the edges with a p-value at most alpha, which include all the
+    # edges that can pass the test
+    num_tested = 0
+    kept = []
+    for _, rows, cols, w in row_slabs(A, chunk_edges):
+        s = rows != cols
+        rows, cols, w = rows[s], cols[s], w[s]
+        pvals = filters.calc_edge_p_values_dcsbm(
+            rows, cols, w, community_ids, indeg, outdeg, Lambda
+        )
+        num_tested += pvals.size
+        s = pvals <= alpha
+        kept += [(rows[s], cols[s], w[s].astype(np.float32), pvals[s])]
+
+    # Benjamini-Hochberg test as in filters.benjamini_hochberg_test. The
+    # kept p-values are the smallest ones, so their ranks are those among
+    # all the tested edges.
+    N = A.shape[0]
+    idx_dtype = index_dtype(N, 0)
+    if len(kept) == 0:
+        return sparse.csr_matrix((N, N), dtype=np.float32), indeg, outdeg
+    rows, cols, w, pvals = [np.concatenate(x) for x in zip(*kept)]
+    order = np.argsort(pvals)
+    passed = np.where(pvals[order] <= alpha * np.arange(1, pvals.size + 1) / num_tested)[0]
+    s = order[: passed[-1] + 1] if passed.size > 0 else order[:0]
+    A_pruned = sparse.csr_matrix(
+        (w[s], (rows[s].astype(idx_dtype), cols[s].astype(idx_dtype))), shape=(N, N)
+    )
+    return A_pruned, indeg, outdeg
+
+
+def extract_groups(
+    A,
+    A_pruned,
+    U,
+    donor_score,
+    recipient_score,
+    threshold,
+    min_group_edge_num=0,
+    chunk_edges=DEFAULT_CHUNK_EDGES,
+):
+    """
+    Partition U into the disjoint groups as in cidre._extract_groups
+
+    Returns
+    -------
+    df : pandas.DataFrame
+        Table of the groups with the columns of cidre.detect. The table
+        is empty if no group is found.
+    """
+    N = A.shape[0]
+    nodes_in_U = np.where(U)[0]
+    if nodes_in_U.size == 0:
+        return _group_table(nodes_in_U, nodes_in_U, donor_score, recipient_score, threshold)
+
+    # Weakly connected components of the pruned network in U without the isolates
+    _, labels = csgraph.connected_components(
+        A_pruned[nodes_in_U, :][:, nodes_in_U], directed=True, connection="weak"
+    )
+    sizes = np.bincount(labels)
+    label = -np.ones(N, dtype=np.int64)
+    label[nodes_in_U] = np.where(sizes[labels] > 1, labels, -1)
+
+    # Weight of the edges within the groups in A
+    num_edges = np.zeros(sizes.size)
+    for _, rows, cols, w in row_slabs(A, chunk_edges):
+        s = (label[rows] >= 0) & (label[rows] == label[cols]) & (rows != cols)
+        num_edges += np.bincount(label[rows[s]], weights=w[s], minlength=sizes.size)
+
+    # Number the groups in the order of their smallest nodes as cidre.detect
+    in_group = np.where((label >= 0) & (num_edges[np.maximum(label, 0)] > min_group_edge_num))[0]
+    _, first = np.unique(label[in_group], return_index=True)
+    group_ids = np.full(sizes.size, -1)
+    group_ids[label[in_group][np.sort(first)]] = np.arange(first.size)
+    group_id = group_ids[label[in_group]]
+    order = np.lexsort((in_group, group_id))
+    return _group_table(
+        in_group[order], group_id[order], donor_score, recipient_score, threshold
+    )
+
+
+def _group_table(nodes, group_id, donor_score, recipient_score, threshold):
+    return pd.DataFrame(
+        {
+            "node_id": nodes,
+            "group_id": group_id,
+            "recipient_score": recipient_score[nodes],
+            "donor_score": donor_score[nodes],
+            "is_recipient": (recipient_score[nodes] >= threshold).astype(int),
+            "is_donor": (donor_score[nodes] >= threshold).astype(int),
+        }
+    )
+
+
+def detect(
+    A, community_ids, threshold, alpha, min_group_edge_num=0, chunk_edges=DEFAULT_CHUNK_EDGES
+):
+    """
+    CIDRE with the dcSBM filter for a network on disk
+
+    Parameters
+    ----------
+    A : scipy.sparse.csr_matrix
+        Adjacency matrix, e.g., given by load_csr
+    community_ids : numpy.ndarray
+        community_ids[i] is the ID of the community of node i
+    threshold : float
+        Threshold for the donor and recipient scores
+    alpha : float
+        Significance level of the dcSBM filter
+    min_group_edge_num : int (Optional; Default 0)
+        Same as that for cidre.detect
+    chunk_edges : int (Optional; Default DEFAULT_CHUNK_EDGES)
+        Number of edges processed at once
+
+    Returns
+    -------
+    df : pandas.DataFrame
+        Table of the detected groups with the columns of cidre.detect
+    """
+    A_pruned, indeg, outdeg = prune_dcsbm(A, community_ids, alpha, chunk_edges)
+    U, donor_score, recipient_score = cidre._peel_pruned(
+        A_pruned, np.maximum(indeg, 1.0), np.maximum(outdeg, 1.0), threshold
+    )
+    return extract_groups(
+        A, A_pruned, U, donor_score, recipient_score, threshold, min_group_edge_num, chunk_edges
+    )
+
+
+def _sum_duplicates(src, dst, w, num_nodes):
+    """
+    Edges sorted by source and target with the weights of the duplicates summed
+    """
+    keys = src.astype(np.int64) * num_nodes + dst
+    keys, inverse = np.unique(keys, return_inverse=True)
+    w = np.bincount(inverse, weights=w, minlength=keys.size).astype(np.float32)
+    return keys // num_nodes, keys % num_nodes, w
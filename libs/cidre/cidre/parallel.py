@@ -0,0 +1,134 @@
+"""
+Seeded batches of random samples run by a pool of processes
+
+The samples are split into batches, and each batch has its own seed
+derived from the given seed, so the results do not depend on the number
+of processes. The workers share the arrays and the matrices through
+cidre.sharedmem and pass them, together with the settings, to the batch
+function:
+
+    def run_batch(worker, seed, num_samples):
+        rng = np.random.default_rng(seed)
+        ...  # worker["A"], worker["alpha"], ...
+        return counts
+
+    total = parallel.run_batches(
+        run_batch, np.add, num_samples=1000, batch_size=10,
+        arrays={"community_ids": c}, matrices={"A": A}, settings={"alpha": 0.01},
+        n_jobs=8, seed=0,
+    )
+
+The batch function must be defined at the top level of a module so that
+it can be sent to the workers.
+"""
+import numpy as np
+from multiprocessing import Pool
+from cidre import sharedmem
+
+# Shared arrays and matrices and the settings of the worker processes set by _init_worker
+_worker = {}
+
+
+def batch_seeds(num_samples, batch_size, seed=0):
+    """
+    Seeds and sizes of the batches
+
+    Parameters
+    ----------
+    num_samples : int
+        Number of samples
+    batch_size : int
+        Number of samples in a batch. The last batch may be smaller.
+    seed : int (Optional; Default 0)
+        Seed of the random numbers
+
+    Returns
+    -------
+    tasks : list of (numpy.random.SeedSequence, int)
+        Seed and number of samples of each batch
+    """
+    num_batches = int(np.ceil(num_samples / batch_size))
+    seeds = np.random.SeedSequence(seed).spawn(num_batches)
+    return [
+        (seeds[b], min(batch_size, num_samples - b * batch_size)) for b in range(num_batches)
+    ]
+
+
+def run_batches(
+    run_batch,
+    reduce,
+    num_samples,
+    batch_size=10,
+    arrays=None,
+    matrices=None,
+    settings=None,
+    n_jobs=1,
+    seed=0,
+):
+    """
+    Run a function on seeded batches of samples and reduce the results
+
+    Parameters
+    ----------
+    run_batch : function
+        run_batch(worker, seed, num_samples) returns the result of a batch,
+        where worker is a dict of the shared arrays and matrices and the
+        settings, and seed is a numpy.random.SeedSequence
+    reduce : function
+        reduce(total, result) combines the results of two batches, e.g.,
+        numpy.add. It must not depend on the order of the batches.
+    num_samples : int
+        Number of samples
+    batch_size : int (Optional; Default 10)
+        Number of samples in a batch
+    arrays : dict (Optional; Default None)
+        numpy arrays shared with the workers
+    matrices : dict (Optional; Default None)
+        scipy sparse matrices shared with the workers
+    settings : dict (Optional; Default None)
+        Picklable values sent to the workers, e.g., parameters
+    n_jobs : int (Optional; Default 1)
+        Number of processes. If 1, the batches are run in this process.
+    seed : int (Optional; Default 0)
+        Seed of the random numbers
+
+    Returns
+    -------
+    total : object
+        Reduced results of the batches, or None if num_samples is 0
+    """
+    tasks = [(run_batch, s, n) for s, n in batch_seeds(num_samples, batch_size, seed)]
+    total = None
+    with sharedmem.shared(arrays=arrays, matrices=matrices) as handle:
+        if n_jobs > 1:
+            with Pool(n_jobs, initializer=_init_worker, initargs=(handle, settings)) as pool:
+                for result in pool.imap_unordered(_run_task, tasks):
+                    total = result if total is None else reduce(total, result)
+        else:
+            _init_worker(handle, settings)
+            try:
+                for task in tasks:
+                    result = _run_task(task)
+                    total = result if total is None else reduce(total, result)
+            finally:
+                _close_worker()
+    return total
+
+
+def _init_worker(handle, settings):
+    arrays, matrices, blocks = sharedmem.attach(handle)
+    _worker.update(arrays)
+    _worker.update(matrices)
+    _worker.update(settings or {})
+    _worker["blocks"] = blocks
+
+
+def _close_worker():
+    blocks = _worker.pop("blocks")
+    _worker.clear()
+    sharedmem.release(blocks, unlink=False)
+
+
+def _run_task(task):
+    run_batch, seed, num_samples = task
+    return run_batch(_worker, seed, num_samples)
@@ -0,0 +1,278 @@
+import os
+import contextlib
+import hashlib
+import pickle
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_pdf import PdfPages
+from multiprocessing import Pool
+from cidre import draw, sharedmem
+
+# State of the worker processes set by _init_worker
+_worker = {}
+
+
+def render_cartels(
+    A_list,
+    cartel_table,
+    theta,
+    pdf_file=None,
+    png_dir=None,
+    layout_cache_dir=None,
+    dc=None,
+    n_jobs=None,
+    figsize=(10, 10),
+    dpi=150,
+):
+    """
+    Draw many citation cartels in parallel
+
+    The cartels are laid out and drawn in a process pool, where the
+    adjacency matrices are shared with the workers through shared memory.
+    The workers save the PNG files and send back the drawn figures, which
+    are written to the PDF file in the order of the pages as they arrive.
+
+    Parameters
+    ----------
+    A_list : dict
+        A_list[key] is the adjacency matrix (scipy sparse matrix) for
+        the network in which the cartels with cartel_table.year == key are detected
+    cartel_table : pandas.DataFrame
+        Table of the cartels with columns year, group_id, node_id,
+        donor_score, recipient_score and name
+    theta : float
+        The threshold for the donor and recipient score
+    pdf_file : str (Optional; Default None)
+        Multi-page PDF file with one cartel per page
+    png_dir : str (Optional; Default None)
+        Directory for the PNG files, one file per cartel
+    layout_cache_dir : str (Optional; Default None)
+        Directory for the layouts. A cached layout is reused as long as
+        the cartel, its subgraph and the geometry parameters of dc are unchanged.
+    dc : draw.DrawCartel (Optional; Default None)
+        Drawer. If not given, DrawCartel with batch rendering is used.
+    n_jobs : int (Optional; Default None)
+        Number of worker processes. If None, the number of CPUs is used.
+    figsize : tuple
+        Size of a figure
+    dpi : int
+        Resolution of the PNG files
+
+    Returns
+    -------
+    keys : list
+        (year, group_id) of the drawn cartels in order of the pages
+    """
+    if dc is None:
+        dc = draw.DrawCartel()
+        dc.batch_rendering = True
+    if n_jobs is None:
+        n_jobs = os.cpu_count()
+    for d in [png_dir, layout_cache_dir]:
+        if d is not None:
+            os.makedirs(d, exist_ok=True)
+
+    tasks = [
+        (
+            year,
+            group_id,
+            cartel.node_id.values,
+            cartel.donor_score.values,
+            cartel.recipient_score.values,
+            cartel.name.values.tolist(),
+        )
+        for (year, group_id), cartel in cartel_table.groupby(["year", "group_id"])
+    ]
+
+    # Share the adjacency matrices with the workers
+    settings = {
+        "dc": dc,
+        "theta": theta,
+        "png_dir": png_dir,
+        "layout_cache_dir": layout_cache_dir,
+        "figsize": figsize,
+        "dpi": dpi,
+        "return_figure": pdf_file is not None,
+    }
+    keys = []
+    with sharedmem.shared(matrices=A_list) as handle, _open_pdf(pdf_file) as pdf:
+        if n_jobs > 1:
+            pool = Pool(n_jobs, initializer=_init_worker, initargs=(handle, settings))
+            results = pool.imap(_layout_and_render, tasks, chunksize=1)
+        else:
+            pool = None
+            _init_worker(handle, settings)
+            results = map(_layout_and_render, tasks)
+        try:
+            for year, group_id, fig in results:
+                if fig is not None:
+                    pdf.savefig(fig)
+                    plt.close(fig)
+                keys.append((year, group_id))
+        finally:
+            if pool is None:
+                _close_worker()
+            else:
+                pool.terminate()
+                pool.join()
+    return keys
+
+
+def cached_layout(
+    dc,
+    A,
+    node_ids,
+    donor_score,
+    recipient_score,
+    theta,
+    node_names,
+    cache_dir=None,
+    context_ids=None,
+    context_names=None,
+):
+    """
+    DrawCartel.layout with an on-disk cache
+
+    Parameters
+    ----------
+    dc : draw.DrawCartel
+        Drawer
+    cache_dir : str (Optional; Default None)
+        Directory for the layouts. If None, the layout is not cached.
+    Other parameters are the same as those for DrawCartel.layout.
+
+    Returns
+    -------
+    layout : dict
+        See DrawCartel.layout
+    """
+    layout_args = (A, node_ids, donor_score, recipient_score, theta, node_names)
+    if cache_dir is None:
+        return dc.layout(*layout_args, context_ids=context_ids, context_names=context_names)
+
+    node_ids = np.array(node_ids)
+    if context_ids is not None:
+        context_ids = np.array(context_ids, dtype=node_ids.dtype)
+    all_ids = node_ids if context_ids is None else np.concatenate([node_ids, context_ids])
+    As = dc.extract_subgraph(A, all_ids)
+    key = layout_key(
+        dc,
+        As,
+        node_ids,
+        donor_score,
+        recipient_score,
+        theta,
+        node_names,
+        context_ids=context_ids,
+        context_names=context_names,
+    )
+    filename = os.path.join(cache_dir, "%s.pickle" % key)
+    if os.path.exists(filename):
+        with open(filename, "rb") as f:
+            return pickle.load(f)
+
+    layout = dc.layout(
+        *layout_args, context_ids=context_ids, context_names=context_names, As=As
+    )
+
+    # Write to a temporary file first since other workers may read the file
+    tmp_filename = "%s.%d" % (filename, os.getpid())
+    with open(tmp_filename, "wb") as f:
+        pickle.dump(layout, f)
+    os.replace(tmp_filename, filename)
+    return layout
+
+
+def layout_key(
+    dc,
+    As,
+    node_ids,
+    donor_score,
+    recipient_score,
+    theta,
+    node_names,
+    context_ids=None,
+    context_names=None,
+):
+    """
+    Hash of the inputs that determine the layout of a cartel
+    """
+    h = hashlib.sha1()
+    if context_ids is None:
+        context_ids = np.zeros(0, dtype=np.int64)
+    arrays = [As.indptr, As.indices, As.data, node_ids, donor_score, recipient_score, context_ids]
+    for arr in arrays:
+        arr = np.ascontiguousarray(arr)
+        h.update(arr.dtype.str.encode())
+        h.update(arr.tobytes())
+    params = [
+        theta,
+        dc.radius,
+        dc.angle_margin,
+        dc.label_width,
+        dc.max_label_width,
+        getattr(dc.edge_norm, "__name__", repr(dc.edge_norm)),
+    ]
+    h.update(repr(params).encode())
+    h.update("\0".join(str(x) for x in node_names).encode())
+    if context_names is not None:
+        h.update(b"\1" + "\0".join(str(x) for x in context_names).encode())
+    return h.hexdigest()
+
+
+def _init_worker(handle, settings):
+    plt.switch_backend("Agg")
+    _worker.update(settings)
+    _, _worker["A_list"], _worker["blocks"] = sharedmem.attach(handle)
+
+
+def _close_worker():
+    _worker.pop("A_list")
+    sharedmem.release(_worker.pop("blocks"), unlink=False)
+
+
+def _layout_and_render(task):
+    year, group_id, node_ids, donor_score, recipient_score, node_names = task
+    dc = _worker["dc"]
+    layout = cached_layout(
+        dc,
+        _worker["A_list"][year],
+        node_ids,
+        donor_score,
+        recipient_score,
+        _worker["theta"],
+        node_names,
+        cache_dir=_worker["layout_cache_dir"],
+    )
+    if _worker["png_dir"] is None and not _worker["return_figure"]:
+        return year, group_id, None
+
+    fig = _render_page(dc, layout, year, group_id, _worker["figsize"])
+    if _worker["png_dir"] is not None:
+        fig.savefig(
+            os.path.join(_worker["png_dir"], "cartel-%s-%s.png" % (year, group_id)),
+            dpi=_worker["dpi"],
+            bbox_inches="tight",
+        )
+    if _worker["return_figure"]:
+        # Detach the figure from pyplot in this process before it is sent back
+        plt.close(fig)
+        return year, group_id, fig
+    plt.close(fig)
+    return year, group_id, None
+
+
+@contextlib.contextmanager
+def _open_pdf(pdf_file):
+    if pdf_file is None:
+        yield None
+    else:
+        with PdfPages(pdf_file) as pdf:
+            yield pdf
+
+
+def _render_page(dc, layout, year, group_id, figsize):
+    fig, ax = plt.subplots(figsize=figsize)
+    dc.render(layout, ax=ax)
+    ax.set_title("{year}, group {gid}".format(year=year, gid=group_id))
+    return fig
@@ -0,0 +1,234 @@
+"""
+Sharing of numpy arrays and scipy sparse matrices with worker processes
+
+The arrays are copied once into named shared memory blocks, and the
+workers attach read-only views of the blocks without copying, so the cost
+of starting a worker does not grow with the size of the network. Only
+the handle, a small picklable dict with the names of the blocks, is sent
+to the workers.
+
+    with sharedmem.shared(arrays={"community_ids": c}, matrices={"A": A}) as handle:
+        with Pool(n_jobs, initializer=init_worker, initargs=(handle,)) as pool:
+            ...
+
+    def init_worker(handle):
+        arrays, matrices, blocks = sharedmem.attach(handle)
+
+The blocks created by this process are freed when the with block ends, by
+release, or at the latest when the process exits.
+"""
+import atexit
+import numpy as np
+from contextlib import contextmanager
+from scipy import sparse
+from multiprocessing import shared_memory
+
+# Blocks created by this process and not yet released
+_created = {}
+
+
+def share_arrays(arrays):
+    """
+    Copy numpy arrays into shared memory blocks
+
+    Parameters
+    ----------
+    arrays : dict
+        Arrays keyed by their names
+
+    Returns
+    -------
+    handle : dict
+        Picklable description of the shared arrays. Pass it to
+        attach_arrays in the worker processes.
+    blocks : list of multiprocessing.shared_memory.SharedMemory
+        The shared memory blocks. The caller keeps them alive and
+        releases them with release once the workers are done.
+    """
+    handle = {}
+    blocks = []
+    try:
+        for key, arr in arrays.items():
+            arr = np.ascontiguousarray(arr)
+            if arr.dtype == object:
+                raise TypeError("Array %s of objects cannot be shared" % key)
+            block = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+            _created[block.name] = block
+            blocks += [block]
+            np.ndarray(arr.shape, dtype=arr.dtype, buffer=block.buf)[...] = arr
+            handle[key] = {"name": block.name, "shape": arr.shape, "dtype": arr.dtype.str}
+    except BaseException:
+        release(blocks)
+        raise
+    return handle, blocks
+
+
+def attach_arrays(handle):
+    """
+    Views of the arrays shared by share_arrays
+
+    Parameters
+    ----------
+    handle : dict
+        Handle given by share_arrays
+
+    Returns
+    -------
+    arrays : dict
+        Read-only arrays keyed by their names. The arrays do not copy the data.
+    blocks : list of multiprocessing.shared_memory.SharedMemory
+        The attached blocks, which must outlive the arrays.
+    """
+    arrays = {}
+    blocks = []
+    for key, spec in handle.items():
+        block = shared_memory.SharedMemory(name=spec["name"])
+        arr = np.ndarray(spec["shape"], dtype=spec["dtype"], buffer=block.buf)
+        arr.flags.writeable = False
+        arrays[key] = arr
+        blocks += [block]
+    return arrays, blocks
+
+
+def share_csr(A):
+    """
+    Copy a scipy sparse matrix into shared memory
+
+    The matrix is shared in the canonical csr format, i.e., with sorted
+    indices and without duplicates, so that scipy never sorts the read-only
+    arrays of the attached matrix in place.
+
+    Parameters
+    ----------
+    A : scipy sparse matrix
+
+    Returns
+    -------
+    handle : dict
+        Picklable description of the matrix. Pass it to attach_csr.
+    blocks : list of multiprocessing.shared_memory.SharedMemory
+        See share_arrays.
+    """
+    A = sparse.csr_matrix(A)
+    if not A.has_canonical_format:
+        A = A.copy()
+        A.sum_duplicates()
+    handle, blocks = share_arrays(
+        {"data": A.data, "indices": A.indices, "indptr": A.indptr}
+    )
+    return {"arrays": handle, "shape": A.shape}, blocks
+
+
+def attach_csr(handle):
+    """
+    csr_matrix backed by the shared memory given by share_csr
+
+    Returns
+    -------
+    A : scipy.sparse.csr_matrix
+        Matrix whose data, indices and indptr are read-only views of the
+        shared memory
+    blocks : list of multiprocessing.shared_memory.SharedMemory
+        See attach_arrays.
+    """
+    arrays, blocks = attach_arrays(handle["arrays"])
+    A = sparse.csr_matrix(
+        (arrays["data"], arrays["indices"], arrays["indptr"]),
+        shape=handle["shape"],
+        copy=False,
+    )
+    A.has_canonical_format = True
+    return A, blocks
+
+
+def share(arrays=None, matrices=None):
+    """
+    Copy arrays and sparse matrices into shared memory
+
+    Parameters
+    ----------
+    arrays : dict (Optional; Default None)
+        numpy arrays keyed by their names
+    matrices : dict (Optional; Default None)
+        scipy sparse matrices keyed by their names
+
+    Returns
+    -------
+    handle : dict
+        Picklable description of the arrays and the matrices. Pass it to attach.
+    blocks : list of multiprocessing.shared_memory.SharedMemory
+        See share_arrays.
+    """
+    blocks = []
+    try:
+        handle = {"arrays": {}, "matrices": {}}
+        handle["arrays"], _blocks = share_arrays(arrays or {})
+        blocks += _blocks
+        for key, A in (matrices or {}).items():
+            handle["matrices"][key], _blocks = share_csr(A)
+            blocks += _blocks
+    except BaseException:
+        release(blocks)
+        raise
+    return handle, blocks
+
+
+def attach(handle):
+    """
+    Views of the arrays and the matrices shared by share
+
+    Returns
+    -------
+    arrays : dict
+        Read-only numpy arrays
+    matrices : dict
+        csr matrices backed by read-only arrays
+    blocks : list of multiprocessing.shared_memory.SharedMemory
+        See attach_arrays.
+    """
+    arrays, blocks = attach_arrays(handle["arrays"])
+    matrices = {}
+    for key, spec in handle["matrices"].items():
+        matrices[key], _blocks = attach_csr(spec)
+        blocks += _blocks
+    return arrays, matrices, blocks
+
+
+@contextmanager
+def shared(arrays=None, matrices=None):
+    """
+    share as a context manager, which releases the blocks on exit
+
+    Yields
+    ------
+    handle : dict
+        Handle given by share
+    """
+    handle, blocks = share(arrays, matrices)
+    try:
+        yield handle
+    finally:
+        release(blocks)
+
+
+def release(blocks, unlink=True):
+    """
+    Close shared memory blocks and, if unlink is True, free them
+    """
+    for block in blocks:
+        block.close()
+        if unlink:
+            _created.pop(block.name, None)
+            try:
+                block.unlink()
+            except FileNotFoundError:  # Already freed
+                pass
+
+
+@atexit.register
+def _release_created():
+    """
+    Free the blocks that the process created but did not release, e.g.,
+    when it is interrupted while the workers are running
+    """
+    release(list(_created.values()))
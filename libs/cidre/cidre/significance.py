@@ -0,0 +1,228 @@
+"""
+Monte Carlo significance of the detected groups
+
+The null networks are sampled from the degree-corrected stochastic block
+model fitted to the network as in filters.calc_p_values_dcsbm, i.e., the
+network with the same expected numbers of citations between the
+communities and the same expected degrees but without cartels. CIDRE is
+run on each null network, and the p-value of a detected group is the
+fraction of the null networks in which CIDRE, run at the cartel score of
+the group, finds a group at least as large:
+
+    p = (1 + number of such null networks) / (1 + number of null networks)
+
+where the cartel score of a group is the smallest max(donor score,
+recipient score) of its members, i.e., the largest threshold at which the
+group is detected. The null networks are compared with the groups found
+anywhere in them, so the p-value accounts for the many groups that CIDRE
+examines in a network.
+
+The dcSBM filter is fitted to each null network. The threshold filter is
+not applied since the null networks have no reference network, which
+leaves more excessive edges in the null networks and makes the p-values
+conservative.
+
+The null networks are sampled in seeded batches by a pool of processes
+that share the fitted parameters (cidre.parallel), so the p-values do not
+depend on the number of processes.
+
+Usage:
+
+    result = significance.group_p_values(
+        A, community_ids, cartel_table, alpha=0.01, num_samples=1000, n_jobs=8
+    )
+"""
+import os
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse import csgraph
+from cidre import cidre, filters, parallel, synthetic, utils
+
+
+def fit_dcsbm(A, community_ids):
+    """
+    Parameters of the degree-corrected stochastic block model fitted to a network
+
+    Parameters
+    ----------
+    A : scipy sparse matrix
+        Adjacency matrix
+    community_ids : numpy.ndarray
+        community_ids[i] is the ID of the community of node i
+
+    Returns
+    -------
+    params : dict
+        Lambda, theta_out and theta_in for synthetic.sample_dcsbm, and community_ids
+    """
+    community_ids = np.asarray(community_ids)
+    C_SBM = utils.to_community_matrix(community_ids)
+    Lambda = sparse.csr_matrix(C_SBM.T @ A @ C_SBM)
+    K = Lambda.shape[0]
+    params = {"Lambda": Lambda.toarray(), "community_ids": community_ids}
+    for name, axis in [("theta_out", 1), ("theta_in", 0)]:
+        deg = np.array(A.sum(axis=axis)).reshape(-1)
+        block_deg = np.bincount(community_ids, weights=deg, minlength=K)
+
+        # The nodes of the communities without edges are never sampled
+        no_edges = block_deg[community_ids] <= 0
+        theta = deg / np.maximum(block_deg[community_ids], 1.0)
+        theta[no_edges] = 1.0
+        params[name] = theta
+    return params
+
+
+def group_p_values(
+    A,
+    community_ids,
+    cartel_table,
+    alpha=0.01,
+    num_samples=1000,
+    batch_size=10,
+    min_group_edge_num=0,
+    n_jobs=1,
+    seed=0,
+):
+    """
+    Empirical p-values of the detected groups under the dcSBM
+
+    Parameters
+    ----------
+    A : scipy sparse matrix
+        Adjacency matrix in which the groups are detected
+    community_ids : numpy.ndarray
+        community_ids[i] is the ID of the community of node i in the dcSBM filter
+    cartel_table : pandas.DataFrame
+        Table given by cidre.detect
+    alpha : float (Optional; Default 0.01)
+        Significance level of the dcSBM filter
+    num_samples : int (Optional; Default 1000)
+        Number of null networks
+    batch_size : int (Optional; Default 10)
+        Number of null networks sampled at once by a process
+    min_group_edge_num : int (Optional; Default 0)
+        Same as that for cidre.detect. The null groups with fewer edges are ignored.
+    n_jobs : int (Optional; Default 1)
+        Number of processes. If None, the number of CPUs.
+    seed : int (Optional; Default 0)
+        Seed of the random numbers
+
+    Returns
+    -------
+    result : pandas.DataFrame
+        One row per group with the columns group_id, size, cartel_score,
+        num_exceeded (number of the null networks with a group at least as
+        large at the cartel score of the group) and p_value
+    """
+    if n_jobs is None:
+        n_jobs = os.cpu_count()
+    gids, g = np.unique(cartel_table["group_id"].values, return_inverse=True)
+    cartel_score = np.maximum(
+        cartel_table["donor_score"].values, cartel_table["recipient_score"].values
+    )
+    sizes = np.bincount(g)
+    scores = pd.Series(cartel_score).groupby(g).min().values
+
+    params = fit_dcsbm(A, community_ids)
+    params.update({"sizes": sizes, "scores": scores})
+    settings = {"alpha": alpha, "min_group_edge_num": min_group_edge_num}
+
+    num_exceeded = parallel.run_batches(
+        _run_batch,
+        np.add,
+        num_samples,
+        batch_size,
+        arrays=params,
+        settings=settings,
+        n_jobs=n_jobs,
+        seed=seed,
+    )
+    if num_exceeded is None:
+        num_exceeded = np.zeros(gids.size, dtype=int)
+
+    return pd.DataFrame(
+        {
+            "group_id": gids,
+            "size": sizes,
+            "cartel_score": scores,
+            "num_exceeded": num_exceeded,
+            "p_value": (1 + num_exceeded) / (1 + num_samples),
+        }
+    )
+
+
+def exceedances(A, community_ids, sizes, scores, alpha, min_group_edge_num=0):
+    """
+    Find whether CIDRE finds a group at least as large as each given group in a network
+
+    Parameters
+    ----------
+    A : scipy sparse matrix
+        Adjacency matrix, e.g., of a null network
+    community_ids : numpy.ndarray
+        community_ids[i] is the ID of the community of node i
+    sizes : numpy.ndarray
+        Number of members of the groups
+    scores : numpy.ndarray
+        Cartel scores of the groups
+    alpha : float
+        Significance level of the dcSBM filter
+    min_group_edge_num : int (Optional; Default 0)
+        Groups with at most this number of edges are ignored
+
+    Returns
+    -------
+    exceeded : numpy.ndarray
+        exceeded[k] is True if CIDRE with threshold scores[k] finds a group
+        with at least sizes[k] nodes
+    """
+    is_excessive = filters.get_dcSBM_filter(A, community_ids, alpha)
+    A_pruned = sparse.csr_matrix(cidre._prune(A, is_excessive))
+    _, _, critical_threshold = cidre._critical_thresholds(A, A_pruned)
+
+    # The group U found for a threshold consists of the nodes with a
+    # critical threshold at least the threshold
+    exceeded = np.zeros(len(scores), dtype=bool)
+    for level in np.unique(scores):
+        nodes = np.where(critical_threshold >= level)[0]
+        if nodes.size == 0:
+            break
+        _, labels = csgraph.connected_components(
+            A_pruned[nodes, :][:, nodes], directed=True, connection="weak"
+        )
+        src, dst, w = utils.find_non_self_loop_edges(A[nodes, :][:, nodes])
+        internal = labels[src] == labels[dst]
+        num_edges = np.bincount(
+            labels[src[internal]], weights=w[internal], minlength=labels.max() + 1
+        )
+        group_sizes = np.bincount(labels)[num_edges > min_group_edge_num]
+        at_level = scores == level
+        exceeded[at_level] = np.max(group_sizes, initial=0) >= sizes[at_level]
+    return exceeded
+
+
+def _run_batch(worker, seed, num_samples):
+    """
+    Number of the null networks in a batch in which each group is exceeded
+    """
+    rng = np.random.default_rng(seed)
+    A_list = synthetic.sample_dcsbm_batch(
+        worker["Lambda"],
+        worker["theta_out"],
+        worker["theta_in"],
+        worker["community_ids"],
+        num_samples,
+        rng,
+    )
+    num_exceeded = np.zeros(worker["sizes"].size, dtype=int)
+    for A_null in A_list:
+        num_exceeded += exceedances(
+            A_null,
+            worker["community_ids"],
+            worker["sizes"],
+            worker["scores"],
+            worker["alpha"],
+            worker["min_group_edge_num"],
+        )
+    return num_exceeded
@@ -0,0 +1,316 @@
+"""
+Bootstrap stability of the detected groups
+
+The weights of the edges are resampled many times, and CIDRE (the dcSBM
+and threshold filters, the peeling and the partition into groups) is run
+on each replicate. The replicates share the sparsity pattern of the
+network, i.e., a replicate is a vector of weights aligned with A.data, so
+that the csr structure is built once and the filters and the peeling of
+a replicate only work on the weight vector. An edge whose resampled
+weight is zero is treated as absent.
+
+The weights are resampled by
+
+    poisson  : w' ~ Poisson(w), the noise of the citation counts
+    thinning : w' ~ Binomial(w, 1 - drop_frac), dropping each citation
+               with probability drop_frac. It approximates dropping a
+               fraction of the citing papers, whose citations are dropped
+               together.
+
+The threshold filter uses the reference network as given.
+
+The replicates are processed in seeded batches by a pool of processes
+that share the network (cidre.parallel), so the results do not depend on
+the number of processes.
+
+Usage:
+
+    result = stability.bootstrap(
+        A, A_ref, community_ids, cartel_table, threshold=0.15, alpha=0.01,
+        ref_frac_weight=0.5, num_samples=200, n_jobs=8,
+    )
+    result["comembership"]       # Fraction of the replicates in which two nodes are grouped
+    result["group_table"]        # Stability of the detected groups
+"""
+import os
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse import csgraph
+from cidre import cidre, filters, groups, parallel
+
+
+def resample_weights(w, num_samples, method="poisson", drop_frac=0.1, rng=None):
+    """
+    Resampled weights of the edges
+
+    Parameters
+    ----------
+    w : numpy.ndarray
+        Weights of the edges, e.g., A.data of a csr matrix
+    num_samples : int
+        Number of replicates
+    method : "poisson" or "thinning" (Optional; Default "poisson")
+        See the module docstring
+    drop_frac : float (Optional; Default 0.1)
+        Probability of dropping a citation for the thinning
+    rng : numpy.random.Generator, int or None (Optional; Default None)
+        Random number generator or its seed
+
+    Returns
+    -------
+    W : numpy.ndarray
+        W[r] is the weights of the edges in replicate r
+    """
+    rng = np.random.default_rng(rng)
+    w = np.asarray(w)
+    if method == "poisson":
+        return rng.poisson(w, size=(num_samples, w.size)).astype(float)
+    if method == "thinning":
+        return rng.binomial(
+            np.round(w).astype(np.int64), 1 - drop_frac, size=(num_samples, w.size)
+        ).astype(float)
+    raise ValueError("Unknown resampling method: %s" % method)
+
+
+def bootstrap(
+    A,
+    A_ref,
+    community_ids,
+    cartel_table,
+    threshold,
+    alpha,
+    ref_frac_weight=1.0,
+    min_group_edge_num=0,
+    method="poisson",
+    drop_frac=0.1,
+    num_samples=100,
+    batch_size=10,
+    n_jobs=1,
+    seed=0,
+):
+    """
+    Stability of the groups detected by CIDRE under resampling of the weights
+
+    Parameters
+    ----------
+    A : scipy sparse matrix
+        Adjacency matrix
+    A_ref : scipy sparse matrix
+        Reference network of the threshold filter
+    community_ids : numpy.ndarray
+        community_ids[i] is the ID of the community of node i
+    cartel_table : pandas.DataFrame
+        Table given by cidre.detect for the network
+    threshold, alpha, ref_frac_weight, min_group_edge_num :
+        Same as those for filters.get_dcsbm_threshold_filter and cidre.detect
+    method, drop_frac :
+        Same as those for resample_weights
+    num_samples : int (Optional; Default 100)
+        Number of replicates
+    batch_size : int (Optional; Default 10)
+        Number of replicates resampled at once by a process
+    n_jobs : int (Optional; Default 1)
+        Number of processes. If None, the number of CPUs.
+    seed : int (Optional; Default 0)
+        Seed of the random numbers
+
+    Returns
+    -------
+    result : dict
+        - node_frequency : numpy.ndarray. Fraction of the replicates in
+          which each node is in a group
+        - comembership : scipy.sparse.csr_matrix. comembership[i, j] is
+          the fraction of the replicates in which nodes i and j are in the
+          same group
+        - group_comembership : scipy.sparse.csr_matrix. group_comembership[k, i]
+          is the fraction of the replicates in which node i is in the
+          same group as a member of the kth detected group
+        - group_table : pandas.DataFrame. One row per detected group with
+          the columns group_id, size, mean_jaccard (the Jaccard index with
+          the most similar group in a replicate, averaged over the
+          replicates), match_frequency (fraction of the replicates with a
+          group whose Jaccard index is at least 0.5) and member_frequency
+          (fraction of the replicates in which a member is in the same group
+          as the other members, averaged over the pairs of the members)
+    """
+    if n_jobs is None:
+        n_jobs = os.cpu_count()
+    A = sparse.csr_matrix(A, dtype=float)
+    A.sum_duplicates()
+    N = A.shape[0]
+    rows = np.repeat(np.arange(N), np.diff(A.indptr))
+    w_th = np.array(sparse.csr_matrix(A_ref)[rows, A.indices]).reshape(-1) * ref_frac_weight
+
+    gids, g = np.unique(cartel_table["group_id"].values, return_inverse=True)
+    U_obs = groups.membership_matrix(cartel_table["node_id"].values, g, N, gids.size)
+
+    arrays = {
+        "w_th": w_th,
+        "community_ids": np.asarray(community_ids),
+        "obs_node_ids": cartel_table["node_id"].values,
+        "obs_group_ids": g,
+    }
+    settings = {
+        "threshold": threshold,
+        "alpha": alpha,
+        "min_group_edge_num": min_group_edge_num,
+        "method": method,
+        "drop_frac": drop_frac,
+        "num_groups": gids.size,
+    }
+
+    total = parallel.run_batches(
+        _run_batch,
+        _add_counts,
+        num_samples,
+        batch_size,
+        arrays=arrays,
+        matrices={"A": A},
+        settings=settings,
+        n_jobs=n_jobs,
+        seed=seed,
+    )
+
+    comembership = sparse.csr_matrix(total["comembership"] / num_samples)
+    group_comembership = sparse.csr_matrix(total["group_comembership"] / num_samples)
+
+    # Average of the co-membership over the pairs of the members
+    size = groups.group_sizes(U_obs)
+    C_obs = sparse.csr_matrix(U_obs.T @ comembership @ U_obs).diagonal()
+    num_pairs = np.maximum(size * (size - 1), 1)
+    group_table = pd.DataFrame(
+        {
+            "group_id": gids,
+            "size": size.astype(int),
+            "mean_jaccard": total["jaccard"] / num_samples,
+            "match_frequency": total["matched"] / num_samples,
+            "member_frequency": (C_obs - total["node_in_obs"] / num_samples) / num_pairs,
+        }
+    )
+    return {
+        "node_frequency": total["node"] / num_samples,
+        "comembership": comembership,
+        "group_comembership": group_comembership,
+        "group_table": group_table,
+    }
+
+
+def detect_labels(A, A_ref_th, community_ids, threshold, alpha, min_group_edge_num=0):
+    """
+    Groups detected by CIDRE as labels of the nodes
+
+    Unlike cidre.detect, the network is not rebuilt to remove the edges
+    with zero weight and the edges pruned by the filters; the edges are
+    masked instead.
+
+    Parameters
+    ----------
+    A : scipy.sparse.csr_matrix
+        Adjacency matrix, which may have explicit zeros
+    A_ref_th : numpy.ndarray
+        Threshold weights of the threshold filter aligned with A.data, i.e.,
+        ref_frac_weight times the weight of the edge in the reference network
+    community_ids, threshold, alpha, min_group_edge_num :
+        Same as those for bootstrap
+
+    Returns
+    -------
+    labels : numpy.ndarray
+        labels[i] is the ID of the group of node i, or -1 if node i is not in a group
+    """
+    N = A.shape[0]
+    rows = np.repeat(np.arange(N), np.diff(A.indptr))
+    cols = A.indices
+    w = A.data
+    is_edge = (rows != cols) & (w > 0)
+
+    # dcSBM filter
+    indeg = np.bincount(cols, weights=w, minlength=N)
+    outdeg = np.bincount(rows, weights=w, minlength=N)
+    K = np.max(community_ids) + 1
+    Lambda = np.bincount(
+        community_ids[rows] * K + community_ids[cols], weights=w, minlength=K * K
+    ).reshape(K, K)
+    edges = np.where(is_edge)[0]
+    p_value = filters.calc_edge_p_values_dcsbm(
+        rows[edges], cols[edges], w[edges], community_ids, indeg, outdeg, Lambda
+    )
+    is_excessive = np.zeros(w.size, dtype=bool)
+    is_excessive[edges] = filters.benjamini_hochberg_test(p_value, alpha)
+
+    # Threshold filter
+    is_excessive &= (w >= A_ref_th) & (A_ref_th > 0)
+
+    # Peeling on the pruned network with the same structure
+    A_pruned = sparse.csr_matrix((w * is_excessive, A.indices, A.indptr), shape=A.shape)
+    U, _, _ = cidre._peel(A, A_pruned, threshold)
+
+    # Weakly connected components of U, excluding the isolated nodes
+    in_U = U > 0
+    e = is_excessive & in_U[rows] & in_U[cols]
+    A_U = sparse.csr_matrix((np.ones(np.sum(e)), (rows[e], cols[e])), shape=(N, N))
+    _, labels = csgraph.connected_components(A_U, directed=True, connection="weak")
+    is_member = in_U & (np.bincount(rows[e], minlength=N) + np.bincount(cols[e], minlength=N) > 0)
+    labels = np.where(is_member, labels, -1)
+
+    # Remove the groups with at most min_group_edge_num edges
+    internal = is_edge & (labels[rows] >= 0) & (labels[rows] == labels[cols])
+    num_edges = np.bincount(labels[rows[internal]], weights=w[internal], minlength=N)
+    labels[(labels >= 0) & (num_edges[np.maximum(labels, 0)] <= min_group_edge_num)] = -1
+
+    # Contiguous IDs
+    _, labels[labels >= 0] = np.unique(labels[labels >= 0], return_inverse=True)
+    return labels
+
+
+def _add_counts(total, counts):
+    return {k: total[k] + counts[k] for k in total}
+
+
+def _run_batch(worker, seed, num_samples):
+    """
+    Counts of the co-memberships in a batch of replicates
+    """
+    rng = np.random.default_rng(seed)
+    A_shared = worker["A"]
+    N = A_shared.shape[0]
+    G = worker["num_groups"]
+    U_obs = groups.membership_matrix(worker["obs_node_ids"], worker["obs_group_ids"], N, G)
+
+    W = resample_weights(A_shared.data, num_samples, worker["method"], worker["drop_frac"], rng)
+    counts = {
+        "node": np.zeros(N),
+        "node_in_obs": np.zeros(G),
+        "comembership": sparse.csr_matrix((N, N)),
+        "group_comembership": sparse.csr_matrix((G, N)),
+        "jaccard": np.zeros(G),
+        "matched": np.zeros(G),
+    }
+    for w in W:
+        A = sparse.csr_matrix((w, A_shared.indices, A_shared.indptr), shape=(N, N), copy=False)
+        labels = detect_labels(
+            A,
+            worker["w_th"],
+            worker["community_ids"],
+            worker["threshold"],
+            worker["alpha"],
+            worker["min_group_edge_num"],
+        )
+        nodes = np.where(labels >= 0)[0]
+        U = groups.membership_matrix(nodes, labels[nodes], N, np.max(labels, initial=-1) + 1)
+        counts["node"][nodes] += 1
+        counts["node_in_obs"] += np.array(U_obs[nodes, :].sum(axis=0)).reshape(-1)
+        counts["comembership"] = counts["comembership"] + U @ U.T
+
+        # Nodes grouped with a member of each detected group
+        touched = sparse.csr_matrix(U_obs.T @ U)
+        touched.data = np.ones_like(touched.data)
+        reached = sparse.csr_matrix(touched @ U.T)
+        reached.data = np.ones_like(reached.data)
+        counts["group_comembership"] = counts["group_comembership"] + reached
+
+        _, score = groups.best_match(groups.jaccard(U_obs, U))
+        counts["jaccard"] += score
+        counts["matched"] += score >= 0.5
+    return counts
@@ -0,0 +1,469 @@
+"""
+Columnar store of the detected cartels
+
+The cartels detected in all years are stored in one directory, with one
+.npy file per column, loaded as read-only memory maps. The rows are sorted
+by year and group, and the store keeps indexes by year, by group, and by
+the node label (e.g., the MAG journal id), so that the rows of a year, of
+a set of groups, or of the groups containing a set of nodes are found
+without scanning the table.
+
+Each group is given a gross_group_id unique across years, where the
+group_id of year y is shifted by one plus the largest gross_group_id of
+the preceding years.
+
+The store can also hold the statistics of the groups given by
+cidre.summarize and the lineage of the groups given by cidre.lineage.track,
+one row per group.
+
+Usage:
+
+    store = CartelStore.from_tables({2018: table_2018, 2019: table_2019})
+    store.save("data/mag/cartels/store")
+
+    store = CartelStore.open("data/mag/cartels/store")
+    store.year(2019)                           # Rows of a year
+    store.groups([3, 5])                       # Rows of groups by gross_group_id
+    store.groups_containing([1234, 5678])      # gross_group_ids containing the nodes
+    store.group_stats([2019])                  # Statistics of the groups of a year
+    store.group_lineage()                      # Lineage of the groups
+
+The lineage is computed after the detection and saved by save_lineage in a
+directory of its own, e.g., data/mag/cartels/store-lineage, which is
+attached by CartelStore.open("data/mag/cartels/store", lineage_path=...).
+"""
+import os
+import json
+import shutil
+import warnings
+import numpy as np
+import pandas as pd
+from cidre import cidre
+from cidre import cache as artifact_cache
+
+META_FILE = "meta.json"
+INDEX_ARRAYS = ["years", "year_indptr", "group_indptr", "node_order", "node_keys"]
+
+
+class CartelStore:
+    """
+    Columnar store of the detected cartels
+
+    Parameters
+    ----------
+    columns : dict
+        Columns of the table sorted by year and group
+    index : dict
+        Index arrays given by CartelStore.from_tables
+    node_col : str
+        Column of the node labels
+    stats : dict (Optional; Default None)
+        Columns of the statistics of the groups sorted by gross_group_id
+    lineage : dict (Optional; Default None)
+        Columns of the lineage table given by cidre.lineage.track
+    """
+
+    def __init__(self, columns, index, node_col, stats=None, lineage=None):
+        self.columns = columns
+        self.index = index
+        self.node_col = node_col
+        self.stats = stats
+        self.lineage = lineage
+
+    @classmethod
+    def from_tables(cls, tables, node_col="mag_journal_id", group_stats=None):
+        """
+        Build the store from the tables of the years
+
+        Parameters
+        ----------
+        tables : dict
+            tables[year] is the table given by cidre.detect for the year,
+            with the column node_col
+        node_col : str (Optional; Default "mag_journal_id")
+            Column of the node labels
+        group_stats : dict (Optional; Default None)
+            group_stats[year] is the table given by cidre.summarize for the year
+
+        Returns
+        -------
+        store : CartelStore
+        """
+        years = np.array(sorted(tables.keys()), dtype=int)
+        tables = [
+            tables[year].drop(columns=["Unnamed: 0", "year", "gross_group_id"], errors="ignore")
+            for year in years
+        ]
+        names = list(tables[0].columns) if tables else [node_col, "group_id"]
+
+        # Shift the group ids to make them unique across the years
+        gross_group_ids = []
+        offsets = []
+        offset = 0
+        for table in tables:
+            gross = table["group_id"].values.astype(int) + offset
+            offsets.append(offset)
+            offset = max(offset, np.max(gross, initial=-1) + 1)
+            gross_group_ids.append(gross)
+
+        num_rows = np.array([table.shape[0] for table in tables], dtype=int)
+        columns = {
+            name: np.concatenate([table[name].values for table in tables])
+            if tables
+            else np.zeros(0, dtype=int)
+            for name in names
+        }
+        columns["year"] = np.repeat(years, num_rows)
+        columns["gross_group_id"] = (
+            np.concatenate(gross_group_ids) if tables else np.zeros(0, dtype=int)
+        )
+        for name, col in columns.items():
+            if col.dtype == object:
+                columns[name] = col.astype(str)
+
+        # Sort the rows by group, and thus by year
+        order = np.argsort(columns["gross_group_id"], kind="stable")
+        columns = {name: col[order] for name, col in columns.items()}
+
+        # Indexes
+        node_order = np.argsort(columns[node_col], kind="stable")
+        index = {
+            "years": years,
+            "year_indptr": np.concatenate([[0], np.cumsum(num_rows)]),
+            "group_indptr": np.searchsorted(
+                columns["gross_group_id"], np.arange(offset + 1), side="left"
+            ),
+            "node_order": node_order,
+            "node_keys": columns[node_col][node_order],
+        }
+
+        stats = None
+        if group_stats is not None:
+            stats = pd.concat(
+                [
+                    group_stats[year]
+                    .drop(columns=["year", "gross_group_id"], errors="ignore")
+                    .assign(year=year, gross_group_id=group_stats[year]["group_id"] + off)
+                    for year, off in zip(years, offsets)
+                    if year in group_stats
+                ],
+                ignore_index=True,
+            ).sort_values("gross_group_id", kind="stable")
+            stats = {name: stats[name].values for name in stats.columns}
+        return cls(columns, index, node_col, stats)
+
+    @classmethod
+    def open(cls, path, lineage_path=None):
+        """
+        Open a store saved by CartelStore.save. The arrays are memory-mapped.
+
+        Parameters
+        ----------
+        path : str
+            Directory of the store
+        lineage_path : str (Optional; Default None)
+            Directory of the lineage saved by CartelStore.save_lineage. If
+            given, the lineage is read from there instead of from the store.
+            The lineage is ignored with a warning if it was computed for
+            other groups, e.g., before a year of the store was replaced.
+        """
+        with open(os.path.join(path, META_FILE), "r") as f:
+            meta = json.load(f)
+        load = lambda name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+        columns = {name: load("col-" + name) for name in meta["columns"]}
+        index = {name: load("index-" + name) for name in INDEX_ARRAYS}
+        stats = None
+        if meta.get("stat_columns") is not None:
+            stats = {name: load("stat-" + name) for name in meta["stat_columns"]}
+        lineage = None
+        if lineage_path is None and meta.get("lineage_columns") is not None:
+            lineage = {name: load("lineage-" + name) for name in meta["lineage_columns"]}
+        store = cls(columns, index, meta["node_col"], stats, lineage)
+        if lineage_path is not None:
+            lineage, fingerprint = _load_lineage(lineage_path)
+            if fingerprint == store.fingerprint():
+                store.lineage = lineage
+            else:
+                warnings.warn(
+                    "The lineage in %s is ignored since it does not match the store %s"
+                    % (lineage_path, path)
+                )
+        return store
+
+    def save(self, path):
+        """
+        Save the store into a directory, replacing the existing one
+        """
+        tmp_path = "%s.tmp.%d" % (path.rstrip("/"), os.getpid())
+        os.makedirs(tmp_path, exist_ok=True)
+        for name, col in self.columns.items():
+            np.save(os.path.join(tmp_path, "col-" + name + ".npy"), np.asarray(col))
+        for name in INDEX_ARRAYS:
+            np.save(os.path.join(tmp_path, "index-" + name + ".npy"), self.index[name])
+        for name, col in (self.stats or {}).items():
+            np.save(os.path.join(tmp_path, "stat-" + name + ".npy"), np.asarray(col))
+        for name, col in (self.lineage or {}).items():
+            np.save(os.path.join(tmp_path, "lineage-" + name + ".npy"), np.asarray(col))
+        with open(os.path.join(tmp_path, META_FILE), "w") as f:
+            json.dump(
+                {
+                    "columns": list(self.columns.keys()),
+                    "node_col": self.node_col,
+                    "stat_columns": None if self.stats is None else list(self.stats.keys()),
+                    "lineage_columns": None
+                    if self.lineage is None
+                    else list(self.lineage.keys()),
+                },
+                f,
+            )
+        _replace_dir(tmp_path, path)
+
+    def save_lineage(self, path):
+        """
+        Save the lineage of the groups into a directory of its own, replacing
+        the existing one, so that the store itself is not rewritten. The
+        lineage is read back by CartelStore.open(store_path, lineage_path=path).
+        """
+        if self.lineage is None:
+            raise ValueError("The store does not hold the lineage. See with_lineage.")
+        tmp_path = "%s.tmp.%d" % (path.rstrip("/"), os.getpid())
+        os.makedirs(tmp_path, exist_ok=True)
+        for name, col in self.lineage.items():
+            np.save(os.path.join(tmp_path, "lineage-" + name + ".npy"), np.asarray(col))
+        with open(os.path.join(tmp_path, META_FILE), "w") as f:
+            json.dump(
+                {
+                    "lineage_columns": list(self.lineage.keys()),
+                    "store_fingerprint": self.fingerprint(),
+                },
+                f,
+            )
+        _replace_dir(tmp_path, path)
+
+    def fingerprint(self):
+        """
+        Fingerprint of the groups in the store, given by the number of rows
+        and the hashes of the columns gross_group_id, year and the node label.
+        A lineage saved by save_lineage belongs to the store with the same
+        fingerprint.
+        """
+        names = ["gross_group_id", "year", self.node_col]
+        hashes = [
+            artifact_cache.hash_input(np.asarray(self.columns[name]))
+            for name in names
+            if name in self.columns
+        ]
+        return "%d-%s" % (self.num_rows, artifact_cache.hash_input(hashes))
+
+    @property
+    def years(self):
+        return np.asarray(self.index["years"])
+
+    @property
+    def num_rows(self):
+        return self.columns["gross_group_id"].size
+
+    def table(self, years=None):
+        """
+        Table of the cartels
+
+        Parameters
+        ----------
+        years : list of int (Optional; Default None)
+            Years to include. If None, all years.
+
+        Returns
+        -------
+        cartel_table : pandas.DataFrame
+        """
+        if years is None:
+            return self.take(np.arange(self.num_rows))
+        years = np.atleast_1d(np.asarray(years, dtype=int))
+        pos = np.searchsorted(self.years, years)
+        found = pos < self.years.size
+        found[found] = self.years[pos[found]] == years[found]
+        pos = pos[found]
+        indptr = self.index["year_indptr"]
+        return self.take(_ranges(indptr[pos], indptr[pos + 1]))
+
+    def year(self, year):
+        """
+        Rows of a year
+        """
+        return self.table([year])
+
+    def with_tables(self, tables, group_stats=None):
+        """
+        Store in which the tables of the given years are added or replaced
+
+        The lineage of the groups is dropped since the groups change. A
+        lineage saved apart by save_lineage no longer matches the fingerprint
+        of the new store and is ignored by open.
+
+        Parameters
+        ----------
+        tables : dict
+            tables[year] is the table for the year
+        group_stats : dict (Optional; Default None)
+            group_stats[year] is the statistics of the groups for the year
+
+        Returns
+        -------
+        store : CartelStore
+        """
+        merged = {int(year): self.year(year) for year in self.years}
+        merged.update(tables)
+        merged_stats = None
+        if self.stats is not None and group_stats is not None:
+            merged_stats = {int(year): self.group_stats([year]) for year in self.years}
+            merged_stats.update(group_stats)
+        return CartelStore.from_tables(merged, self.node_col, merged_stats)
+
+    def group_stats(self, years=None):
+        """
+        Statistics of the groups
+
+        If the store does not hold the statistics, the ones that do not
+        need the network (e.g., the size and the score quantiles) are
+        computed from the table, and the others are NaN.
+
+        Parameters
+        ----------
+        years : list of int (Optional; Default None)
+            Years to include. If None, all years.
+
+        Returns
+        -------
+        stats : pandas.DataFrame
+            Table given by cidre.summarize with the columns year and gross_group_id
+        """
+        if self.stats is None:
+            table = self.table(years)
+            stats = cidre.summarize(None, table, group_col="gross_group_id")
+            first = np.unique(table["gross_group_id"].values, return_index=True)[1]
+            stats["year"] = table["year"].values[first]
+            stats["group_id"] = table["group_id"].values[first]
+            return stats
+        stats = pd.DataFrame({name: np.asarray(col) for name, col in self.stats.items()})
+        if years is not None:
+            stats = stats[np.isin(stats["year"].values, years)].reset_index(drop=True)
+        return stats
+
+    def with_lineage(self, lineage_table):
+        """
+        Store with the lineage of the groups
+
+        Parameters
+        ----------
+        lineage_table : pandas.DataFrame
+            Table given by cidre.lineage.track for the groups in the store
+
+        Returns
+        -------
+        store : CartelStore
+        """
+        lineage_table = lineage_table.sort_values("gross_group_id", kind="stable")
+        lineage = {}
+        for name in lineage_table.columns:
+            col = lineage_table[name].values
+            lineage[name] = col.astype(str) if col.dtype == object else col
+        return CartelStore(self.columns, self.index, self.node_col, self.stats, lineage)
+
+    def group_lineage(self, years=None):
+        """
+        Lineage of the groups
+
+        Parameters
+        ----------
+        years : list of int (Optional; Default None)
+            Years to include. If None, all years.
+
+        Returns
+        -------
+        lineage_table : pandas.DataFrame
+            Table given by cidre.lineage.track, or None if the store does
+            not hold the lineage
+        """
+        if self.lineage is None:
+            return None
+        table = pd.DataFrame({name: np.asarray(col) for name, col in self.lineage.items()})
+        if years is not None:
+            table = table[np.isin(table["year"].values, years)].reset_index(drop=True)
+        return table
+
+    def groups(self, gross_group_ids):
+        """
+        Rows of the groups
+
+        Parameters
+        ----------
+        gross_group_ids : numpy.ndarray
+            gross_group_id of the groups
+
+        Returns
+        -------
+        cartel_table : pandas.DataFrame
+        """
+        gids = np.unique(np.asarray(gross_group_ids, dtype=int))
+        indptr = self.index["group_indptr"]
+        gids = gids[(gids >= 0) & (gids < indptr.size - 1)]
+        return self.take(_ranges(indptr[gids], indptr[gids + 1]))
+
+    def rows_containing(self, nodes):
+        """
+        Positions of the rows of the nodes
+        """
+        nodes = np.asarray(nodes)
+        keys = self.index["node_keys"]
+        start = np.searchsorted(keys, nodes, side="left")
+        end = np.searchsorted(keys, nodes, side="right")
+        return np.sort(np.asarray(self.index["node_order"])[_ranges(start, end)])
+
+    def groups_containing(self, nodes):
+        """
+        gross_group_id of the groups that contain at least one of the nodes
+        """
+        rows = self.rows_containing(np.atleast_1d(nodes))
+        return np.unique(self.columns["gross_group_id"][rows])
+
+    def take(self, rows):
+        """
+        Table of the rows at the positions
+        """
+        return pd.DataFrame({name: np.asarray(col[rows]) for name, col in self.columns.items()})
+
+
+def _load_lineage(path):
+    """
+    Lineage saved by CartelStore.save_lineage and the fingerprint of its store
+    """
+    with open(os.path.join(path, META_FILE), "r") as f:
+        meta = json.load(f)
+    lineage = {
+        name: np.load(os.path.join(path, "lineage-" + name + ".npy"), mmap_mode="r")
+        for name in meta["lineage_columns"]
+    }
+    return lineage, meta.get("store_fingerprint")
+
+
+def _replace_dir(tmp_path, path):
+    """
+    Move the directory tmp_path to path, replacing the existing one
+    """
+    if os.path.exists(path):
+        old_path = "%s.old.%d" % (path.rstrip("/"), os.getpid())
+        os.rename(path, old_path)
+        os.rename(tmp_path, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+    else:
+        os.rename(tmp_path, path)
+
+
+def _ranges(starts, ends):
+    """
+    Concatenation of np.arange(starts[i], ends[i]) for all i
+    """
+    starts = np.asarray(starts, dtype=int)
+    lengths = np.maximum(np.asarray(ends, dtype=int) - starts, 0)
+    shift = starts - np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    return np.repeat(shift, lengths) + np.arange(np.sum(lengths))
@@ -0,0 +1,232 @@
+import numpy as np
+from scipy import sparse
+
+
+def sample_dcsbm(Lambda, theta_out, theta_in, community_ids, rng=None):
+    """
+    Sample a directed multigraph from the degree-corrected stochastic block model
+
+    Parameters
+    ----------
+    Lambda : numpy.ndarray or scipy sparse matrix
+        Lambda[k, l] is the expected number of edges from community k to community l
+    theta_out : numpy.ndarray
+        Out-degree parameter of the nodes. The parameters are normalized
+        such that they sum to one within each community.
+    theta_in : numpy.ndarray
+        In-degree parameter of the nodes, normalized in the same way as theta_out
+    community_ids : numpy.ndarray
+        community_ids[i] is the ID of the community to which node i belongs
+    rng : numpy.random.Generator, int or None (Optional; Default None)
+        Random number generator or its seed
+
+    Returns
+    -------
+    A : scipy sparse matrix
+        Adjacency matrix, where A[i,j] is the number of edges from node i to node j
+    """
+    rng = np.random.default_rng(rng)
+    if sparse.issparse(Lambda):
+        Lambda = Lambda.toarray()
+    community_ids = np.asarray(community_ids)
+    N = community_ids.size
+
+    # Number of edges between the communities
+    m = rng.poisson(np.asarray(Lambda, dtype=float))
+    src_block, trg_block = np.nonzero(m)
+    counts = m[src_block, trg_block]
+    src_block = np.repeat(src_block, counts)
+    trg_block = np.repeat(trg_block, counts)
+
+    # End points of the edges
+    src = make_block_sampler(theta_out, community_ids)(src_block, rng)
+    trg = make_block_sampler(theta_in, community_ids)(trg_block, rng)
+
+    return sparse.csr_matrix((np.ones(src.size), (src, trg)), shape=(N, N))
+
+
+def sample_dcsbm_batch(Lambda, theta_out, theta_in, community_ids, num_samples, rng=None):
+    """
+    Sample directed multigraphs from the degree-corrected stochastic block
+    model at once
+
+    The numbers of edges between the communities and the end points of the
+    edges of all samples are drawn by single vectorized calls, which is
+    faster than calling sample_dcsbm for each sample.
+
+    Parameters
+    ----------
+    num_samples : int
+        Number of networks
+    Other parameters are the same as those for sample_dcsbm.
+
+    Returns
+    -------
+    A_list : list of scipy sparse matrix
+        Adjacency matrices of the sampled networks
+    """
+    rng = np.random.default_rng(rng)
+    Lambda = sparse.coo_matrix(Lambda)
+    Lambda.sum_duplicates()
+    community_ids = np.asarray(community_ids)
+    N = community_ids.size
+
+    # Number of edges between the communities, one row per sample
+    m = rng.poisson(Lambda.data.astype(float), size=(num_samples, Lambda.nnz))
+    sample_ids, pair_ids = np.nonzero(m)
+    counts = m[sample_ids, pair_ids]
+    sample_ids = np.repeat(sample_ids, counts)
+    src_block = np.repeat(Lambda.row[pair_ids], counts)
+    trg_block = np.repeat(Lambda.col[pair_ids], counts)
+
+    # End points of the edges
+    src = make_block_sampler(theta_out, community_ids)(src_block, rng)
+    trg = make_block_sampler(theta_in, community_ids)(trg_block, rng)
+
+    bounds = np.searchsorted(sample_ids, np.arange(num_samples + 1))
+    return [
+        sparse.csr_matrix(
+            (np.ones(e - s), (src[s:e], trg[s:e])), shape=(N, N)
+        )
+        for s, e in zip(bounds[:-1], bounds[1:])
+    ]
+
+
+def generate_planted_cartels(
+    num_nodes,
+    num_communities,
+    mean_degree=20,
+    num_cartels=10,
+    cartel_size=(3, 8),
+    cartel_strength=1.0,
+    mixing=0.2,
+    degree_exponent=2.5,
+    rng=None,
+):
+    """
+    Generate a citation network with planted citation cartels
+
+    The network is sampled from the degree-corrected stochastic block model
+    with heavy-tailed degree parameters. Then, the members of each cartel
+    exchange additional citations, where each member gives
+    cartel_strength times its out-degree to the other members on average.
+
+    Parameters
+    ----------
+    num_nodes : int
+        Number of nodes (journals)
+    num_communities : int
+        Number of communities
+    mean_degree : float
+        Average number of citations given by a node
+    num_cartels : int
+        Number of planted cartels
+    cartel_size : tuple
+        Minimum and maximum number of members of a cartel
+    cartel_strength : float
+        Ratio of the citations within a cartel to the other citations
+        given by its members
+    mixing : float
+        Fraction of the citations that are given irrespective of the communities
+    degree_exponent : float
+        Exponent of the power-law distribution of the degree parameters
+    rng : numpy.random.Generator, int or None (Optional; Default None)
+        Random number generator or its seed
+
+    Returns
+    -------
+    A : scipy sparse matrix
+        Adjacency matrix
+    community_ids : numpy.ndarray
+        community_ids[i] is the ID of the community of node i
+    cartel_ids : numpy.ndarray
+        cartel_ids[i] is the ID of the cartel to which node i belongs.
+        cartel_ids[i] = -1 if node i does not belong to any cartel.
+    """
+    rng = np.random.default_rng(rng)
+
+    # Communities and degree parameters
+    community_ids = rng.integers(num_communities, size=num_nodes)
+    theta_out = rng.pareto(degree_exponent - 1, size=num_nodes) + 1
+    theta_in = rng.pareto(degree_exponent - 1, size=num_nodes) + 1
+    theta_out = _normalize_in_blocks(theta_out, community_ids, num_communities)
+    theta_in = _normalize_in_blocks(theta_in, community_ids, num_communities)
+
+    # Expected number of edges between the communities
+    frac = np.bincount(community_ids, minlength=num_communities) / num_nodes
+    Lambda = (
+        num_nodes
+        * mean_degree
+        * ((1 - mixing) * np.diag(frac) + mixing * np.outer(frac, frac))
+    )
+    A = sample_dcsbm(Lambda, theta_out, theta_in, community_ids, rng)
+
+    # Plant the cartels
+    sizes = rng.integers(cartel_size[0], cartel_size[1] + 1, size=num_cartels)
+    members = rng.choice(num_nodes, size=np.sum(sizes), replace=False)
+    cartel_ids = -np.ones(num_nodes, dtype=int)
+    cartel_ids[members] = np.repeat(np.arange(num_cartels), sizes)
+
+    src, trg = [], []
+    offset = 0
+    for size in sizes:
+        nodes = members[offset : offset + size]
+        offset += size
+        r, c = np.nonzero(~np.eye(size, dtype=bool))
+        src.append(nodes[r])
+        trg.append(nodes[c])
+    src = np.concatenate(src)
+    trg = np.concatenate(trg)
+
+    outdeg = np.array(A.sum(axis=1)).reshape(-1)
+    size_of = np.repeat(sizes, sizes * (sizes - 1))
+    w = rng.poisson(cartel_strength * np.maximum(outdeg[src], 1) / (size_of - 1))
+    A = A + sparse.csr_matrix((w, (src, trg)), shape=A.shape)
+    A.eliminate_zeros()
+
+    return sparse.csr_matrix(A), community_ids, cartel_ids
+
+
+def _normalize_in_blocks(theta, community_ids, num_communities):
+    block_sum = np.bincount(community_ids, weights=theta, minlength=num_communities)
+    return theta / np.maximum(block_sum[community_ids], 1e-32)
+
+
+def make_block_sampler(theta, block_ids):
+    """
+    Make a function that samples nodes from given blocks
+
+    Parameters
+    ----------
+    theta : numpy.ndarray
+        Weight of the nodes. A node is sampled from its block with
+        probability proportional to its weight.
+    block_ids : numpy.ndarray
+        block_ids[i] is the ID of the block to which node i belongs
+
+    Returns
+    -------
+    sample : function
+        sample(blocks, rng) returns one node for each block in blocks.
+        The blocks must contain at least one node.
+    """
+    # Sort the nodes by block, and lay out the blocks on [0, K), where
+    # block k occupies [k, k+1) split in proportion to theta
+    order = np.argsort(block_ids, kind="stable")
+    sorted_blocks = block_ids[order]
+    cum = np.cumsum(theta[order])
+    start = np.searchsorted(sorted_blocks, sorted_blocks, side="left")
+    cum_before = np.where(start > 0, cum[np.maximum(start - 1, 0)], 0)
+    block_total = np.bincount(block_ids, weights=theta)
+    cum = sorted_blocks + (cum - cum_before) / block_total[sorted_blocks]
+
+    def sample(blocks, rng):
+        pos = np.searchsorted(cum, blocks + rng.random(blocks.size), side="right")
+
+        # Guard against the rounding errors at the boundaries of the blocks
+        block_start = np.searchsorted(sorted_blocks, blocks, side="left")
+        block_end = np.searchsorted(sorted_blocks, blocks, side="right")
+        pos = np.minimum(np.maximum(pos, block_start), block_end - 1)
+        return order[pos]
+
+    return sample
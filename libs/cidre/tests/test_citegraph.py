@@ -0,0 +1,142 @@
+import numpy as np
+import pytest
+from scipy import sparse
+from cidre import citegraph
+from cidre.citegraph import CitationGraph
+
+
+def random_lists(rng, num_rows, num_cols, nnz):
+    """
+    Sorted lists with empty rows, including a whole block of them
+    """
+    rows = rng.integers(0, num_rows, nnz)
+    rows = rows[(rows < 8) | (rows >= 24)]
+    A = sparse.csr_matrix(
+        (np.ones(rows.size), (rows, rng.integers(0, num_cols, rows.size))),
+        shape=(num_rows, num_cols),
+    )
+    A.sum_duplicates()
+    return A
+
+
+def test_varints_round_trip():
+    values = np.array([0, 1, 127, 128, 300, 16383, 16384, 2 ** 21, 2 ** 35 + 5, 2 ** 62])
+    encoded, num_bytes = citegraph._encode_varints(values)
+    np.testing.assert_array_equal(num_bytes, [1, 1, 1, 2, 2, 2, 3, 4, 6, 9])
+    assert encoded.dtype == np.uint8
+    assert encoded.size == num_bytes.sum()
+    np.testing.assert_array_equal(citegraph._decode_varints(encoded), values)
+
+    encoded, num_bytes = citegraph._encode_varints(np.zeros(0, dtype=np.int64))
+    assert encoded.size == 0
+    assert citegraph._decode_varints(encoded).size == 0
+
+
+@pytest.mark.parametrize("block_size", [1, 8, 16])
+def test_lists_round_trip(block_size):
+    rng = np.random.default_rng(0)
+    # The last block is shorter than block_size, and the large number of
+    # columns gives deltas of up to four bytes
+    num_rows = 10 * 16 + 3
+    A = random_lists(rng, num_rows, 10 ** 8, 3000)
+    assert np.any(np.diff(A.indptr) == 0)
+
+    # Small chunks so that the rows are encoded in several chunks
+    lists = citegraph.encode_lists(A, block_size, chunk_edges=200)
+    assert lists["data"].dtype == np.uint8
+    assert lists["offsets"].size == int(np.ceil(num_rows / block_size)) + 1
+    assert lists["data"].size < A.nnz * 4
+
+    indptr, indices = citegraph.decode_lists(lists, np.arange(num_rows), block_size)
+    np.testing.assert_array_equal(indptr, A.indptr)
+    np.testing.assert_array_equal(indices, A.indices)
+
+    # Rows in any order, with repetitions, empty rows and the last row
+    rows = np.concatenate([rng.integers(0, num_rows, 50), [num_rows - 1, 10, 10, 0]])
+    indptr, indices = citegraph.decode_lists(lists, rows, block_size)
+    for k, row in enumerate(rows):
+        np.testing.assert_array_equal(
+            indices[indptr[k] : indptr[k + 1]], A.indices[A.indptr[row] : A.indptr[row + 1]]
+        )
+
+    indptr, indices = citegraph.decode_lists(lists, np.array([8, 9]), block_size)
+    np.testing.assert_array_equal(indptr, [0, 0, 0])
+    assert indices.size == 0
+
+
+@pytest.fixture(scope="module")
+def citation_network(tmp_path_factory):
+    """
+    Graph built from random citations, and the citations as a scipy csr
+    matrix indexed by the positions in paper_ids
+    """
+    rng = np.random.default_rng(1)
+    num_papers, num_citations = 3000, 40000
+    paper_ids = rng.choice(10 ** 10, num_papers, replace=False) + 10 ** 9
+    years = rng.integers(1990, 2000, num_papers)
+    src = rng.integers(0, num_papers, num_citations)
+    dst = rng.integers(0, num_papers, num_citations)
+    chunks = [
+        (paper_ids[src[k : k + 7000]], paper_ids[dst[k : k + 7000]])
+        for k in range(0, num_citations, 7000)
+    ]
+    # Citations from and to papers not in the graph are ignored
+    chunks.append((np.array([1, paper_ids[0]]), np.array([paper_ids[1], 2])))
+
+    path = tmp_path_factory.mktemp("citegraph")
+    graph = CitationGraph.build(
+        paper_ids, years, chunks, str(path / "work"), block_size=16, num_buckets=3
+    )
+    graph.save(str(path / "graph"))
+    graph = CitationGraph.load(str(path / "graph"), mmap_mode="r")
+
+    A = sparse.csr_matrix(
+        (np.ones(num_citations), (src, dst)), shape=(num_papers, num_papers)
+    )
+    A.sum_duplicates()
+    return graph, A, paper_ids, years
+
+
+def test_graph_index_and_years(citation_network):
+    graph, A, paper_ids, years = citation_network
+    assert graph.num_papers == paper_ids.size
+    assert graph.num_citations == A.nnz
+
+    papers = graph.index(paper_ids)
+    np.testing.assert_array_equal(graph.paper_ids[papers], paper_ids)
+    np.testing.assert_array_equal(graph.year(papers), years)
+    np.testing.assert_array_equal(graph.index([1, 2]), [-1, -1])
+
+    start, stop = graph.papers_in_years(1993, 1995)
+    in_years = (years >= 1993) & (years <= 1995)
+    assert stop - start == np.sum(in_years)
+    np.testing.assert_array_equal(np.sort(graph.paper_ids[start:stop]), np.sort(paper_ids[in_years]))
+
+
+def test_graph_references(citation_network):
+    graph, A, paper_ids, _ = citation_network
+    rng = np.random.default_rng(2)
+    query = rng.integers(0, paper_ids.size, 200)
+    indptr, cited = graph.references(graph.index(paper_ids[query]))
+    for k, i in enumerate(query):
+        expected = np.sort(graph.index(paper_ids[A.indices[A.indptr[i] : A.indptr[i + 1]]]))
+        np.testing.assert_array_equal(cited[indptr[k] : indptr[k + 1]], expected)
+
+
+@pytest.mark.parametrize(
+    "first_year, last_year", [(None, None), (1992, 1994), (1995, None), (None, 1990), (2005, 2010)]
+)
+def test_graph_citations(citation_network, first_year, last_year):
+    graph, A, paper_ids, years = citation_network
+    AT = sparse.csr_matrix(A.T)
+    lo = -np.inf if first_year is None else first_year
+    hi = np.inf if last_year is None else last_year
+
+    rng = np.random.default_rng(3)
+    query = rng.integers(0, paper_ids.size, 200)
+    indptr, citing = graph.citations(graph.index(paper_ids[query]), first_year, last_year)
+    for k, i in enumerate(query):
+        src = AT.indices[AT.indptr[i] : AT.indptr[i + 1]]
+        src = src[(years[src] >= lo) & (years[src] <= hi)]
+        expected = np.sort(graph.index(paper_ids[src]))
+        np.testing.assert_array_equal(citing[indptr[k] : indptr[k + 1]], expected)
@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+from scipy import sparse
+from cidre import cidre, filters, synthetic
+from cidre.incremental import DetectionState
+
+PARAMS = dict(threshold=0.15, alpha=0.01, ref_frac_weight=0.5, min_group_edge_num=50)
+
+
+def full_run(A, A_ref, community_ids):
+    is_excessive = filters.get_dcsbm_threshold_filter(
+        A,
+        A_ref,
+        community_ids,
+        ref_frac_weight=PARAMS["ref_frac_weight"],
+        alpha=PARAMS["alpha"],
+    )
+    return cidre.detect(
+        A,
+        PARAMS["threshold"],
+        is_excessive,
+        min_group_edge_num=PARAMS["min_group_edge_num"],
+    )
+
+
+def assert_same_table(table, expected):
+    assert list(table.columns) == list(expected.columns)
+    assert len(table) == len(expected)
+    for col in expected.columns:
+        np.testing.assert_array_equal(table[col].values, expected[col].values, err_msg=col)
+
+
+def random_delta(rng, A, cartel_ids, round_id):
+    """
+    Random edge delta with additions, removals of existing edges, and
+    citations within a planted cartel
+    """
+    N = A.shape[0]
+    k = rng.integers(1, 40)
+    if round_id % 3 == 0:
+        members = np.where(cartel_ids == rng.integers(cartel_ids.max() + 1))[0]
+        src, dst = rng.choice(members, k), rng.choice(members, k)
+    else:
+        src, dst = rng.integers(0, N, k), rng.integers(0, N, k)
+    dA = sparse.csr_matrix((rng.integers(1, 20, k).astype(float), (src, dst)), shape=(N, N))
+    if round_id % 2 == 1:
+        r, c, w = sparse.find(A)
+        pick = rng.choice(r.size, 10, replace=False)
+        dA = dA + sparse.csr_matrix((-w[pick], (r[pick], c[pick])), shape=(N, N))
+    return sparse.csr_matrix(dA)
+
+
+def random_ref_delta(rng, A_ref, dA):
+    """
+    Change of the reference network: the positive part of dA and a few
+    unrelated edges whose reference weight goes up or down
+    """
+    N = A_ref.shape[0]
+    dA_ref = dA.copy()
+    dA_ref.data = np.maximum(dA_ref.data, 0)
+    r, c, w = sparse.find(A_ref)
+    pick = rng.choice(r.size, 10, replace=False)
+    change = np.where(rng.random(10) < 0.5, -np.minimum(w[pick], 1), rng.integers(1, 5, 10))
+    return sparse.csr_matrix(dA_ref + sparse.csr_matrix((change, (r[pick], c[pick])), shape=(N, N)))
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_update_equals_full_run(seed):
+    rng = np.random.default_rng(seed)
+    A, community_ids, cartel_ids = synthetic.generate_planted_cartels(
+        3000, 10, mean_degree=30, num_cartels=8, rng=seed
+    )
+    A = sparse.csr_matrix(A, dtype=float)
+    A_ref = A.copy()
+    A_ref.data = np.ceil(A_ref.data * 1.3)
+
+    state = DetectionState.from_network(A, A_ref, community_ids, **PARAMS)
+    assert_same_table(state.table(), full_run(A, A_ref, community_ids))
+
+    num_groups = 0
+    for round_id in range(15):
+        dA = random_delta(rng, state.A, cartel_ids, round_id)
+        dA_ref = random_ref_delta(rng, state.A_ref, dA)
+        A = sparse.csr_matrix(A + dA)
+        A_ref = sparse.csr_matrix(A_ref + dA_ref)
+
+        state.update(dA, dA_ref)
+        expected = full_run(A, A_ref, community_ids)
+        assert_same_table(state.table(), expected)
+        num_groups += expected["group_id"].nunique()
+    assert num_groups > 0
+
+
+def test_save_and_load(tmp_path):
+    A, community_ids, _ = synthetic.generate_planted_cartels(
+        1000, 5, mean_degree=30, num_cartels=4, rng=2
+    )
+    A = sparse.csr_matrix(A, dtype=float)
+    state = DetectionState.from_network(A, A, community_ids, **PARAMS)
+    state.save(str(tmp_path / "state.npz"))
+    loaded = DetectionState.load(str(tmp_path / "state.npz"))
+    assert_same_table(loaded.table(), state.table())
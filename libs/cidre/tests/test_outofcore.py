@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+from scipy import sparse
+from cidre import cidre, filters, outofcore, synthetic
+
+
+def planted_network(seed):
+    A, community_ids, _ = synthetic.generate_planted_cartels(
+        5000, 20, mean_degree=15, num_cartels=10, cartel_strength=0.5, rng=seed
+    )
+    return sparse.csr_matrix(A), community_ids
+
+
+def accumulate(A, work_dir, seed, **params):
+    """
+    Feed the edges of A to an EdgeAccumulator in shuffled chunks, with the
+    weight of each edge split into two duplicate edges
+    """
+    rng = np.random.default_rng(seed)
+    src, dst, w = sparse.find(A)
+    w1 = np.floor(w / 2)
+    src, dst, w = np.concatenate([src, src]), np.concatenate([dst, dst]), np.concatenate([w1, w - w1])
+    order = rng.permutation(src.size)
+    src, dst, w = src[order], dst[order], w[order]
+
+    acc = outofcore.EdgeAccumulator(A.shape[0], str(work_dir), **params)
+    for k in range(0, src.size, 7000):
+        acc.add(src[k : k + 7000], dst[k : k + 7000], w[k : k + 7000])
+    return acc
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_accumulator_round_trip(tmp_path, seed):
+    A, _ = planted_network(seed)
+    # Small buffers so that the edges are spilled to the buckets many times
+    acc = accumulate(A, tmp_path / "work", seed, num_buckets=5, buffer_edges=10000)
+    B = acc.save(str(tmp_path / "net"))
+
+    assert B.shape == A.shape
+    assert B.has_canonical_format
+    np.testing.assert_array_equal(B.indptr, A.indptr)
+    np.testing.assert_array_equal(B.indices, A.indices)
+    np.testing.assert_array_equal(B.data, A.data)
+    assert not (tmp_path / "work").exists()
+
+    C = outofcore.load_csr(str(tmp_path / "net"))
+    assert (C != A).nnz == 0
+
+
+def test_accumulator_without_edges(tmp_path):
+    acc = outofcore.EdgeAccumulator(10, str(tmp_path / "work"), num_buckets=3)
+    B = acc.save(str(tmp_path / "net"))
+    assert B.shape == (10, 10)
+    assert B.nnz == 0
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_detect_equals_cidre(tmp_path, seed):
+    A, community_ids = planted_network(seed)
+    expected = cidre.detect(
+        A, 0.15, filters.get_dcSBM_filter(A, community_ids, 0.01), min_group_edge_num=5
+    )
+    assert len(expected) > 0
+
+    B = accumulate(A, tmp_path / "work", seed, num_buckets=5, buffer_edges=10000).save(
+        str(tmp_path / "net")
+    )
+    table = outofcore.detect(
+        B, community_ids, 0.15, 0.01, min_group_edge_num=5, chunk_edges=10000
+    )
+
+    # cidre.detect lists the members of a group in the order given by networkx
+    by_node = lambda T: T.sort_values(["group_id", "node_id"]).reset_index(drop=True)
+    table, expected = by_node(table), by_node(expected)
+    assert list(table.columns) == list(expected.columns)
+    for col in ["node_id", "group_id", "is_recipient", "is_donor"]:
+        np.testing.assert_array_equal(table[col].values, expected[col].values, err_msg=col)
+    for col in ["recipient_score", "donor_score"]:
+        np.testing.assert_allclose(table[col].values, expected[col].values, err_msg=col)
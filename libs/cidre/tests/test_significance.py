@@ -0,0 +1,29 @@
+import numpy as np
+from scipy import sparse
+from cidre import cidre, filters, significance, synthetic
+
+
+def planted_groups(seed):
+    A, community_ids, _ = synthetic.generate_planted_cartels(
+        400, 4, mean_degree=30, num_cartels=4, cartel_strength=0.5, rng=seed
+    )
+    A = sparse.csr_matrix(A, dtype=float)
+    is_excessive = filters.get_dcSBM_filter(A, community_ids, 0.01)
+    return A, community_ids, cidre.detect(A, 0.15, is_excessive)
+
+
+def test_p_values_do_not_depend_on_n_jobs():
+    A, community_ids, cartel_table = planted_groups(1)
+    assert cartel_table["group_id"].nunique() > 0
+    results = [
+        significance.group_p_values(
+            A, community_ids, cartel_table, num_samples=12, batch_size=3, n_jobs=n_jobs, seed=0
+        )
+        for n_jobs in [1, 2, 3]
+    ]
+    for result in results[1:]:
+        assert result.equals(results[0])
+
+    # The planted groups are never exceeded by the null networks
+    np.testing.assert_array_equal(results[0]["num_exceeded"].values, 0)
+    np.testing.assert_allclose(results[0]["p_value"].values, 1 / 13)
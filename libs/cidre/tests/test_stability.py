@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+from scipy import sparse
+from cidre import cidre, filters, stability, synthetic
+
+PARAMS = dict(threshold=0.15, alpha=0.01, ref_frac_weight=0.5, min_group_edge_num=50)
+
+
+def planted_network(seed):
+    A, community_ids, _ = synthetic.generate_planted_cartels(
+        1000, 5, mean_degree=30, num_cartels=6, rng=seed
+    )
+    A = sparse.csr_matrix(A, dtype=float)
+    A_ref = A.copy()
+    A_ref.data = np.ceil(A_ref.data * 1.3)
+    is_excessive = filters.get_dcsbm_threshold_filter(
+        A, A_ref, community_ids, ref_frac_weight=PARAMS["ref_frac_weight"], alpha=PARAMS["alpha"]
+    )
+    cartel_table = cidre.detect(
+        A, PARAMS["threshold"], is_excessive, min_group_edge_num=PARAMS["min_group_edge_num"]
+    )
+    return A, A_ref, community_ids, cartel_table
+
+
+def partition(node_ids, group_ids):
+    return sorted(sorted(node_ids[group_ids == g].tolist()) for g in np.unique(group_ids))
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_detect_labels_reproduces_detect(seed):
+    A, A_ref, community_ids, cartel_table = planted_network(seed)
+    assert cartel_table["group_id"].nunique() > 0
+
+    A.sum_duplicates()
+    rows = np.repeat(np.arange(A.shape[0]), np.diff(A.indptr))
+    w_th = np.array(A_ref[rows, A.indices]).reshape(-1) * PARAMS["ref_frac_weight"]
+    labels = stability.detect_labels(
+        A,
+        w_th,
+        community_ids,
+        PARAMS["threshold"],
+        PARAMS["alpha"],
+        PARAMS["min_group_edge_num"],
+    )
+    nodes = np.where(labels >= 0)[0]
+    assert partition(nodes, labels[nodes]) == partition(
+        cartel_table["node_id"].values, cartel_table["group_id"].values
+    )
+
+
+def test_bootstrap_does_not_depend_on_n_jobs():
+    A, A_ref, community_ids, cartel_table = planted_network(0)
+    results = [
+        stability.bootstrap(
+            A,
+            A_ref,
+            community_ids,
+            cartel_table,
+            **PARAMS,
+            num_samples=12,
+            batch_size=3,
+            n_jobs=n_jobs,
+            seed=0,
+        )
+        for n_jobs in [1, 2, 3]
+    ]
+    for result in results[1:]:
+        assert result["group_table"].equals(results[0]["group_table"])
+        np.testing.assert_array_equal(result["node_frequency"], results[0]["node_frequency"])
+        for key in ["comembership", "group_comembership"]:
+            assert (result[key] != results[0][key]).nnz == 0
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+import pytest
+from cidre import lineage
+from cidre.store import CartelStore
+
+
+def cartel_table(num_groups, rng, group_size=4):
+    n = num_groups * group_size
+    return pd.DataFrame(
+        {
+            "node_id": np.arange(n),
+            "group_id": np.repeat(np.arange(num_groups), group_size),
+            "donor_score": rng.random(n),
+            "recipient_score": rng.random(n),
+            "is_donor": 1,
+            "is_recipient": 0,
+            "mag_journal_id": np.arange(n),
+        }
+    )
+
+
+def test_lineage_of_a_replaced_store_is_ignored(tmp_path):
+    rng = np.random.default_rng(0)
+    tables = {year: cartel_table(5 if year == 2010 else 4, rng) for year in range(2010, 2014)}
+    store_dir, lineage_dir = str(tmp_path / "store"), str(tmp_path / "store-lineage")
+    store = CartelStore.from_tables(tables)
+    store.save(store_dir)
+    lineage_table, _ = lineage.track(store.table(), node_col=store.node_col, min_jaccard=0.3)
+    store.with_lineage(lineage_table).save_lineage(lineage_dir)
+
+    store = CartelStore.open(store_dir, lineage_path=lineage_dir)
+    np.testing.assert_array_equal(
+        store.group_lineage()["gross_group_id"].values, np.unique(store.table()["gross_group_id"])
+    )
+
+    # One group fewer in 2010 shifts the gross_group_ids of the later years
+    store.with_tables({2010: cartel_table(4, rng)}).save(store_dir)
+    with pytest.warns(UserWarning):
+        store = CartelStore.open(store_dir, lineage_path=lineage_dir)
+    assert store.group_lineage() is None
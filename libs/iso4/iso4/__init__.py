@@ -1,4 +1,4 @@
 #!/usr/bin/python3
 # -*- coding: UTF-8 -*-
 
-from .abbreviate import abbreviate
+from .abbreviate import abbreviate, abbreviate_many
@@ -3,6 +3,8 @@
 
 import os, csv, json, unicodedata, string, nltk
 import re
+import multiprocessing
+from functools import lru_cache, partial
 from nltk.stem.wordnet import WordNetLemmatizer
 
 WNL = WordNetLemmatizer()
@@ -31,10 +33,10 @@ def abbreviate(title, periods=True, disambiguation_langs=set()):
 
     title = unicodedata.normalize('NFKD', title)
 
-    disambiguation_langs = set(disambiguation_langs)
+    disambiguation_langs = frozenset(disambiguation_langs)
 
     # split title either at space, or any words in mapping with spaces
-    title_words = list(filter(lambda w: w.strip(), TOKENIZER_REGEX.split(title)))
+    title_words = __tokenize(title)
 
     result = []
 
@@ -50,83 +52,10 @@ def abbreviate(title, periods=True, disambiguation_langs=set()):
         if word_norm in STOPWORDS:
             continue
 
-        # if normalized word fails, try lemma
-        word_lemma = WNL.lemmatize(word_norm)
-        word_candidates = (word_norm, word_lemma) if word_norm != word_lemma else (word_norm,)
-
-        word_abbr = ""
+        # look up the abbreviation of the word or its lemma
+        word, word_abbr = __lookup_word(word_norm, disambiguation_langs)
         capitalization = __get_capitalization(orig_word)
 
-        for word in word_candidates:
-            # first check for all possible conflicts
-            # full word conflicts
-            if FULLWORD in CONFLICT_MAP and word in CONFLICT_MAP[FULLWORD]:
-                allowed_langs = CONFLICT_MAP[FULLWORD][word].keys()
-                possible_langs = allowed_langs & disambiguation_langs
-                if len(possible_langs) == 1:
-                    word_abbr = CONFLICT_MAP[FULLWORD][word][possible_langs.pop()]
-                    break
-                else:
-                    word_abbr = word
-                    break
-                    #raise Exception("Ambiguous word in title: {}; must disambiguate between langs: {}".format(word, ', '.join(sorted(allowed_langs))))
-            if not word_abbr and PREFIX in CONFLICT_MAP:
-                # prefix conflicts
-                for prefix in sorted(CONFLICT_MAP[PREFIX].keys()):
-                    if word.startswith(prefix):
-                        allowed_langs = CONFLICT_MAP[PREFIX][word].keys()
-                        possible_langs = allowed_langs & disambiguation_langs
-                        if len(possible_langs) == 1:
-                            word_abbr = CONFLICT_MAP[PREFIX][word][possible_langs.pop()]
-                        else:
-                            raise Exception("Ambiguous prefix ({}) in title word: {}; must disambiguate between langs: {}".format(prefix, word, ', '.join(sorted(allowed_langs))))
-            if not word_abbr and SUFFIX in CONFLICT_MAP:
-                # suffix conflicts
-                for suffix in sorted(CONFLICT_MAP[SUFFIX].keys()):
-                    if word.endswith(suffix):
-                        allowed_langs = CONFLICT_MAP[SUFFIX][word].keys()
-                        possible_langs = allowed_langs & disambiguation_langs
-                        if len(possible_langs) == 1:
-                            word_abbr = CONFLICT_MAP[SUFFIX][word][possible_langs.pop()]
-                        else:
-                            raise Exception("Ambiguous suffix ({}) in title word: {}; must disambiguate between langs: {}".format(suffix, word, ', '.join(sorted(allowed_langs))))
-            if not word_abbr and INFIX in CONFLICT_MAP:
-                # infix conflicts
-                for infix in sorted(CONFLICT_MAP[INFIX].keys()):
-                    if infix in word:
-                        allowed_langs = CONFLICT_MAP[INFIX][word].keys()
-                        possible_langs = allowed_langs & disambiguation_langs
-                        if len(possible_langs) == 1:
-                            word_abbr = CONFLICT_MAP[INFIX][word][possible_langs.pop()]
-                        else:
-                            raise Exception("Ambiguous infix ({}) in title word: {}; must disambiguate between langs: {}".format(infix, word, ', '.join(sorted(allowed_langs))))
-            if word_abbr: break
-            # done with conflict checks
-
-            # check full word list
-            if not word_abbr and FULLWORD in LTWA and word in LTWA[FULLWORD]:
-                word_abbr = LTWA[FULLWORD][word]
-                break
-            if not word_abbr and PREFIX in LTWA:
-                # check prefixes in descending length order
-                for prefix in sorted(LTWA[PREFIX].keys(), key=lambda p: (-len(p), p)):
-                    if word.startswith(prefix):
-                        word_abbr = LTWA[PREFIX][prefix]
-                        break
-            if not word_abbr and SUFFIX in LTWA:
-                # check suffixes in descending length order
-                for suffix in sorted(LTWA[SUFFIX].keys(), key=lambda p: (-len(p), p)):
-                    if word.endswith(suffix):
-                        word_abbr = LTWA[SUFFIX][suffix]
-                        break
-            if not word_abbr and INFIX in LTWA:
-                # check infixes in descending length order
-                for infix in sorted(LTWA[INFIX].keys(), key=lambda p: (-len(p), p)):
-                    if infix in word:
-                        word_abbr = LTWA[INFIX][infix]
-                        break
-            if word_abbr: break
-
         # done, finalize output with proper parameters
         if word_abbr in ("", NOT_ABBREVIATED):
             word_abbr = __finalize_output(word, capitalization, periods=False)
@@ -138,6 +67,68 @@ def abbreviate(title, periods=True, disambiguation_langs=set()):
     return unicodedata.normalize('NFKC', ' '.join(result))
 
 
+def abbreviate_many(titles, periods=True, disambiguation_langs=set(), n_jobs=1, cache_file=None):
+    """
+    Abbreviate many titles per ISO 4 / CIEPS LTWA.
+
+    Duplicate titles are abbreviated once. Results are memoised in a bounded
+    LRU cache that persists across calls, and large batches are fanned out
+    to a process pool.
+
+    Inputs:
+        (iterable) titles
+            Titles to be abbreviated.
+        (bool) periods
+            See abbreviate.
+        (iterable) disambiguation_langs
+            See abbreviate.
+        (int) n_jobs
+            Number of worker processes. Batches with fewer than
+                PARALLEL_MIN_TITLES new titles are abbreviated in this process.
+            Default 1.
+        (str) cache_file
+            Path to a JSON file that keeps the abbreviations across runs.
+            The file is ignored if it was written with another LTWA version.
+            Default None (no on-disk cache).
+    Output:
+        (list) abbreviated titles in the order of titles
+    """
+
+    titles = list(titles)
+    disambiguation_langs = frozenset(disambiguation_langs)
+
+    entry_key = __disk_cache_key(periods, disambiguation_langs)
+    disk_cache = __read_disk_cache(cache_file, entry_key) if cache_file else {}
+
+    # deduplicate and drop the titles found on disk
+    results = {}
+    pending = []
+    for title in dict.fromkeys(titles):
+        if title in disk_cache:
+            results[title] = disk_cache[title]
+        else:
+            pending.append(title)
+
+    func = partial(__abbreviate_cached, periods=periods, disambiguation_langs=disambiguation_langs)
+    if n_jobs > 1 and len(pending) >= PARALLEL_MIN_TITLES:
+        chunksize = max(1, len(pending) // (4 * n_jobs))
+        with multiprocessing.Pool(n_jobs) as pool:
+            abbrs = pool.map(func, pending, chunksize)
+    else:
+        abbrs = [func(title) for title in pending]
+    results.update(zip(pending, abbrs))
+
+    # the workers memoise in their own processes, so keep their results here
+    if n_jobs > 1 and len(pending) >= PARALLEL_MIN_TITLES:
+        __seed_title_cache(pending, abbrs, periods, disambiguation_langs)
+
+    if cache_file and pending:
+        disk_cache.update(zip(pending, abbrs))
+        __write_disk_cache(cache_file, entry_key, disk_cache)
+
+    return [results[title] for title in titles]
+
+
 LTWA = {}
 LTWA_VERSION = "20170914"
 
@@ -147,7 +138,19 @@ STOPWORDS = set([''])
 CONFLICT_MAP = {}
 MULTI_WORD_TERMS = []
 
-TOKENIZER_REGEX = None
+MULTI_WORD_TRIE = {}
+
+NON_WHITESPACE_REGEX = re.compile(r"(\S+)")
+
+# memoisation of word look-ups and abbreviated titles
+WORD_CACHE_SIZE = 2 ** 17
+TITLE_CACHE_SIZE = 2 ** 16
+
+# abbreviations computed in pool workers, being copied into __abbreviate_cached
+__SEED = {}
+
+# minimum number of titles for which abbreviate_many uses a process pool
+PARALLEL_MIN_TITLES = 2000
 
 PREFIX, SUFFIX, INFIX, FULLWORD = 'psif'
 
@@ -156,7 +159,7 @@ LABEL_LTWA, LABEL_MULTIWORD, LABEL_CONFLICT = 'lmc'
 LOWERCASE, UPPERCASE, TITLECASE = 'lut'
 
 def __initialize_ltwa():
-    global LTWA, CONFLICT_MAP, MULTI_WORD_TERMS, STOPWORDS, TOKENIZER_REGEX
+    global LTWA, CONFLICT_MAP, MULTI_WORD_TERMS, STOPWORDS, MULTI_WORD_TRIE
     json_filepath = os.path.join(os.path.dirname(__file__), "LTWA_{}.json".format(LTWA_VERSION))
     try:
         # Read JSON.
@@ -217,9 +220,209 @@ def __initialize_ltwa():
     with open(sw_filepath,'r') as inf:
         STOPWORDS = set([unicodedata.normalize('NFKD', line.strip()) for line in inf.readlines()])
 
-    # Tokenizer regex from multi words
-    TOKENIZER_REGEX = re.compile("({}|\\s+)".format('|'.join(["(?:^|\\s){}(?:\\s|$)".format(w) for w in MULTI_WORD_TERMS])), flags=re.I)
+    # Token trie from multi words. The leaf (key None) holds the position of
+    # the term in MULTI_WORD_TERMS, the earlier term wins if several match.
+    MULTI_WORD_TRIE = {}
+    for rank, term in enumerate(MULTI_WORD_TERMS):
+        node = MULTI_WORD_TRIE
+        for word in re.sub(r"\\(.)", r"\1", term, flags=re.S).split(' '):
+            node = node.setdefault(word, {})
+        node.setdefault(None, rank)
+
+
+@lru_cache(maxsize=WORD_CACHE_SIZE)
+def __lookup_word(word_norm, disambiguation_langs=frozenset()):
+    """
+    Look up the LTWA abbreviation of a normalized title word.
+
+    Results are memoised per (word, languages) since the same words recur
+    across many titles.
+
+    Inputs:
+        (str) word_norm
+            Normalized word; see __normalize_word.
+        (frozenset) disambiguation_langs
+            ISO 639-2/B language codes; see abbreviate.
+    Output:
+        (tuple) the candidate (normalized word or lemma) that was looked up
+            last, and its abbreviation ("" if none was found)
+    """
+    # if normalized word fails, try lemma
+    word_lemma = WNL.lemmatize(word_norm)
+    word_candidates = (word_norm, word_lemma) if word_norm != word_lemma else (word_norm,)
+
+    word_abbr = ""
+
+    for word in word_candidates:
+        # first check for all possible conflicts
+        # full word conflicts
+        if FULLWORD in CONFLICT_MAP and word in CONFLICT_MAP[FULLWORD]:
+            allowed_langs = CONFLICT_MAP[FULLWORD][word].keys()
+            possible_langs = allowed_langs & disambiguation_langs
+            if len(possible_langs) == 1:
+                word_abbr = CONFLICT_MAP[FULLWORD][word][possible_langs.pop()]
+                break
+            else:
+                word_abbr = word
+                break
+                #raise Exception("Ambiguous word in title: {}; must disambiguate between langs: {}".format(word, ', '.join(sorted(allowed_langs))))
+        if not word_abbr and PREFIX in CONFLICT_MAP:
+            # prefix conflicts
+            for prefix in sorted(CONFLICT_MAP[PREFIX].keys()):
+                if word.startswith(prefix):
+                    allowed_langs = CONFLICT_MAP[PREFIX][prefix].keys()
+                    possible_langs = allowed_langs & disambiguation_langs
+                    if len(possible_langs) == 1:
+                        word_abbr = CONFLICT_MAP[PREFIX][prefix][possible_langs.pop()]
+                        break
+                    else:
+                        raise Exception("Ambiguous prefix ({}) in title word: {}; must disambiguate between langs: {}".format(prefix, word, ', '.join(sorted(allowed_langs))))
+        if not word_abbr and SUFFIX in CONFLICT_MAP:
+            # suffix conflicts
+            for suffix in sorted(CONFLICT_MAP[SUFFIX].keys()):
+                if word.endswith(suffix):
+                    allowed_langs = CONFLICT_MAP[SUFFIX][suffix].keys()
+                    possible_langs = allowed_langs & disambiguation_langs
+                    if len(possible_langs) == 1:
+                        word_abbr = CONFLICT_MAP[SUFFIX][suffix][possible_langs.pop()]
+                        break
+                    else:
+                        raise Exception("Ambiguous suffix ({}) in title word: {}; must disambiguate between langs: {}".format(suffix, word, ', '.join(sorted(allowed_langs))))
+        if not word_abbr and INFIX in CONFLICT_MAP:
+            # infix conflicts
+            for infix in sorted(CONFLICT_MAP[INFIX].keys()):
+                if infix in word:
+                    allowed_langs = CONFLICT_MAP[INFIX][infix].keys()
+                    possible_langs = allowed_langs & disambiguation_langs
+                    if len(possible_langs) == 1:
+                        word_abbr = CONFLICT_MAP[INFIX][infix][possible_langs.pop()]
+                        break
+                    else:
+                        raise Exception("Ambiguous infix ({}) in title word: {}; must disambiguate between langs: {}".format(infix, word, ', '.join(sorted(allowed_langs))))
+        if word_abbr: break
+        # done with conflict checks
+
+        # check full word list
+        if not word_abbr and FULLWORD in LTWA and word in LTWA[FULLWORD]:
+            word_abbr = LTWA[FULLWORD][word]
+            break
+        if not word_abbr and PREFIX in LTWA:
+            # check prefixes in descending length order
+            for prefix in sorted(LTWA[PREFIX].keys(), key=lambda p: (-len(p), p)):
+                if word.startswith(prefix):
+                    word_abbr = LTWA[PREFIX][prefix]
+                    break
+        if not word_abbr and SUFFIX in LTWA:
+            # check suffixes in descending length order
+            for suffix in sorted(LTWA[SUFFIX].keys(), key=lambda p: (-len(p), p)):
+                if word.endswith(suffix):
+                    word_abbr = LTWA[SUFFIX][suffix]
+                    break
+        if not word_abbr and INFIX in LTWA:
+            # check infixes in descending length order
+            for infix in sorted(LTWA[INFIX].keys(), key=lambda p: (-len(p), p)):
+                if infix in word:
+                    word_abbr = LTWA[INFIX][infix]
+                    break
+        if word_abbr: break
+
+    return word, word_abbr
+
+@lru_cache(maxsize=TITLE_CACHE_SIZE)
+def __abbreviate_cached(title, periods=True, disambiguation_langs=frozenset()):
+    """Memoised abbreviate, used by abbreviate_many."""
+    if title in __SEED:
+        return __SEED[title]
+    return abbreviate(title, periods, disambiguation_langs)
+
+def __seed_title_cache(titles, abbrs, periods, disambiguation_langs):
+    """Memoise titles abbreviated elsewhere (e.g. in pool workers) in __abbreviate_cached."""
+    __SEED.update(zip(titles, abbrs))
+    try:
+        # called as abbreviate_many calls it, so that the cache keys match
+        for title in titles[-TITLE_CACHE_SIZE:]:
+            __abbreviate_cached(title, periods=periods, disambiguation_langs=disambiguation_langs)
+    finally:
+        __SEED.clear()
+
+def __disk_cache_key(periods, disambiguation_langs):
+    """Key of the entries in the on-disk cache that share the same options."""
+    return "periods={};langs={}".format(int(bool(periods)), ','.join(sorted(disambiguation_langs)))
+
+def __read_disk_cache(filepath, entry_key):
+    """Read the abbreviations stored for entry_key; empty if stale or absent."""
+    try:
+        with open(filepath, 'r') as inf:
+            inf_json = json.load(inf)
+    except (OSError, ValueError):
+        return {}
+    if inf_json.get("ltwa_version") != LTWA_VERSION:
+        return {}
+    return dict(inf_json.get("entries", {}).get(entry_key, {}))
+
+def __write_disk_cache(filepath, entry_key, abbrs):
+    """Write the abbreviations for entry_key, keeping those for other options."""
+    try:
+        with open(filepath, 'r') as inf:
+            inf_json = json.load(inf)
+    except (OSError, ValueError):
+        inf_json = {}
+    entries = inf_json.get("entries", {}) if inf_json.get("ltwa_version") == LTWA_VERSION else {}
+    entries[entry_key] = abbrs
+    tmp_filepath = "{}.{}.tmp".format(filepath, os.getpid())
+    with open(tmp_filepath, 'w') as outf:
+        json.dump({"ltwa_version": LTWA_VERSION, "entries": entries}, outf)
+    os.replace(tmp_filepath, filepath)
+
+def __tokenize(title):
+    """
+    Split title at whitespace, keeping multi-word terms in one token.
+
+    Gives the same tokens as splitting at "(?:^|\s)term(?:\s|$)" for every
+    multi-word term and then at "\s+", where a term token keeps the
+    whitespace character it absorbed on either side. Instead of trying every
+    term at each position, the words are matched against MULTI_WORD_TRIE, so
+    the cost is linear in the number of words.
+    """
+    pieces = NON_WHITESPACE_REGEX.split(title)
+    gaps, words = pieces[0::2], pieces[1::2]
+    n = len(words)
+
+    tokens = []
+    absorbed = 0 # whitespace before words[i] absorbed by the previous term
+    i = 0
+    while i < n:
+        # a term starts at the beginning of the title or after exactly
+        # one free whitespace character
+        free = len(gaps[i]) - absorbed
+        absorbed = 0
+        best = None
+        if free == 1 or (i == 0 and free == 0):
+            node = MULTI_WORD_TRIE
+            j = i
+            while j < n and (j == i or gaps[j] == ' '):
+                node = node.get(words[j].lower())
+                if node is None:
+                    break
+                j += 1
+                if None in node and (best is None or node[None] < best[0]):
+                    best = (node[None], j)
+
+        if best is None:
+            tokens.append(words[i])
+            i += 1
+            continue
 
+        j = best[1]
+        token = ' '.join(words[i:j])
+        if free == 1:
+            token = gaps[i][-1] + token
+        if gaps[j]:
+            token = token + gaps[j][0]
+            absorbed = 1
+        tokens.append(token)
+        i = j
+    return tokens
 
 def __get_type(word):
     """Determine type of word based on hyphenation."""
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # About this code
+#
+# Build the compressed citation graph of all MAG papers with
+# cidre.citegraph from the cleaned MAG files. The citations are read in
+# chunks and sorted out of core, so the memory is about the size of the
+# compressed graph (2 to 3 bytes per citation and direction) plus the
+# paper ids. The graph is built once and shared by the yearly author
+# networks (construct_author_networks.py --citation-graph).
+#
+# Usage:
+#   python3 workflow/build_citation_graph.py MAG_CLEANED_DATA_DIR OUTPUT_DIR [--block-size 32] [--chunksize 1000000] [--num-buckets 64]
+#
+import argparse
+import numpy as np
+import tracing
+import sys, os
+from construct_author_networks import read_chunks, to_int
+
+sys.path.append(os.path.abspath(os.path.join("libs/cidre")))
+from cidre.citegraph import CitationGraph
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Build the compressed citation graph of the MAG papers")
+    parser.add_argument("mag_dir", help="Directory of the cleaned MAG files")
+    parser.add_argument("output_dir")
+    parser.add_argument("--block-size", type=int, default=32, help="Number of papers in a block")
+    parser.add_argument(
+        "--chunksize", type=int, default=1000000, help="Number of rows read from a file at once"
+    )
+    parser.add_argument(
+        "--num-buckets",
+        type=int,
+        default=64,
+        help="Number of buckets of the spilled citations. Increase it if merging a bucket runs out of memory.",
+    )
+    return parser.parse_args(argv)
+
+
+def load_paper_years(mag_dir, chunksize):
+    """
+    MAG paper ids and publication years of the papers with a year
+    """
+    paper_ids, years = [], []
+    for chunk in read_chunks(os.path.join(mag_dir, "Papers.txt"), [0, 4], chunksize):
+        year = to_int(chunk.iloc[:, 1])
+        s = year >= 0
+        paper_ids += [to_int(chunk.iloc[:, 0])[s]]
+        years += [year[s].astype(np.int16)]
+    return np.concatenate(paper_ids), np.concatenate(years)
+
+
+def citation_chunks(mag_dir, chunksize):
+    for chunk in read_chunks(os.path.join(mag_dir, "PaperReferences.txt"), [0, 1], chunksize):
+        yield to_int(chunk.iloc[:, 0]), to_int(chunk.iloc[:, 1])
+
+
+if __name__ == "__main__":
+
+    args = parse_args(sys.argv[1:])
+
+    with tracing.span("load papers") as sp:
+        paper_ids, years = load_paper_years(args.mag_dir, args.chunksize)
+        sp.output(paper_ids)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output_dir)), exist_ok=True)
+    with tracing.span("build citation graph", inputs=[paper_ids]) as sp:
+        graph = CitationGraph.build(
+            paper_ids,
+            years,
+            citation_chunks(args.mag_dir, args.chunksize),
+            work_dir=args.output_dir + ".work",
+            block_size=args.block_size,
+            num_buckets=args.num_buckets,
+        )
+        graph.save(args.output_dir)
+        sp.output(graph.paper_ids)
+
+    nbytes = sum(a.nbytes for lists in graph.lists.values() for a in lists.values())
+    print(
+        "papers",
+        graph.num_papers,
+        "citations",
+        graph.num_citations,
+        "bytes per citation %.2f" % (nbytes / max(graph.num_citations, 1)),
+    )
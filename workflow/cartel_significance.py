@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # About this code
+#
+# Empirical p-values of the cartels detected in a year under the
+# degree-corrected SBM fitted to the network of the year (see
+# cidre.significance). The null networks are sampled and analyzed by a
+# pool of N_JOBS processes. The p-values depend only on SEED and
+# NUM_SAMPLES, not on N_JOBS.
+#
+# Usage:
+#   python3 workflow/cartel_significance.py YEAR NETWORK_DIR ALPHA COMMUNITY_FILE CARTEL_DIR NUM_SAMPLES N_JOBS SEED OUTPUT
+#
+import sys, os
+import utils
+import tracing
+from detect_cartels import load_community_table, find_community_ids
+
+sys.path.append(os.path.abspath(os.path.join("libs/cidre")))
+from cidre import significance
+
+MIN_GROUP_EDGE_NUM = 50  # Same as that in detect_cartels.py
+
+if __name__ == "__main__":
+
+    YEAR = int(sys.argv[1])
+    NETWORK_DIR = sys.argv[2]
+    ALPHA = float(sys.argv[3])
+    COMMUNITY_FILE = sys.argv[4]
+    CARTEL_DIR = sys.argv[5]
+    NUM_SAMPLES = int(sys.argv[6])
+    N_JOBS = int(sys.argv[7])
+    SEED = int(sys.argv[8])
+    OUTPUT = sys.argv[9]
+
+    journal_index, community_ids = load_community_table(COMMUNITY_FILE)
+    A_eff, _, nodes = utils.load_network(YEAR, NETWORK_DIR)
+    node_community_ids = find_community_ids(nodes, journal_index, community_ids)
+    cartel_table = utils.load_cartel_store(CARTEL_DIR).year(YEAR)
+
+    with tracing.span("significance", inputs=[A_eff], year=YEAR, num_samples=NUM_SAMPLES) as sp:
+        result = significance.group_p_values(
+            A_eff,
+            node_community_ids,
+            cartel_table,
+            alpha=ALPHA,
+            num_samples=NUM_SAMPLES,
+            min_group_edge_num=MIN_GROUP_EDGE_NUM,
+            n_jobs=N_JOBS,
+            seed=SEED,
+        )
+        sp.output(result)
+
+    result["year"] = YEAR
+    result.to_csv(OUTPUT, sep="\t", index=False)
+    print(result.to_string(index=False))
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # About this code
+#
+# Bootstrap stability of the cartels detected in a year (see
+# cidre.stability). The citation counts are resampled, the cartels are
+# detected in each replicate by a pool of processes, and the following
+# files are written into OUTPUT_DIR:
+#
+#   stability-{year}.csv               Stability of the detected cartels
+#   nodes-{year}.csv                   Fraction of the replicates in which each journal is in a cartel
+#   comembership-{year}.npz            Journal x journal co-membership frequencies
+#   group-comembership-{year}.npz      Cartel x journal co-membership frequencies
+#
+# The rows and columns of the .npz files are the nodes in nodes-{year}.csv.
+#
+# Usage:
+#   python3 workflow/cartel_stability.py YEAR NETWORK_DIR THETA ALPHA COMMUNITY_FILE CARTEL_DIR OUTPUT_DIR [--method poisson|thinning] [--drop-frac 0.1] [--num-samples 100] [--n-jobs 1] [--seed 0]
+#
+import argparse
+import pandas as pd
+import utils
+import tracing
+import sys, os
+from scipy import sparse
+from detect_cartels import load_community_table, find_community_ids
+
+sys.path.append(os.path.abspath(os.path.join("libs/cidre")))
+from cidre import stability
+
+MIN_GROUP_EDGE_NUM = 50  # Same as that in detect_cartels.py
+REF_FRAC_WEIGHT = 0.5
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description="Stability of the detected cartels under resampling of the citations"
+    )
+    parser.add_argument("year", type=int)
+    parser.add_argument("network_dir")
+    parser.add_argument("theta", type=float)
+    parser.add_argument("alpha", type=float)
+    parser.add_argument("community_file")
+    parser.add_argument("cartel_dir")
+    parser.add_argument("output_dir")
+    parser.add_argument("--method", choices=["poisson", "thinning"], default="poisson")
+    parser.add_argument(
+        "--drop-frac",
+        type=float,
+        default=0.1,
+        help="Probability of dropping a citation for --method thinning",
+    )
+    parser.add_argument("--num-samples", type=int, default=100)
+    parser.add_argument("--n-jobs", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+
+    args = parse_args(sys.argv[1:])
+    YEAR = args.year
+
+    journal_index, community_ids = load_community_table(args.community_file)
+    A_eff, A_gen, nodes = utils.load_network(YEAR, args.network_dir)
+    node_community_ids = find_community_ids(nodes, journal_index, community_ids)
+    cartel_table = utils.load_cartel_store(args.cartel_dir).year(YEAR)
+
+    with tracing.span(
+        "stability", inputs=[A_eff, A_gen], year=YEAR, num_samples=args.num_samples
+    ) as sp:
+        result = stability.bootstrap(
+            A_eff,
+            A_gen,
+            node_community_ids,
+            cartel_table,
+            threshold=args.theta,
+            alpha=args.alpha,
+            ref_frac_weight=REF_FRAC_WEIGHT,
+            min_group_edge_num=MIN_GROUP_EDGE_NUM,
+            method=args.method,
+            drop_frac=args.drop_frac,
+            num_samples=args.num_samples,
+            n_jobs=args.n_jobs,
+            seed=args.seed,
+        )
+        sp.output(result["comembership"], result["group_table"])
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = lambda name: os.path.join(args.output_dir, name.format(year=YEAR))
+    group_table = result["group_table"]
+    group_table["year"] = YEAR
+    group_table.to_csv(path("stability-{year}.csv"), sep="\t", index=False)
+    pd.DataFrame(
+        {"mag_journal_id": nodes, "frequency": result["node_frequency"]}
+    ).to_csv(path("nodes-{year}.csv"), sep="\t", index=False)
+    sparse.save_npz(path("comembership-{year}.npz"), result["comembership"])
+    sparse.save_npz(path("group-comembership-{year}.npz"), result["group_comembership"])
+    print(group_table.to_string(index=False))
@@ -8,8 +8,13 @@ import pandas as pd
 import numpy as np
 from scipy import sparse
 import utils
+import tracing
 import json
 import py2neo
+import os
+
+sys.path.append(os.path.abspath(os.path.join("libs/cidre")))
+from cidre import cidre
 
 
 def count_citations_papers_within_group(journal_ids, year):
@@ -31,7 +36,7 @@ def count_citations_papers_within_group(journal_ids, year):
     """.format(
         journals=journals, ys=year - 2, yf=year
     )
-    citations = graph.run(query).to_data_frame()
+    citations = utils.run_query(graph, query)
     w_out = citations.groupby("source").size().values
     w_in = citations.groupby("target").size().values
     return w_out, w_in
@@ -54,7 +59,7 @@ def count_citations_authors_within_group(journal_ids, year):
     """.format(
         journals=journals, ys=year - 2, yf=year
     )
-    citations_in = graph.run(query).to_data_frame()
+    citations_in = utils.run_query(graph, query)
 
     query = """
         match (jsrc:Journal)-[:published_from]-(psrc:Paper)-[r:cites]->(ptrg:Paper)-[:published_from]-(jtrg:Journal)
@@ -70,10 +75,34 @@ def count_citations_authors_within_group(journal_ids, year):
     """.format(
         journals=journals, ys=year - 2, yf=year
     )
-    citations_out = graph.run(query).to_data_frame()
+    citations_out = utils.run_query(graph, query)
     return citations_out["w"].values, citations_in["w"].values
 
 
+def load_internal_weights(store, years, net_dir):
+    """
+    Number of citations within each group, excluding self-citations
+
+    The statistics saved in the cartel store are used. The networks are
+    loaded only for the years for which the store has no statistics.
+
+    Returns
+    -------
+    internal_weight : pandas.Series
+        Indexed by gross_group_id
+    """
+    stats = store.group_stats(years)
+    missing = np.unique(stats["year"].values[stats["internal_weight"].isna().values])
+    if missing.size > 0:
+        stats = stats[~np.isin(stats["year"].values, missing)]
+        for year in missing:
+            A, _, _ = utils.load_network(year, net_dir)
+            cartel_table = store.year(year)
+            year_stats = cidre.summarize(A, cartel_table, group_col="gross_group_id")
+            stats = pd.concat([stats, year_stats], ignore_index=True)
+    return stats.set_index("gross_group_id")["internal_weight"]
+
+
 if __name__ == "__main__":
 
     NET_DIR = sys.argv[1]  # "../../data/networks"
@@ -90,25 +119,21 @@ if __name__ == "__main__":
     # Connect to the database
     graph = utils.get_db()
 
-    # Load the networks
-    A_list = {}
-    node_list = {}
-    for year in years:
-        A, _, nodes = utils.load_network(year, NET_DIR)
-        A_list[year] = A
-        node_list[year] = nodes
+    with tracing.span("load groups", inputs=[TR_DETECTED_FILE]) as sp:
+        groups_TR = pd.read_csv(TR_DETECTED_FILE, sep="\t")
+        store_CI = utils.load_cartel_store(CI_DETECTED_DIR)
+        groups_CI = store_CI.table(years)
+        sp.output(groups_TR, groups_CI)
 
-    groups_TR = pd.read_csv(TR_DETECTED_FILE, sep="\t")
-    groups_CI = utils.load_detected_cartels(years, CI_DETECTED_DIR)
+    # Citations within the groups
+    internal_weight = load_internal_weights(store_CI, years, NET_DIR)
 
     # Remove groups that contain at least one suspended journal
     suspended_journals = np.unique(groups_TR["mag_journal_id"].values)
-    contained = [
-        gid
-        for gid, dg in groups_CI.groupby("gross_group_id")
-        if ~np.any(np.isin(dg["mag_journal_id"], suspended_journals))
+    suspended = store_CI.groups_containing(suspended_journals)
+    unsuspended_groups_CI = groups_CI[
+        ~np.isin(groups_CI["gross_group_id"].values, suspended)
     ]
-    unsuspended_groups_CI = utils.slice_groups(groups_CI, contained, "gross_group_id")
 
     # Compute the fraction of citations at author and paper levels
     cit_concentration = []
@@ -117,24 +142,20 @@ if __name__ == "__main__":
         ["year", "gross_group_id"]
     ):
 
-        A = A_list[year]
-        journal_ids = node_list[year]
-
-        nodes = cartel.node_id.values
-        As = A[:, nodes][nodes, :].toarray()
-        As = As - np.diag(np.diag(As))
+        num_edges = internal_weight[gid]
+        journal_ids = cartel["mag_journal_id"].values
 
         # Count the number of citations that each paper and author
         # recieves and provides citations within the groups
-        p_out, p_in = count_citations_papers_within_group(journal_ids[nodes], year)
-        a_out, a_in = count_citations_authors_within_group(journal_ids[nodes], year)
+        p_out, p_in = count_citations_papers_within_group(journal_ids, year)
+        a_out, a_in = count_citations_authors_within_group(journal_ids, year)
 
         # Compute the fraction of citations within the group
-        p_in = np.max(p_in / np.sum(As))
-        p_out = np.max(p_out / np.sum(As))
+        p_in = np.max(p_in / num_edges)
+        p_out = np.max(p_out / num_edges)
 
-        a_in = np.max(a_in / np.sum(As))
-        a_out = np.max(a_out / np.sum(As))
+        a_in = np.max(a_in / num_edges)
+        a_out = np.max(a_out / num_edges)
 
         cit_concentration += [
             {
@@ -144,7 +165,7 @@ if __name__ == "__main__":
                 "a_out": a_out,
                 "year": year,
                 "gid": gid,
-                "num_edges": np.sum(As),
+                "num_edges": num_edges,
             }
         ]
 
@@ -161,9 +182,11 @@ if __name__ == "__main__":
         else:
             return "others (e)"
 
-    df = pd.DataFrame(cit_concentration)
-    df["type"] = df.apply(lambda x: classify(x, th), axis=1)
-    df_before_2019 = df[df.year < 2019]
+    with tracing.span("classify", inputs=[cit_concentration]) as sp:
+        df = pd.DataFrame(cit_concentration)
+        df["type"] = df.apply(lambda x: classify(x, th), axis=1)
+        df_before_2019 = df[df.year < 2019]
+        sp.output(df_before_2019)
 
     # Save the classification to a file
     df_before_2019.groupby("type").size().reset_index().to_csv(
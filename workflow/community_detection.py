@@ -1,13 +1,22 @@
 #!/usr/bin/env python
 # coding: utf-8
 
-import graph_tool.all as gt
 import numpy as np
 import pandas as pd
 import os,sys
+import argparse
 import utils
+import tracing
 from scipy import sparse
 
+try:
+    import graph_tool.all as gt
+except ImportError:  # Only the graph-tool backend needs it
+    gt = None
+
+sys.path.append(os.path.abspath(os.path.join("libs/cidre")))
+from cidre import community
+
 
 def to_graph_tool(adj, membership=None):
     g = gt.Graph(directed=True)
@@ -23,34 +32,238 @@ def to_graph_tool(adj, membership=None):
     return g
 
 
-def make_community_table(states, nodes):
-    b = states.get_blocks()
-    cids = b.a
+def make_community_table(blocks, nodes):
+    _, cids = np.unique(blocks, return_inverse=True)
     return pd.DataFrame({"node_id":np.arange(nodes.size), "mag_journal_id": nodes, "community_id": cids})
 
 
+def initial_blocks(A, nodes, prev_community_table, max_rounds=10):
+    """
+    Initial blocks seeded from a previous partition
+
+    The journals in the previous partition keep their communities. A new
+    journal joins the community to which most of its citations (in either
+    direction) go. The assignment is repeated so that the new journals
+    linked only to other new journals are also assigned. The remaining
+    journals are placed in their own blocks.
+
+    Parameters
+    ----------
+    A : scipy sparse matrix
+        Adjacency matrix
+    nodes : numpy.ndarray
+        nodes[i] is the MAG journal id of node i
+    prev_community_table : pandas.DataFrame
+        Previous partition with columns mag_journal_id and community_id
+    max_rounds : int
+        Maximum number of rounds for assigning the new journals
+
+    Returns
+    -------
+    b : numpy.ndarray
+        b[i] is the initial block of node i
+    num_new : int
+        Number of journals not in the previous partition
+    """
+    prev_ids = prev_community_table["mag_journal_id"].values
+    order = np.argsort(prev_ids)
+    prev_ids = prev_ids[order]
+    prev_cids = prev_community_table["community_id"].values[order]
+
+    pos = np.minimum(np.searchsorted(prev_ids, nodes), prev_ids.size - 1)
+    b = np.where(prev_ids[pos] == nodes, prev_cids[pos], -1)
+    num_new = int(np.sum(b < 0))
+
+    W = sparse.csr_matrix(A + A.T)
+    for _ in range(max_rounds):
+        new = np.where(b < 0)[0]
+        known = np.where(b >= 0)[0]
+        if new.size == 0 or known.size == 0:
+            break
+
+        # Citations from the new journals to each community
+        C = sparse.csr_matrix(
+            (np.ones(known.size), (known, b[known])), shape=(b.size, np.max(b) + 1)
+        )
+        M = W[new, :] @ C
+        has_neighbour = np.array(M.sum(axis=1)).reshape(-1) > 0
+        if not np.any(has_neighbour):
+            break
+        b[new[has_neighbour]] = np.array(
+            M[has_neighbour].argmax(axis=1)
+        ).reshape(-1)
+
+    # Isolated new journals
+    isolated = np.where(b < 0)[0]
+    b[isolated] = np.max(b, initial=-1) + 1 + np.arange(isolated.size)
+
+    _, b = np.unique(b, return_inverse=True)
+    return b, num_new
+
+
+def refine_blocks(G, b, max_sweeps, niter=10):
+    """
+    Refine the blocks by a bounded number of merge-split sweeps
+
+    Parameters
+    ----------
+    G : graph_tool.Graph
+        Graph with the edge weights
+    b : numpy.ndarray
+        Initial blocks
+    max_sweeps : int
+        Maximum number of sweeps. The sweeps stop earlier if no node is moved.
+    niter : int
+        Number of merge-split iterations per sweep
+
+    Returns
+    -------
+    states : graph_tool.inference.BlockState
+    """
+    blocks = G.new_vertex_property("int")
+    blocks.a = b
+    states = gt.BlockState(G, b=blocks, eweight=G.ep.weight, deg_corr=True)
+    for sweep in range(max_sweeps):
+        with tracing.span("sweep", sweep=sweep) as sp:
+            dS, nattempts, nmoves = states.multiflip_mcmc_sweep(beta=np.inf, niter=niter)
+            sp.set(dS=float(dS), nattempts=int(nattempts), nmoves=int(nmoves))
+        if nmoves == 0:
+            break
+    return states
+
+
+def detect_graph_tool(A, init=None, max_sweeps=10):
+    """
+    Communities by the degree-corrected stochastic block model
+
+    Parameters
+    ----------
+    A : scipy sparse matrix
+        Adjacency matrix
+    init : numpy.ndarray (Optional; Default None)
+        Initial blocks. If None, the blockmodel is fitted from scratch.
+        Otherwise, it is refined from the initial blocks by at most
+        max_sweeps merge-split sweeps.
+    max_sweeps : int
+        Maximum number of sweeps from the initial blocks
+
+    Returns
+    -------
+    blocks : numpy.ndarray
+        blocks[i] is the community of node i
+    """
+    if gt is None:
+        raise ImportError("The graph-tool backend requires graph_tool")
+
+    with tracing.span("to_graph_tool", inputs=[A]):
+        G = to_graph_tool(A)
+
+    if init is None:
+        with tracing.span("minimize_blockmodel_dl", inputs=[A]) as sp:
+            states = gt.minimize_blockmodel_dl(
+                G,
+                deg_corr=True,
+                state_args=dict(eweight=G.ep.weight),
+                verbose=True,
+                B_max=np.round(A.shape[0] / 3).astype(int),
+            )
+            sp.set(num_blocks=int(states.get_nonempty_B()))
+    else:
+        with tracing.span("refine_blocks", inputs=[A]) as sp:
+            states = refine_blocks(G, init, max_sweeps)
+            sp.set(num_blocks=int(states.get_nonempty_B()))
+    return states.get_blocks().a
+
+
+def detect_louvain(A, init=None, resolution=1.0, seed=None):
+    """
+    Communities by the Louvain method in cidre.community
+
+    Parameters
+    ----------
+    A : scipy sparse matrix
+        Adjacency matrix
+    init : numpy.ndarray (Optional; Default None)
+        Initial communities
+    resolution : float
+        Resolution parameter of the modularity
+    seed : int (Optional; Default None)
+        Random seed
+
+    Returns
+    -------
+    blocks : numpy.ndarray
+        blocks[i] is the community of node i
+    """
+    with tracing.span("louvain", inputs=[A]) as sp:
+        blocks = community.louvain(A, resolution=resolution, init=init, rng=seed)
+        sp.set(num_blocks=int(np.max(blocks, initial=-1) + 1))
+    return blocks
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description="Detect the communities in the aggregated network"
+    )
+    parser.add_argument("years", type=int, nargs="+", help="Years to aggregate")
+    parser.add_argument("output", help="Community file")
+    parser.add_argument(
+        "--backend",
+        choices=["graph-tool", "louvain"],
+        default="graph-tool",
+        help="graph-tool fits the degree-corrected stochastic block model. "
+        "louvain maximizes the modularity with numpy and scipy only, which is much faster.",
+    )
+    parser.add_argument(
+        "--init",
+        default=None,
+        help="Previous community file. If given, the communities are seeded from "
+        "this partition instead of being detected from scratch. "
+        "Experimental with graph-tool: the merge-split refinement is not yet validated.",
+    )
+    parser.add_argument(
+        "--max-sweeps",
+        type=int,
+        default=10,
+        help="Maximum number of merge-split sweeps for the warm start of graph-tool (experimental)",
+    )
+    parser.add_argument(
+        "--resolution",
+        type=float,
+        default=1.0,
+        help="Resolution parameter for louvain",
+    )
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for louvain")
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
 
-    OUTPUT = sys.argv.pop()
-    YEARS = [int(y) for y in sys.argv[1:]]
+    args = parse_args(sys.argv[1:])
+    OUTPUT = args.output
+    YEARS = args.years
 
     print("years", YEARS)
 
     print("Loading networks")
     A, Araw, nodes = utils.load_network(YEARS)
 
-    print("Construct graph tool graph object")
-    G = to_graph_tool(A)
+    init = None
+    if args.init is not None:
+        print("Seeding from %s" % args.init)
+        with tracing.span("initial_blocks", inputs=[A, args.init]) as sp:
+            init, num_new = initial_blocks(A, nodes, pd.read_csv(args.init, sep="\t"))
+            print("%d new journals" % num_new)
+            sp.set(num_new=num_new)
 
-    print("Estimating")
-    states = gt.minimize_blockmodel_dl(
-        G,
-        deg_corr=True,
-        state_args=dict(eweight=G.ep.weight),
-        verbose=True,
-        B_max=np.round(A.shape[0] / 3).astype(int),
-    )
+    print("Estimating by %s" % args.backend)
+    if args.backend == "graph-tool":
+        blocks = detect_graph_tool(A, init, args.max_sweeps)
+    else:
+        blocks = detect_louvain(A, init, args.resolution, args.seed)
 
     print("Save")
-    community_table = make_community_table(states, nodes)
-    community_table.to_csv(OUTPUT, sep="\t")
+    with tracing.span("save") as sp:
+        community_table = make_community_table(blocks, nodes)
+        community_table.to_csv(OUTPUT, sep="\t")
+        sp.output(community_table)
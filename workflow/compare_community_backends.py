@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # About this code
+#
+# Compare the cartels detected with two community files, e.g., the ones
+# produced by the graph-tool and louvain backends of community_detection.py.
+# The cartels are detected for each year with each community file, and the
+# agreement of the communities and of the cartels is reported.
+#
+# Usage:
+#   python3 workflow/compare_community_backends.py COMMUNITY_FILE_A COMMUNITY_FILE_B NETWORK_DIR THETA ALPHA OUTPUT YEARS...
+#
+import numpy as np
+import pandas as pd
+import sys, os
+import tracing
+from detect_cartels import load_community_table, detect_cartels
+
+sys.path.append(os.path.abspath(os.path.join("libs/cidre")))
+from cidre import community, groups
+
+
+def compare_communities(community_file_a, community_file_b):
+    """
+    Agreement of the communities of the journals in both files
+
+    Returns
+    -------
+    scores : dict
+        Number of shared journals, number of communities in each file,
+        and the NMI and ARI given by cidre.community.compare_partitions
+    """
+    ids_a, cids_a = load_community_table(community_file_a)
+    ids_b, cids_b = load_community_table(community_file_b)
+    shared, ia, ib = np.intersect1d(ids_a, ids_b, assume_unique=True, return_indices=True)
+    scores = community.compare_partitions(cids_a[ia], cids_b[ib])
+    scores.update(
+        {
+            "num_journals": int(shared.size),
+            "num_communities_a": int(np.unique(cids_a).size),
+            "num_communities_b": int(np.unique(cids_b).size),
+        }
+    )
+    return scores
+
+
+def best_match_jaccard(groups_a, groups_b):
+    """
+    Jaccard index between each group in groups_a and the most similar group in groups_b
+
+    Parameters
+    ----------
+    groups_a : pandas.DataFrame
+        Table with columns mag_journal_id and group_id
+    groups_b : pandas.DataFrame
+        Same as groups_a
+
+    Returns
+    -------
+    jaccard : numpy.ndarray
+        jaccard[k] is the best Jaccard index of the kth group in groups_a
+    """
+    _, (node_a, node_b) = groups.encode_ids(
+        groups_a["mag_journal_id"].values, groups_b["mag_journal_id"].values
+    )
+    _, (ga,) = groups.encode_ids(groups_a["group_id"].values)
+    _, (gb,) = groups.encode_ids(groups_b["group_id"].values)
+    num_nodes = np.max(np.concatenate([node_a, node_b]), initial=-1) + 1
+    U_a = groups.membership_matrix(node_a, ga, num_nodes)
+    U_b = groups.membership_matrix(node_b, gb, num_nodes)
+    return groups.best_match(groups.jaccard(U_a, U_b))[1]
+
+
+def compare_cartels(cartels_a, cartels_b):
+    """
+    Agreement of the cartels detected in a year
+
+    Returns
+    -------
+    scores : dict
+    """
+    journals_a = np.unique(cartels_a["mag_journal_id"].values)
+    journals_b = np.unique(cartels_b["mag_journal_id"].values)
+    num_union = np.union1d(journals_a, journals_b).size
+    jaccard_a = best_match_jaccard(cartels_a, cartels_b)
+    jaccard_b = best_match_jaccard(cartels_b, cartels_a)
+    return {
+        "num_groups_a": int(jaccard_a.size),
+        "num_groups_b": int(jaccard_b.size),
+        "num_journals_a": int(journals_a.size),
+        "num_journals_b": int(journals_b.size),
+        "journal_jaccard": np.intersect1d(journals_a, journals_b).size / num_union
+        if num_union > 0
+        else 1.0,
+        "mean_best_jaccard_a": float(np.mean(jaccard_a)) if jaccard_a.size else np.nan,
+        "mean_best_jaccard_b": float(np.mean(jaccard_b)) if jaccard_b.size else np.nan,
+        "matched_a": int(np.sum(jaccard_a >= 0.5)),
+        "matched_b": int(np.sum(jaccard_b >= 0.5)),
+    }
+
+
+if __name__ == "__main__":
+
+    COMMUNITY_FILE_A = sys.argv[1]
+    COMMUNITY_FILE_B = sys.argv[2]
+    NETWORK_DIR = sys.argv[3]
+    THETA = float(sys.argv[4])
+    ALPHA = float(sys.argv[5])
+    OUTPUT = sys.argv[6]
+    YEARS = [int(y) for y in sys.argv[7:]]
+
+    scores = compare_communities(COMMUNITY_FILE_A, COMMUNITY_FILE_B)
+    print(
+        "communities: %d journals, %d vs %d communities, NMI %.3f, ARI %.3f"
+        % (
+            scores["num_journals"],
+            scores["num_communities_a"],
+            scores["num_communities_b"],
+            scores["nmi"],
+            scores["ari"],
+        )
+    )
+
+    index_a = load_community_table(COMMUNITY_FILE_A)
+    index_b = load_community_table(COMMUNITY_FILE_B)
+    results = []
+    for year in YEARS:
+        with tracing.span("compare", year=year) as sp:
+            cartels_a = detect_cartels(year, NETWORK_DIR, THETA, ALPHA, *index_a)[0]
+            cartels_b = detect_cartels(year, NETWORK_DIR, THETA, ALPHA, *index_b)[0]
+            result = {"year": year}
+            result.update(compare_cartels(cartels_a, cartels_b))
+            sp.set(**result)
+        print(
+            "%d: %d vs %d groups, journal Jaccard %.3f, matched %d and %d"
+            % (
+                year,
+                result["num_groups_a"],
+                result["num_groups_b"],
+                result["journal_jaccard"],
+                result["matched_a"],
+                result["matched_b"],
+            )
+        )
+        results.append(result)
+
+    result_table = pd.DataFrame(results)
+    for k in ["nmi", "ari"]:
+        result_table["community_%s" % k] = scores[k]
+    result_table.to_csv(OUTPUT, sep="\t", index=False)
@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # About this code
+#
+# Construct the author citation network for a year from the cleaned MAG
+# files, without the database. An edge from author a to author b is a
+# citation from a paper of a published in YEAR to a paper of b published
+# in the WINDOW_LENGTH years before, with the weight given by the number
+# of such citations, i.e., the author-level counterpart of the journal
+# network of construct_yearly_networks.py. The files are read in chunks,
+# and the edges are spilled to disk and merged by
+# cidre.outofcore.EdgeAccumulator, so the memory does not grow with the
+# number of citations.
+#
+# The network is saved in OUTPUT_DIR in the format of
+# cidre.outofcore.load_csr, together with nodes.csv, which gives for each
+# node the MAG author id, the journal in which the author published the
+# most papers in the window (mag_journal_id, -1 if none) and the number
+# of the papers.
+#
+# Papers with more than --max-authors authors are skipped since a citation
+# between two papers gives one edge per pair of their authors. The pairs
+# are expanded for at most --max-pairs pairs at a time.
+#
+# With --citation-graph, the citations are taken from the compressed
+# citation graph built by build_citation_graph.py. Only the references of
+# the papers published in YEAR are decoded instead of scanning all of
+# PaperReferences.txt.
+#
+# Usage:
+#   python3 workflow/construct_author_networks.py MAG_CLEANED_DATA_DIR YEAR WINDOW_LENGTH OUTPUT_DIR [--max-authors 25] [--chunksize 1000000] [--max-pairs 10000000] [--num-buckets 64] [--citation-graph DIR]
+#
+import argparse
+import csv
+import numpy as np
+import pandas as pd
+import tracing
+import sys, os
+
+sys.path.append(os.path.abspath(os.path.join("libs/cidre")))
+from cidre import outofcore
+from cidre.citegraph import CitationGraph
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Construct the author citation network for a year")
+    parser.add_argument("mag_dir", help="Directory of the cleaned MAG files")
+    parser.add_argument("year", type=int)
+    parser.add_argument("window_length", type=int)
+    parser.add_argument("output_dir")
+    parser.add_argument("--max-authors", type=int, default=25)
+    parser.add_argument(
+        "--chunksize", type=int, default=1000000, help="Number of rows read from a file at once"
+    )
+    parser.add_argument(
+        "--max-pairs",
+        type=int,
+        default=10000000,
+        help="Number of author pairs expanded at once. A citation with more pairs is expanded alone.",
+    )
+    parser.add_argument(
+        "--num-buckets",
+        type=int,
+        default=64,
+        help="Number of buckets of the spilled edges. Increase it if merging a bucket runs out of memory.",
+    )
+    parser.add_argument(
+        "--citation-graph", default=None, help="Directory of the graph built by build_citation_graph.py"
+    )
+    return parser.parse_args(argv)
+
+
+def read_chunks(filename, columns, chunksize):
+    """
+    Read columns of a cleaned MAG file in chunks of rows
+    """
+    return pd.read_csv(
+        filename,
+        sep="\t",
+        header=0,
+        usecols=columns,
+        chunksize=chunksize,
+        quoting=csv.QUOTE_NONE,
+        dtype=str,
+    )
+
+
+def to_int(values, missing=-1):
+    return pd.to_numeric(values, errors="coerce").fillna(missing).astype(np.int64).values
+
+
+def lookup(index, keys):
+    """
+    Position of the keys in the sorted index, -1 if not found
+    """
+    if index.size == 0:
+        return -np.ones(len(keys), dtype=np.int64)
+    pos = np.minimum(np.searchsorted(index, keys), index.size - 1)
+    return np.where(index[pos] == keys, pos, -1)
+
+
+def load_papers(mag_dir, first_year, last_year, chunksize):
+    """
+    Papers published between first_year and last_year
+
+    Returns
+    -------
+    paper_ids : numpy.ndarray
+        Sorted MAG paper ids
+    years : numpy.ndarray
+        Publication year of the papers
+    journal_ids : numpy.ndarray
+        MAG journal id of the papers, -1 if not published in a journal
+    """
+    paper_ids, years, journal_ids = [], [], []
+    for chunk in read_chunks(os.path.join(mag_dir, "Papers.txt"), [0, 4, 5], chunksize):
+        year = to_int(chunk.iloc[:, 1])
+        s = (first_year <= year) & (year <= last_year)
+        paper_ids += [to_int(chunk.iloc[:, 0])[s]]
+        years += [year[s].astype(np.int16)]
+        journal_ids += [to_int(chunk.iloc[:, 2])[s]]
+    paper_ids, years, journal_ids = map(np.concatenate, [paper_ids, years, journal_ids])
+    order = np.argsort(paper_ids)
+    return paper_ids[order], years[order], journal_ids[order]
+
+
+def load_authorships(mag_dir, paper_ids, chunksize):
+    """
+    Authors of the papers
+
+    Returns
+    -------
+    author_ids : numpy.ndarray
+        Sorted MAG author ids of the authors of the papers
+    paper_index : numpy.ndarray
+        Index of the paper in paper_ids of each authorship
+    author_index : numpy.ndarray
+        Index of the author in author_ids of each authorship
+    """
+    papers, authors = [], []
+    for chunk in read_chunks(os.path.join(mag_dir, "PaperAuthorAffiliations.txt"), [0, 1], chunksize):
+        p = lookup(paper_ids, to_int(chunk.iloc[:, 0]))
+        s = p >= 0
+        papers += [p[s].astype(np.int32)]
+        authors += [to_int(chunk.iloc[:, 1])[s]]
+    papers, authors = np.concatenate(papers), np.concatenate(authors)
+
+    # Count an author once per paper
+    author_ids, author_index = np.unique(authors, return_inverse=True)
+    pairs = np.unique(papers.astype(np.int64) * author_ids.size + author_index)
+    return (
+        author_ids,
+        (pairs // author_ids.size).astype(np.int32),
+        (pairs % author_ids.size).astype(np.int32),
+    )
+
+
+def make_node_table(author_ids, paper_index, author_index, journal_ids):
+    """
+    Main journal and the number of papers of the authors
+    """
+    pcount = np.bincount(author_index, minlength=author_ids.size)
+    df = pd.DataFrame({"author": author_index, "journal": journal_ids[paper_index]})
+    df = df[df["journal"] >= 0]
+    counts = df.groupby(["author", "journal"]).size().reset_index(name="n")
+    counts = counts.sort_values(["author", "n", "journal"], ascending=[True, False, True])
+    main = counts.drop_duplicates("author")
+    mag_journal_id = -np.ones(author_ids.size, dtype=np.int64)
+    mag_journal_id[main["author"].values] = main["journal"].values
+    return pd.DataFrame({"id": author_ids, "mag_journal_id": mag_journal_id, "pcount": pcount})
+
+
+def read_citations(mag_dir, chunksize):
+    """
+    Citations in PaperReferences.txt as pairs of arrays of the MAG ids of
+    the citing and cited papers
+    """
+    for chunk in read_chunks(os.path.join(mag_dir, "PaperReferences.txt"), [0, 1], chunksize):
+        yield to_int(chunk.iloc[:, 0]), to_int(chunk.iloc[:, 1])
+
+
+def read_graph_citations(graph, first_year, last_year, year, chunksize):
+    """
+    Citations from the papers published in year to those published between
+    first_year and last_year in a CitationGraph, as pairs of arrays of the
+    MAG ids of the citing and cited papers
+    """
+    start, stop = graph.papers_in_years(year, year)
+    cited_start, cited_stop = graph.papers_in_years(first_year, last_year)
+    for b in range(start, stop, chunksize):
+        papers = np.arange(b, min(b + chunksize, stop))
+        indptr, cited = graph.references(papers)
+        citing = np.repeat(papers, np.diff(indptr))
+        s = (cited >= cited_start) & (cited < cited_stop)
+        yield graph.paper_ids[citing[s]], graph.paper_ids[cited[s]]
+
+
+def pair_batches(src_papers, trg_papers, indptr, max_pairs):
+    """
+    Bounds (start, stop) of consecutive citations with at most max_pairs
+    author pairs in total, except for a citation with more pairs, which
+    forms a batch by itself
+    """
+    num_pairs = np.diff(indptr)[src_papers].astype(np.int64) * np.diff(indptr)[trg_papers]
+    cum = np.cumsum(num_pairs)
+    bounds, start = [0], 0
+    while start < cum.size:
+        offset = cum[start - 1] if start > 0 else 0
+        stop = max(int(np.searchsorted(cum, offset + max_pairs, side="right")), start + 1)
+        bounds.append(stop)
+        start = stop
+    return zip(bounds[:-1], bounds[1:])
+
+
+def author_pairs(src_papers, trg_papers, indptr, authors):
+    """
+    Pairs of the authors of the citing and cited papers, one per citation and pair
+    """
+    n_src = np.diff(indptr)[src_papers].astype(np.int64)
+    n_trg = np.diff(indptr)[trg_papers].astype(np.int64)
+    num_pairs = n_src * n_trg
+    citation = np.repeat(np.arange(num_pairs.size), num_pairs)
+    offset = np.arange(citation.size) - np.repeat(np.cumsum(num_pairs) - num_pairs, num_pairs)
+    i, j = offset // n_trg[citation], offset % n_trg[citation]
+    return (
+        authors[indptr[src_papers[citation]] + i],
+        authors[indptr[trg_papers[citation]] + j],
+    )
+
+
+if __name__ == "__main__":
+
+    args = parse_args(sys.argv[1:])
+    YEAR = args.year
+    ys = YEAR - args.window_length
+    yf = YEAR
+
+    with tracing.span("load papers", year=YEAR) as sp:
+        paper_ids, years, journal_ids = load_papers(args.mag_dir, ys, yf, args.chunksize)
+        sp.output(paper_ids)
+
+    with tracing.span("load authorships", inputs=[paper_ids]) as sp:
+        author_ids, paper_index, author_index = load_authorships(
+            args.mag_dir, paper_ids, args.chunksize
+        )
+        nodes = make_node_table(author_ids, paper_index, author_index, journal_ids)
+
+        # Authors of each paper in the csr format, without the papers with too many authors
+        num_authors = np.bincount(paper_index, minlength=paper_ids.size)
+        skipped = num_authors > args.max_authors
+        s = ~skipped[paper_index]
+        indptr = np.zeros(paper_ids.size + 1, dtype=np.int64)
+        np.cumsum(np.where(skipped, 0, num_authors), out=indptr[1:])
+        authors = author_index[s]
+        print("authors", author_ids.size, "skipped papers", int(np.sum(skipped)))
+        sp.output(nodes)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output_dir)), exist_ok=True)
+    acc = outofcore.EdgeAccumulator(
+        author_ids.size, args.output_dir + ".work", num_buckets=args.num_buckets
+    )
+    with tracing.span("author citations", year=YEAR) as sp:
+        num_citations = 0
+        if args.citation_graph is None:
+            citations = read_citations(args.mag_dir, args.chunksize)
+        else:
+            graph = CitationGraph.load(args.citation_graph, mmap_mode="r")
+            citations = read_graph_citations(graph, ys, yf - 1, yf, args.chunksize)
+        for citing, cited in citations:
+            src = lookup(paper_ids, citing)
+            trg = lookup(paper_ids, cited)
+            s = (src >= 0) & (trg >= 0)
+            src, trg = src[s], trg[s]
+            s = (years[src] == yf) & (years[trg] < yf) & (years[trg] >= ys)
+            src, trg = src[s], trg[s]
+            num_citations += src.size
+            for b, e in pair_batches(src, trg, indptr, args.max_pairs):
+                acc.add(*author_pairs(src[b:e], trg[b:e], indptr, authors))
+        A = acc.save(args.output_dir)
+        print("citations", num_citations, "edges", A.nnz)
+        sp.output(A)
+
+    nodes.to_csv(os.path.join(args.output_dir, "nodes.csv"), sep="\t", index=False)
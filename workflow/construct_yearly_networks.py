@@ -4,6 +4,7 @@ import os
 import sys
 from scipy import sparse
 import utils
+import tracing
 
 PAPER_COUNT_FILE = sys.argv[1]
 YEAR = int(sys.argv[2])
@@ -17,7 +18,9 @@ if __name__ == "__main__":
     graph = utils.get_db()
 
     # Load the paper count
-    pcount = pd.read_csv(PAPER_COUNT_FILE, sep="\t")
+    with tracing.span("load paper count", inputs=[PAPER_COUNT_FILE]) as sp:
+        pcount = pd.read_csv(PAPER_COUNT_FILE, sep="\t")
+        sp.output(pcount)
 
     # Count the number of papers for each journal
     ys = YEAR - WINDOW_LENGTH
@@ -31,35 +34,39 @@ if __name__ == "__main__":
         yf,
         ys,
     )
-    edges = graph.run(query).to_data_frame()
+    edges = utils.run_query(graph, query)
     print(query, edges)
 
-    # Make a node table
-    ccount = edges.groupby(["target"])["s_target"].nunique()
-    nodes = pd.DataFrame({"ccount": ccount})
-    nodes = nodes.reset_index().rename(columns={"target": "id"})
+    with tracing.span("make tables", inputs=[edges, pcount]) as sp:
+        # Make a node table
+        ccount = edges.groupby(["target"])["s_target"].nunique()
+        nodes = pd.DataFrame({"ccount": ccount})
+        nodes = nodes.reset_index().rename(columns={"target": "id"})
 
-    # Slice the paper counts between ys and yf
-    s = (ys <= pcount.year) & (pcount.year < yf)
-    _pcount = pcount[s].copy()
-    _pcount = _pcount.groupby("id").agg("sum")["pcount"].reset_index()
+        # Slice the paper counts between ys and yf
+        s = (ys <= pcount.year) & (pcount.year < yf)
+        _pcount = pcount[s].copy()
+        _pcount = _pcount.groupby("id").agg("sum")["pcount"].reset_index()
 
-    # Merge the pcount to the node table
-    nodes = pd.merge(left=nodes, right=_pcount, left_on="id", right_on="id", how="left")
+        # Merge the pcount to the node table
+        nodes = pd.merge(
+            left=nodes, right=_pcount, left_on="id", right_on="id", how="left"
+        )
 
-    # Uniqify and count
-    edges = edges.groupby(["source", "target"]).size().reset_index(name="w")
+        # Uniqify and count
+        edges = edges.groupby(["source", "target"]).size().reset_index(name="w")
+        sp.output(nodes, edges)
 
     # Add citations from retracted papers 
-    if year == 2010 or year == 2011:
-        if year == 2010:
+    if YEAR == 2010 or YEAR == 2011:
+        if YEAR == 2010:
             added_edges = [
                 ["medical science monitor", "cell transplantation", 445],
                 ["the scientific world journal", "cell transplantation", 96],
                 ["medical science monitor", "medical science monitor", 44],
                 ["the scientific world journal", "the scientific world journal", 26],
             ]
-        elif year == 2011:
+        elif YEAR == 2011:
             added_edges = [
                 ["medical science monitor", "cell transplantation", 87],
                 ["medical science monitor", "medical science monitor", 32],
@@ -72,13 +79,13 @@ if __name__ == "__main__":
             set([x[0] for x in added_edges] + [x[1] for x in added_edges])
         )
         query = """
-        MATCH (Journal:n)
+        MATCH (n:Journal)
         WHERE n.NormalizedName in [{journals}]
         return toInteger(n.JournalId) as id, n.NormalizedName as name 
         """.format(
             journals=",".join(["'%s'" % x for x in journal_list])
         )
-        node_table = graph.run(query).to_data_frame()
+        node_table = utils.run_query(graph, query)
 
         name2id = {x["name"]: x["id"] for i, x in node_table.iterrows()}
         edge_list = [
@@ -89,5 +96,6 @@ if __name__ == "__main__":
         edges = pd.concat([edges, added_edges], ignore_index=True)
 
     # Save to the result
-    nodes.to_csv(OUTPUT_NODE_FILE, sep="\t")
-    edges.to_csv(OUTPUT_EDGE_FILE, sep="\t")
+    with tracing.span("save", inputs=[nodes, edges]):
+        nodes.to_csv(OUTPUT_NODE_FILE, sep="\t")
+        edges.to_csv(OUTPUT_EDGE_FILE, sep="\t")
@@ -1,6 +1,7 @@
 import pandas as pd
 import sys
 import utils
+import tracing
 
 PAPER_COUNT_FILE = sys.argv[1]
 
@@ -14,6 +15,7 @@ if __name__ == "__main__":
     MATCH (j:Journal)<-[:published_from]-(p)
     return ID(j) as id, count(p) as pcount, p.Year as year
     """
-    df = graph.run(query).to_data_frame()
+    df = utils.run_query(graph, query)
 
-    df.to_csv(PAPER_COUNT_FILE, sep="\t")
+    with tracing.span("save", inputs=[df]):
+        df.to_csv(PAPER_COUNT_FILE, sep="\t")
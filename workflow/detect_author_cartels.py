@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # About this code
+#
+# Detect the author cartels for a year in the author citation network
+# built by construct_author_networks.py, with cidre.outofcore. The network
+# is read from disk in slabs of edges, so the memory is about the size of
+# the pruned network and the node arrays plus MEMORY (Default 8G) for the
+# slabs. An author belongs to the community of the journal in which the
+# author published the most papers. The authors without such a journal
+# form a community of their own.
+#
+# Usage:
+#   python3 workflow/detect_author_cartels.py YEAR AUTHOR_NETWORK_DIR THETA ALPHA COMMUNITY_FILE OUTPUT [MEMORY]
+#
+import numpy as np
+import pandas as pd
+import tracing
+import sys, os
+from detect_cartels import load_community_table
+
+sys.path.append(os.path.abspath(os.path.join("libs/cidre")))
+from cidre import outofcore
+from cidre import cache as cidre_cache
+
+MIN_GROUP_EDGE_NUM = 50  # Same as that in detect_cartels.py
+
+# Approximate memory for the temporary arrays per edge in a slab
+BYTES_PER_EDGE = 100
+
+
+def find_author_community_ids(node_journal_ids, journal_index, community_ids):
+    """
+    Community of the main journal of each author. The authors without a
+    journal in the community table are given the community max(community_ids) + 1.
+    """
+    pos = np.minimum(np.searchsorted(journal_index, node_journal_ids), journal_index.size - 1)
+    found = journal_index[pos] == node_journal_ids
+    return np.where(found, community_ids[pos], np.max(community_ids) + 1)
+
+
+if __name__ == "__main__":
+
+    YEAR = int(sys.argv[1])
+    AUTHOR_NETWORK_DIR = sys.argv[2]
+    THETA = float(sys.argv[3])
+    ALPHA = float(sys.argv[4])
+    COMMUNITY_FILE = sys.argv[5]
+    OUTPUT = sys.argv[6]
+    MEMORY = sys.argv[7] if len(sys.argv) > 7 else "8G"  # Optional
+
+    chunk_edges = max(1000000, cidre_cache.parse_size(MEMORY) // BYTES_PER_EDGE)
+
+    journal_index, community_ids = load_community_table(COMMUNITY_FILE)
+    nodes = pd.read_csv(os.path.join(AUTHOR_NETWORK_DIR, "nodes.csv"), sep="\t")
+    A = outofcore.load_csr(AUTHOR_NETWORK_DIR)
+    node_community_ids = find_author_community_ids(
+        nodes["mag_journal_id"].values, journal_index, community_ids
+    )
+
+    with tracing.span("detect", inputs=[A], year=YEAR, chunk_edges=chunk_edges) as sp:
+        cartel_table = outofcore.detect(
+            A,
+            node_community_ids,
+            THETA,
+            ALPHA,
+            min_group_edge_num=MIN_GROUP_EDGE_NUM,
+            chunk_edges=chunk_edges,
+        )
+        sp.output(cartel_table)
+
+    node_ids = cartel_table["node_id"].values
+    cartel_table["mag_author_id"] = nodes["id"].values[node_ids]
+    cartel_table["mag_journal_id"] = nodes["mag_journal_id"].values[node_ids]
+    cartel_table["year"] = YEAR
+    cartel_table.to_csv(OUTPUT, sep="\t", index=False)
+    print("year", YEAR, "number of groups", cartel_table["group_id"].nunique())
@@ -1,10 +1,89 @@
 import numpy as np
 import pandas as pd
 import utils
-import sys
+import tracing
+import sys, os
 
 sys.path.append(os.path.abspath(os.path.join("libs/cidre")))
 from cidre import cidre, filters
+from cidre import cache as cidre_cache
+from cidre.store import CartelStore
+
+
+def load_community_table(community_file):
+    """
+    Load the community membership of journals
+
+    Returns
+    -------
+    journal_index : numpy.ndarray
+        Sorted MAG journal ids
+    community_ids : numpy.ndarray
+        community_ids[i] is the community of journal journal_index[i]
+    """
+    community_table = pd.read_csv(community_file, sep="\t")
+    journal_ids = community_table["mag_journal_id"].values
+    order = np.argsort(journal_ids)
+    return journal_ids[order], community_table["community_id"].values[order]
+
+
+def find_community_ids(nodes, journal_index, community_ids):
+    """
+    Community of each journal in nodes
+    """
+    pos = np.minimum(np.searchsorted(journal_index, nodes), journal_index.size - 1)
+    missing = journal_index[pos] != nodes
+    if np.any(missing):
+        raise KeyError(
+            "No community for journals %s" % ", ".join(map(str, nodes[missing][:10]))
+        )
+    return community_ids[pos]
+
+
+def detect_cartels(year, network_dir, theta, alpha, journal_index, community_ids):
+    """
+    Detect the cartels in the network for a year
+
+    Returns
+    -------
+    cartel_table : pandas.DataFrame
+        Table given by cidre.detect with the column mag_journal_id
+    group_stats : pandas.DataFrame
+        Statistics of the groups given by cidre.summarize
+    """
+
+    cache = cidre_cache.from_env()
+
+    # Load the network data
+    A_eff, A_gen, nodes = utils.load_network(year, network_dir, cache=cache)
+
+    # Community membership of the journals in the network
+    node_community_ids = find_community_ids(nodes, journal_index, community_ids)
+
+    # Define the filter
+    with tracing.span("filter", inputs=[A_eff, A_gen], year=year):
+        is_excessive_func = filters.get_dcsbm_threshold_filter(
+            A_eff,
+            A_gen,
+            node_community_ids,
+            ref_frac_weight=0.5,
+            alpha=alpha,
+            cache=cache,
+        )
+
+    # Detect cartel
+    with tracing.span("detect", inputs=[A_eff], year=year) as sp:
+        cartel_table = cidre.detect(
+            A_eff, theta, is_excessive_func, min_group_edge_num=50, cache=cache
+        )
+        sp.output(cartel_table)
+
+    with tracing.span("summarize", inputs=[cartel_table], year=year):
+        group_stats = cidre.summarize(A_eff, cartel_table)
+
+    # Rename node labels
+    cartel_table["mag_journal_id"] = nodes[cartel_table["node_id"].values]
+    return cartel_table, group_stats
 
 
 #
@@ -18,26 +97,25 @@ if __name__ == "__main__":
     ALPHA = float(sys.argv[4])
     COMMUNITY_FILE = sys.argv[5]
     OUTPUT = sys.argv[6]
-
-    # Load the network data
-    A_eff, A_gen, nodes = utils.load_network(YEAR, NETWORK_DIR)
+    STORE_DIR = sys.argv[7] if len(sys.argv) > 7 else None  # Optional
 
     # Load the communty membership
-    community_table = pd.read_csv(COMMUNITY_FILE, sep="\t")
-    community_ids = (
-        community_table.set_index("mag_journal_ids").loc[nodes, "community_id"].values
-    )
+    journal_index, community_ids = load_community_table(COMMUNITY_FILE)
 
-    # Define the filter
-    is_excessive_func = filters.get_dcsbm_threshold_filter(
-        A_eff, A_gen, community_ids, ref_frac_weight=0.5, alpha=ALPHA
+    cartel_table, group_stats = detect_cartels(
+        YEAR, NETWORK_DIR, THETA, ALPHA, journal_index, community_ids
     )
 
-    # Detect cartel
-    cartel_table = cidre.detect(A_eff, THETA, is_excessive_func, min_group_edge_num=50)
-
-    # Rename node labels
-    cartel_table["mag_journal_id"] = cartel_table["node_id"].apply(lambda x : nodes[x])
-
     # Save results
     cartel_table.to_csv(OUTPUT, sep="\t")
+
+    # Add or replace the year in the cartel store. Concurrent runs for
+    # different years must not share a store; use detect_cartels_all.py.
+    if STORE_DIR is not None:
+        if os.path.isdir(STORE_DIR):
+            store = CartelStore.open(STORE_DIR).with_tables(
+                {YEAR: cartel_table}, {YEAR: group_stats}
+            )
+        else:
+            store = CartelStore.from_tables({YEAR: cartel_table}, group_stats={YEAR: group_stats})
+        store.save(STORE_DIR)
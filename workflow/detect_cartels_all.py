@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # About this code
+#
+# Detect the cartels in the networks for all years in one process.
+# The community membership is loaded once and shared with a pool of
+# worker processes, each of which detects the cartels for one year at
+# a time and writes the file for the year. The cartels of all years are
+# then saved in the columnar store (see libs/cidre/cidre/store.py) together
+# with the statistics of the groups.
+#
+import sys, os
+from multiprocessing import Pool
+from detect_cartels import load_community_table, detect_cartels
+import tracing
+
+sys.path.append(os.path.abspath(os.path.join("libs/cidre")))
+from cidre import sharedmem
+from cidre.store import CartelStore
+
+# State of the worker processes set by init_worker
+_worker = {}
+
+
+def init_worker(handle, network_dir, theta, alpha, output_template):
+    arrays, _, blocks = sharedmem.attach(handle)
+    _worker.update(arrays)
+    _worker["blocks"] = blocks
+    _worker["network_dir"] = network_dir
+    _worker["theta"] = theta
+    _worker["alpha"] = alpha
+    _worker["output_template"] = output_template
+
+
+def detect_and_save(year):
+    with tracing.span("detect_cartels", year=year):
+        cartel_table, group_stats = detect_cartels(
+            year,
+            _worker["network_dir"],
+            _worker["theta"],
+            _worker["alpha"],
+            _worker["journal_index"],
+            _worker["community_ids"],
+        )
+        cartel_table.to_csv(_worker["output_template"].format(year=year), sep="\t")
+    return year, cartel_table, group_stats
+
+
+if __name__ == "__main__":
+
+    NETWORK_DIR = sys.argv[1]
+    THETA = float(sys.argv[2])
+    ALPHA = float(sys.argv[3])
+    COMMUNITY_FILE = sys.argv[4]
+    OUTPUT_TEMPLATE = sys.argv[5]  # e.g., "data/cartels/cartels-{year}.csv"
+    STORE_DIR = sys.argv[6]  # e.g., "data/cartels/store"
+    N_JOBS = int(sys.argv[7])
+    YEARS = [int(y) for y in sys.argv[8:]]
+
+    # Load the communty membership once and share it with the workers
+    with tracing.span("load communities", inputs=[COMMUNITY_FILE]):
+        journal_index, community_ids = load_community_table(COMMUNITY_FILE)
+
+    n_jobs = max(1, min(N_JOBS, os.cpu_count(), len(YEARS)))
+    tables = {}
+    group_stats = {}
+    with sharedmem.shared(
+        arrays={"journal_index": journal_index, "community_ids": community_ids}
+    ) as handle, tracing.span("pool", n_jobs=n_jobs), Pool(
+        n_jobs,
+        initializer=init_worker,
+        initargs=(handle, NETWORK_DIR, THETA, ALPHA, OUTPUT_TEMPLATE),
+    ) as pool:
+        # Start from the later years, which have larger networks
+        for year, cartel_table, stats in pool.imap_unordered(
+            detect_and_save, sorted(YEARS, reverse=True)
+        ):
+            print("year", year, "number of groups", stats.shape[0])
+            tables[year] = cartel_table
+            group_stats[year] = stats
+
+    with tracing.span("save store", num_years=len(tables)):
+        CartelStore.from_tables(tables, group_stats=group_stats).save(STORE_DIR)
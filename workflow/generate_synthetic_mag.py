@@ -0,0 +1,408 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # About this code
+#
+# Generate a synthetic dataset in the format of the Microsoft Academic Graph
+# (MAG) with planted citation cartels. The files replace the MAG dump
+# downloaded by get_mag_data.py, so that the whole workflow can run
+# offline at a controllable scale.
+#
+# Papers are published in journals that belong to fields. Each paper cites
+# papers in the previous years, mostly in the same field, with the
+# probability decaying with the age of the cited paper. The papers in the
+# member journals of a cartel give extra citations to the papers published
+# in the other member journals in the previous WINDOW years while the
+# cartel is active. The planted cartels are saved in a separate file.
+#
+# Usage:
+#   python3 workflow/generate_synthetic_mag.py OUTPUT_DIR GROUND_TRUTH_FILE [options]
+#
+import numpy as np
+import pandas as pd
+import argparse
+import sys, os
+
+sys.path.append(os.path.abspath(os.path.join("libs/cidre")))
+from cidre import synthetic
+import tracing
+
+FIELDS = [
+    "physics", "chemistry", "biology", "medicine", "mathematics",
+    "computer science", "economics", "psychology", "sociology", "geology",
+    "materials science", "engineering", "ecology", "neuroscience", "oncology",
+    "immunology", "pharmacology", "agriculture", "linguistics", "history",
+]
+PREFIXES = [
+    "journal of", "international journal of", "annals of", "advances in", "reviews in",
+]
+
+# Columns of the MAG files in order. See
+# https://docs.microsoft.com/en-us/academic-services/graph/reference-data-schema
+PAPER_COLUMNS = [
+    "PaperId", "Rank", "Doi", "DocType", "PaperTitle", "OriginalTitle",
+    "BookTitle", "Year", "Date", "Publisher", "JournalId", "ConferenceSeriesId",
+    "ConferenceInstanceId", "Volume", "Issue", "FirstPage", "LastPage",
+    "ReferenceCount", "CitationCount", "EstimatedCitation", "OriginalVenue",
+    "FamilyId", "CreatedDate",
+]
+JOURNAL_COLUMNS = [
+    "JournalId", "Rank", "NormalizedName", "DisplayName", "Issn", "Publisher",
+    "Webpage", "PaperCount", "CitationCount", "CreatedDate",
+]
+AUTHOR_COLUMNS = [
+    "AuthorId", "Rank", "NormalizedName", "DisplayName", "LastKnownAffiliationId",
+    "PaperCount", "CitationCount", "CreatedDate",
+]
+AUTHORSHIP_COLUMNS = [
+    "PaperId", "AuthorId", "AffiliationId", "AuthorSequenceNumber",
+    "OriginalAuthor", "OriginalAffiliation",
+]
+CONFERENCE_COLUMNS = [
+    "ConferenceSeriesId", "Rank", "NormalizedName", "DisplayName", "PaperCount",
+    "CitationCount", "CreatedDate",
+]
+
+JOURNAL_ID_OFFSET = 10 ** 6
+PAPER_ID_OFFSET = 10 ** 9
+AUTHOR_ID_OFFSET = 2 * 10 ** 9
+CREATED_DATE = "2016-06-24"
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Generate a synthetic MAG dataset")
+    parser.add_argument("output_dir", help="Directory for the MAG files")
+    parser.add_argument("ground_truth_file", help="File for the planted cartels")
+    parser.add_argument("--num-journals", type=int, default=1000)
+    parser.add_argument("--num-fields", type=int, default=20)
+    parser.add_argument("--num-authors", type=int, default=100000)
+    parser.add_argument("--first-year", type=int, default=1990)
+    parser.add_argument("--last-year", type=int, default=2019)
+    parser.add_argument("--papers-per-year", type=int, default=20000)
+    parser.add_argument(
+        "--growth-rate", type=float, default=0.03,
+        help="Annual growth of the number of papers",
+    )
+    parser.add_argument("--mean-references", type=float, default=20)
+    parser.add_argument(
+        "--max-citation-age", type=int, default=10,
+        help="Papers cite papers published at most this many years before",
+    )
+    parser.add_argument(
+        "--citation-decay", type=float, default=0.3,
+        help="Decay of the citation probability per year of age",
+    )
+    parser.add_argument(
+        "--mixing", type=float, default=0.2,
+        help="Fraction of citations to papers in other fields",
+    )
+    parser.add_argument("--num-cartels", type=int, default=20)
+    parser.add_argument("--cartel-size", type=int, nargs=2, default=[2, 6])
+    parser.add_argument(
+        "--cartel-duration", type=int, nargs=2, default=[2, 6],
+        help="Minimum and maximum number of years a cartel is active",
+    )
+    parser.add_argument(
+        "--cartel-references", type=float, default=10,
+        help="Extra references per paper in a cartel",
+    )
+    parser.add_argument(
+        "--cartel-window", type=int, default=2,
+        help="Cartel citations go to papers published in this many previous years",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def make_journals(args, rng):
+    """
+    Journals with their fields and sizes
+    """
+    field_names = [
+        FIELDS[i % len(FIELDS)] + ("" if i < len(FIELDS) else " %d" % (i // len(FIELDS)))
+        for i in range(args.num_fields)
+    ]
+    field_ids = rng.integers(args.num_fields, size=args.num_journals)
+    names = [
+        "%s %s %d" % (PREFIXES[i % len(PREFIXES)], field_names[f], i)
+        for i, f in enumerate(field_ids)
+    ]
+    return pd.DataFrame(
+        {
+            "journal_id": JOURNAL_ID_OFFSET + np.arange(args.num_journals),
+            "field_id": field_ids,
+            "name": names,
+            "size": rng.lognormal(0, 1, size=args.num_journals),
+        }
+    )
+
+
+def make_papers(args, journals, rng):
+    """
+    Papers with their journals, years and fitness
+    """
+    years = np.arange(args.first_year, args.last_year + 1)
+    n_papers = np.round(
+        args.papers_per_year * (1 + args.growth_rate) ** (years - years[0])
+    ).astype(int)
+    p = journals["size"].values / journals["size"].sum()
+    journal_idx = np.concatenate([rng.choice(len(p), size=n, p=p) for n in n_papers])
+    year = np.repeat(years, n_papers)
+    return pd.DataFrame(
+        {
+            "paper_id": PAPER_ID_OFFSET + np.arange(year.size),
+            "journal": journal_idx,
+            "year": year,
+            "fitness": rng.lognormal(0, 1, size=year.size),
+        }
+    )
+
+
+def plant_cartels(args, journals, rng):
+    """
+    Members and active years of the cartels
+    """
+    sizes = rng.integers(
+        args.cartel_size[0], args.cartel_size[1] + 1, size=args.num_cartels
+    )
+    members = rng.choice(len(journals), size=np.sum(sizes), replace=False)
+    durations = rng.integers(
+        args.cartel_duration[0], args.cartel_duration[1] + 1, size=args.num_cartels
+    )
+    start = rng.integers(
+        args.first_year + args.cartel_window, args.last_year - durations + 2
+    )
+    cartel_ids = np.repeat(np.arange(args.num_cartels), sizes)
+    return pd.DataFrame(
+        {
+            "cartel_id": cartel_ids,
+            "journal": members,
+            "mag_journal_id": journals["journal_id"].values[members],
+            "name": journals["name"].values[members],
+            "first_year": start[cartel_ids],
+            "last_year": (start + durations - 1)[cartel_ids],
+        }
+    )
+
+
+def sample_references(args, papers, journals, cartels, rng):
+    """
+    Generate the references year by year
+
+    Yields
+    ------
+    citing, cited : numpy.ndarray
+        Indices of the citing and cited papers
+    """
+    years = np.arange(args.first_year, args.last_year + 1)
+    n_years = years.size
+    K = args.num_fields
+    paper_year = papers["year"].values - years[0]
+    paper_field = journals["field_id"].values[papers["journal"].values]
+    paper_journal = papers["journal"].values
+
+    # Samplers of papers in (year, field) and in (journal, year)
+    field_block = paper_year * K + paper_field
+    field_block_size = np.bincount(field_block, minlength=n_years * K)
+    sample_by_field = synthetic.make_block_sampler(papers["fitness"].values, field_block)
+    journal_block = paper_journal * n_years + paper_year
+    journal_block_size = np.bincount(journal_block, minlength=len(journals) * n_years)
+    sample_by_journal = synthetic.make_block_sampler(np.ones(len(papers)), journal_block)
+
+    # Distribution of the age of cited papers
+    ages = np.arange(1, args.max_citation_age + 1)
+    p_age = (1 - args.citation_decay) ** (ages - 1)
+    p_age /= p_age.sum()
+
+    cartel_of = -np.ones(len(journals), dtype=int)
+    cartel_of[cartels["journal"].values] = cartels["cartel_id"].values
+    cartel_members = cartels.groupby("cartel_id")["journal"].apply(np.array).to_dict()
+    cartel_years = cartels.groupby("cartel_id")[["first_year", "last_year"]].first()
+
+    for t in range(n_years):
+        citing_papers = np.where(paper_year == t)[0]
+
+        # Regular citations
+        num_refs = rng.poisson(args.mean_references, size=citing_papers.size)
+        citing = np.repeat(citing_papers, num_refs)
+        field = paper_field[citing]
+        other_field = rng.random(citing.size) < args.mixing
+        field[other_field] = rng.integers(K, size=np.sum(other_field))
+        cited_year = t - rng.choice(ages, size=citing.size, p=p_age)
+        s = cited_year >= 0
+        citing, block = citing[s], cited_year[s] * K + field[s]
+        s = field_block_size[block] > 0
+        citing, block = citing[s], block[s]
+        cited = sample_by_field(block, rng)
+
+        # Cartel citations
+        active = [
+            c
+            for c, (y0, y1) in cartel_years.iterrows()
+            if y0 <= years[t] <= y1
+        ]
+        extra_citing, extra_cited = [], []
+        for c in active:
+            members = cartel_members[c]
+            source = citing_papers[np.isin(paper_journal[citing_papers], members)]
+            n = rng.poisson(args.cartel_references, size=source.size)
+            src = np.repeat(source, n)
+            trg_journal = members[rng.integers(members.size, size=src.size)]
+            s = trg_journal != paper_journal[src]
+            src, trg_journal = src[s], trg_journal[s]
+            trg_year = t - rng.integers(1, args.cartel_window + 1, size=src.size)
+            block = trg_journal * n_years + trg_year
+            s = (trg_year >= 0)
+            s[s] = journal_block_size[block[s]] > 0
+            extra_citing.append(src[s])
+            extra_cited.append(sample_by_journal(block[s], rng))
+
+        citing = np.concatenate([citing] + extra_citing)
+        cited = np.concatenate([cited] + extra_cited)
+
+        # Remove duplicated references
+        pairs = np.unique(citing.astype(np.int64) * len(papers) + cited)
+        yield pairs // len(papers), pairs % len(papers)
+
+
+def sample_authorships(args, num_papers, rng):
+    """
+    Authors of the papers
+
+    Returns
+    -------
+    paper, author, seq : numpy.ndarray
+        Indices of the papers and authors, and the sequence number of the author
+    """
+    num_authors = 1 + rng.poisson(2, size=num_papers)
+    paper = np.repeat(np.arange(num_papers), num_authors)
+    author = rng.integers(args.num_authors, size=paper.size)
+    first = np.cumsum(num_authors) - num_authors
+    seq = np.arange(paper.size) - np.repeat(first, num_authors) + 1
+    return paper, author, seq
+
+
+def to_mag_table(columns, **values):
+    """
+    Table with the columns of a MAG file, where missing columns are empty
+    """
+    n = len(next(iter(values.values())))
+    return pd.DataFrame(
+        {c: values[c] if c in values else np.full(n, "", dtype=object) for c in columns}
+    )
+
+
+def write(table, filename, mode="w"):
+    with tracing.span("write " + os.path.basename(filename), inputs=[table]):
+        table.to_csv(filename, sep="\t", header=False, index=False, mode=mode)
+
+
+if __name__ == "__main__":
+
+    args = parse_args(sys.argv[1:])
+    rng = np.random.default_rng(args.seed)
+    os.makedirs(args.output_dir, exist_ok=True)
+    output = lambda name: os.path.join(args.output_dir, name)
+
+    with tracing.span("make papers") as sp:
+        journals = make_journals(args, rng)
+        papers = make_papers(args, journals, rng)
+        cartels = plant_cartels(args, journals, rng)
+        sp.output(journals, papers, cartels)
+
+    # References
+    reference_count = np.zeros(len(papers), dtype=int)
+    citation_count = np.zeros(len(papers), dtype=int)
+    open(output("PaperReferences.txt"), "w").close()
+    for citing, cited in sample_references(args, papers, journals, cartels, rng):
+        reference_count += np.bincount(citing, minlength=len(papers))
+        citation_count += np.bincount(cited, minlength=len(papers))
+        write(
+            pd.DataFrame(
+                {
+                    "PaperId": papers["paper_id"].values[citing],
+                    "PaperReferenceId": papers["paper_id"].values[cited],
+                }
+            ),
+            output("PaperReferences.txt"),
+            mode="a",
+        )
+
+    # Papers
+    paper_ids = papers["paper_id"].values
+    write(
+        to_mag_table(
+            PAPER_COLUMNS,
+            PaperId=paper_ids,
+            Rank=20000 - np.minimum(citation_count, 10000),
+            DocType=np.full(len(papers), "Journal", dtype=object),
+            PaperTitle=["synthetic paper %d" % i for i in paper_ids],
+            OriginalTitle=["Synthetic Paper %d" % i for i in paper_ids],
+            Year=papers["year"].values,
+            Date=["%d-01-01" % y for y in papers["year"].values],
+            JournalId=journals["journal_id"].values[papers["journal"].values],
+            ReferenceCount=reference_count,
+            CitationCount=citation_count,
+            EstimatedCitation=citation_count,
+            FamilyId=paper_ids,
+            CreatedDate=np.full(len(papers), CREATED_DATE, dtype=object),
+        ),
+        output("Papers.txt"),
+    )
+
+    # Journals
+    paper_count = np.bincount(papers["journal"].values, minlength=len(journals))
+    journal_citation_count = np.bincount(
+        papers["journal"].values, weights=citation_count, minlength=len(journals)
+    ).astype(int)
+    write(
+        to_mag_table(
+            JOURNAL_COLUMNS,
+            JournalId=journals["journal_id"].values,
+            Rank=np.full(len(journals), 10000),
+            NormalizedName=journals["name"].values,
+            DisplayName=[x.title() for x in journals["name"].values],
+            PaperCount=paper_count,
+            CitationCount=journal_citation_count,
+            CreatedDate=np.full(len(journals), CREATED_DATE, dtype=object),
+        ),
+        output("Journals.txt"),
+    )
+
+    # Authors
+    paper, author, seq = sample_authorships(args, len(papers), rng)
+    author_ids = AUTHOR_ID_OFFSET + np.arange(args.num_authors)
+    write(
+        to_mag_table(
+            AUTHORSHIP_COLUMNS,
+            PaperId=paper_ids[paper],
+            AuthorId=author_ids[author],
+            AuthorSequenceNumber=seq,
+        ),
+        output("PaperAuthorAffiliations.txt"),
+    )
+    names = ["author %d" % i for i in range(args.num_authors)]
+    write(
+        to_mag_table(
+            AUTHOR_COLUMNS,
+            AuthorId=author_ids,
+            Rank=np.full(args.num_authors, 20000),
+            NormalizedName=names,
+            DisplayName=[x.title() for x in names],
+            PaperCount=np.bincount(author, minlength=args.num_authors),
+            CitationCount=np.bincount(
+                author, weights=citation_count[paper], minlength=args.num_authors
+            ).astype(int),
+            CreatedDate=np.full(args.num_authors, CREATED_DATE, dtype=object),
+        ),
+        output("Authors.txt"),
+    )
+
+    # No papers are published in conferences
+    write(
+        to_mag_table(CONFERENCE_COLUMNS, ConferenceSeriesId=[]),
+        output("ConferenceSeries.txt"),
+    )
+
+    # Ground truth
+    cartels.drop(columns="journal").to_csv(args.ground_truth_file, sep="\t", index=False)
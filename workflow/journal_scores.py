@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # About this code
+#
+# Compute the donor and recipient ratios and the critical thresholds of all
+# journals in all years (see cidre.critical_thresholds), and save them as
+# journal x year arrays that share one journal index:
+#
+#   OUTPUT_DIR/journals.npy             Sorted MAG journal ids
+#   OUTPUT_DIR/years.npy                Years
+#   OUTPUT_DIR/donor_ratio.npy          float32 array of shape (journals, years)
+#   OUTPUT_DIR/recipient_ratio.npy
+#   OUTPUT_DIR/critical_threshold.npy
+#
+# The value is NaN if the journal is not in the network of the year. The
+# arrays are stored row by row, so the trajectory of a journal is one
+# contiguous row of a memory-mapped array:
+#
+#   scores = load_journal_scores(OUTPUT_DIR)
+#   trajectories(scores, [journal_id], "critical_threshold")
+#
+# Usage:
+#   python3 workflow/journal_scores.py NETWORK_DIR ALPHA COMMUNITY_FILE OUTPUT_DIR YEARS...
+#
+import numpy as np
+import sys, os
+import utils
+import tracing
+from detect_cartels import load_community_table, find_community_ids
+
+sys.path.append(os.path.abspath(os.path.join("libs/cidre")))
+from cidre import cidre, filters
+from cidre import cache as cidre_cache
+
+SCORE_NAMES = ["donor_ratio", "recipient_ratio", "critical_threshold"]
+
+
+def compute_scores(year, network_dir, alpha, journal_index, community_ids, cache=None):
+    """
+    Scores of the journals in the network of a year
+
+    Returns
+    -------
+    nodes : numpy.ndarray
+        MAG journal ids of the nodes
+    scores : dict
+        scores[name][i] is the score of node i for the names in SCORE_NAMES
+    """
+    A_eff, A_gen, nodes = utils.load_network(year, network_dir, cache=cache)
+    node_community_ids = find_community_ids(nodes, journal_index, community_ids)
+    with tracing.span("filter", inputs=[A_eff, A_gen], year=year):
+        is_excessive = filters.get_dcsbm_threshold_filter(
+            A_eff, A_gen, node_community_ids, ref_frac_weight=0.5, alpha=alpha, cache=cache
+        )
+    with tracing.span("critical_thresholds", inputs=[A_eff], year=year):
+        scores = dict(zip(SCORE_NAMES, cidre.critical_thresholds(A_eff, is_excessive)))
+    return nodes, scores
+
+
+def to_journal_year_arrays(years, results):
+    """
+    Lay out the scores of the years on a shared journal index
+
+    Parameters
+    ----------
+    years : list of int
+        Years
+    results : list
+        results[t] is (nodes, scores) given by compute_scores for years[t]
+
+    Returns
+    -------
+    journals : numpy.ndarray
+        Sorted MAG journal ids
+    arrays : dict
+        arrays[name][j, t] is the score of journal j in year t
+    """
+    journals = np.unique(np.concatenate([nodes for nodes, _ in results]))
+    arrays = {
+        name: np.full((journals.size, len(years)), np.nan, dtype=np.float32)
+        for name in SCORE_NAMES
+    }
+    for t, (nodes, scores) in enumerate(results):
+        rows = np.searchsorted(journals, nodes)
+        for name in SCORE_NAMES:
+            arrays[name][rows, t] = scores[name]
+    return journals, arrays
+
+
+def save_journal_scores(output_dir, journals, years, arrays):
+    os.makedirs(output_dir, exist_ok=True)
+    np.save(os.path.join(output_dir, "journals.npy"), journals)
+    np.save(os.path.join(output_dir, "years.npy"), np.asarray(years))
+    for name, arr in arrays.items():
+        np.save(os.path.join(output_dir, name + ".npy"), np.ascontiguousarray(arr))
+
+
+def load_journal_scores(output_dir):
+    """
+    Load the scores saved by this script as memory maps
+
+    Returns
+    -------
+    scores : dict
+        journals, years, and the arrays of the scores
+    """
+    scores = {
+        name: np.load(os.path.join(output_dir, name + ".npy"), mmap_mode="r")
+        for name in ["journals", "years"] + SCORE_NAMES
+    }
+    return scores
+
+
+def trajectories(scores, journal_ids, name):
+    """
+    Time series of a score for journals
+
+    Parameters
+    ----------
+    scores : dict
+        Scores given by load_journal_scores
+    journal_ids : list of int
+        MAG journal ids
+    name : str
+        Name of the score, e.g., "critical_threshold"
+
+    Returns
+    -------
+    ts : numpy.ndarray
+        ts[k, t] is the score of journal_ids[k] in scores["years"][t].
+        The row is NaN if the journal is in none of the networks.
+    """
+    journals = scores["journals"]
+    journal_ids = np.asarray(journal_ids)
+    pos = np.minimum(np.searchsorted(journals, journal_ids), journals.size - 1)
+    found = journals[pos] == journal_ids
+    ts = np.full((journal_ids.size, scores["years"].size), np.nan, dtype=np.float32)
+    ts[found] = scores[name][pos[found]]
+    return ts
+
+
+if __name__ == "__main__":
+
+    NETWORK_DIR = sys.argv[1]
+    ALPHA = float(sys.argv[2])
+    COMMUNITY_FILE = sys.argv[3]
+    OUTPUT_DIR = sys.argv[4]
+    YEARS = [int(y) for y in sys.argv[5:]]
+
+    journal_index, community_ids = load_community_table(COMMUNITY_FILE)
+    cache = cidre_cache.from_env()
+
+    results = []
+    for year in YEARS:
+        results.append(
+            compute_scores(year, NETWORK_DIR, ALPHA, journal_index, community_ids, cache)
+        )
+        num_positive = np.sum(results[-1][1]["critical_threshold"] > 0)
+        print("year", year, "journals with a positive critical threshold", num_positive)
+
+    with tracing.span("save") as sp:
+        journals, arrays = to_journal_year_arrays(YEARS, results)
+        save_journal_scores(OUTPUT_DIR, journals, YEARS, arrays)
+        sp.output(*arrays.values())
@@ -38,7 +38,7 @@ if __name__ == "__main__":
     MATCH (n: Journal)
     return toInteger(n.JournalId) as mag_journal_id, n.NormalizedName as name
     """
-    journals = graph.run(query).to_data_frame()
+    journals = utils.run_query(graph, query)
 
     # Matching journals by names
     name2id = {}
@@ -53,7 +53,7 @@ if __name__ == "__main__":
             wos_journal_name.lower()
         )
 
-        res = graph.run(query).to_data_frame()
+        res = utils.run_query(graph, query)
 
         if res.shape[0] == 1:  # exact match
             jid = res["mag_journal_id"][0]
@@ -12,26 +12,16 @@
 import numpy as np
 import sys
 import pandas as pd
-from scipy import sparse
 import matplotlib.pyplot as plt
 import seaborn as sns
 import matplotlib.colors as colors
 from matplotlib import cm
+import utils
+import tracing
+import os
 
-
-def load_detected_cartels(years, cartel_dir):
-    cartel_table_list = []
-    group_id_offset = 0
-    for year in years:
-        cartel_table = pd.read_csv(
-            "{root}/cartels-{year}.csv".format(root=cartel_dir, year=year), sep="\t"
-        )
-        cartel_table["year"] = year
-        cartel_table["group_id"] += group_id_offset
-        group_id_offset = np.max(cartel_table["group_id"].values) + 1
-        cartel_table_list += [cartel_table]
-    cartel_table = pd.concat(cartel_table_list, ignore_index=True)
-    return cartel_table
+sys.path.append(os.path.abspath(os.path.join("libs/cidre")))
+from cidre import groups
 
 
 def load_journal_groups_suspended_by_TR(filename):
@@ -43,12 +33,7 @@ def const_membership_matrix(T, node_id_col, membership_id_col, N):
     Construct the membership matrix from pandas dataframe
     The matrix U[i,k] = 1 if node i belongs to the kth group. Otherwise U[i,k] = 0. 
     """
-    node_id = T[node_id_col].values
-    membership_id = T[membership_id_col].values
-    return sparse.csc_matrix(
-        (np.ones(len(node_id)), (node_id, membership_id)),
-        shape=(N, np.max(membership_id) + 1),
-    )
+    return groups.membership_matrix(T[node_id_col].values, T[membership_id_col].values, N)
 
 
 def add_id_column(Ta, Tb, node_id_col="mag_journal_id"):
@@ -56,37 +41,19 @@ def add_id_column(Ta, Tb, node_id_col="mag_journal_id"):
     Add a column ,_id, to two tables, Ta and Tb, 
     that indicates the id for the union of the node_id_col columns for Ta and Tb
     """
-    # Find all the set of nodes in the table
-    nodes = np.unique(Ta[node_id_col].values.tolist() + Tb[node_id_col].values.tolist())
-    N = nodes.size  # number of nodes
-    node2id = {x: i for i, x in enumerate(nodes)}  # node label to integer id
-
-    # convert node label to node ids
-    Ta["_id"] = Ta[node_id_col].apply(lambda x: node2id[x])
-    Tb["_id"] = Tb[node_id_col].apply(lambda x: node2id[x])
-    return Ta, Tb, N
+    nodes, (id_a, id_b) = groups.encode_ids(Ta[node_id_col].values, Tb[node_id_col].values)
+    Ta["_id"] = id_a
+    Tb["_id"] = id_b
+    return Ta, Tb, nodes.size
 
 
 def calc_overlap(U_a, U_b, min_intersection=2):
     """
     Calculate the overlap between the memberships, Ua and Ub, where
-    Ua and Ub are membership matrices given by const_membership_matrix func
+    Ua and Ub are membership matrices given by const_membership_matrix func.
+    The overlap is returned as a sparse matrix.
     """
-
-    # Compute the intersection and the union of the detected and target groups
-    Intersection = (U_a.T @ U_b).toarray()
-
-    # Set Intersection to 0 if only one node is shared
-    Intersection[Intersection < min_intersection] = 0
-
-    sz_b = np.array(U_b.sum(axis=0)).reshape(-1)
-    S = Intersection @ np.diag(1.0 / sz_b)
-    return S
-
-
-def slice_groups(T, group_ids, group_id_col):
-    s = T[group_id_col].apply(lambda x: x in group_ids).values
-    return T[s]
+    return groups.overlap(U_a, U_b, min_intersection)
 
 
 def make_color_map(dw, min_w, max_w):
@@ -109,37 +76,34 @@ if __name__ == "__main__":
     detection_threshold = 0.4  # minimum overlap score at which we regard detected
 
     # Load the data
-    groups_CI = load_detected_cartels(np.arange(2000, 2020), CARTEL_DIR)
-
-    groups_TR = load_journal_groups_suspended_by_TR(TR_GROUP_FILE)
+    with tracing.span("load groups", inputs=[TR_GROUP_FILE]) as sp:
+        groups_CI = utils.load_detected_cartels(np.arange(2000, 2020), CARTEL_DIR)
+        groups_TR = load_journal_groups_suspended_by_TR(TR_GROUP_FILE)
+        sp.output(groups_CI, groups_TR)
 
     # Assgin a new id for the mag_journal_id
     groups_CI, groups_TR, N = add_id_column(groups_CI, groups_TR, "mag_journal_id")
 
     # Construct the membership matrix
     U_CI = const_membership_matrix(
-        groups_CI, node_id_col="_id", membership_id_col="group_id", N=N
+        groups_CI, node_id_col="_id", membership_id_col="gross_group_id", N=N
     )
     U_TR = const_membership_matrix(
         groups_TR, node_id_col="_id", membership_id_col="group_id", N=N
     )
 
     # Compute the overlap
-    O = calc_overlap(U_TR, U_CI)
-    O[O < detection_threshold] = 0
-
-    # Detected group pairs
-    gid_TR, gid_CI, o = sparse.find(O)
-    detected_groups = slice_groups(groups_CI, gid_CI, "group_id")
-
-    d1 = dict(zip(gid_CI, gid_TR))
-    d2 = dict(zip(gid_CI, o))
-    detected_groups["overlap"] = detected_groups["group_id"].apply(
-        lambda x: d2.get(x, -1)
-    )
-    detected_groups["group_id_TR"] = detected_groups["group_id"].apply(
-        lambda x: d1.get(x, -1)
-    )
+    with tracing.span("overlap", inputs=[U_TR, U_CI]):
+        O = calc_overlap(U_TR, U_CI)
+    O.data[O.data < detection_threshold] = 0
+    O.eliminate_zeros()
+
+    # Group suspended by TR that matches each detected group best
+    gid_TR, o = groups.best_match(O.T)
+    gid_CI = groups_CI["gross_group_id"].values
+    detected_groups = groups_CI[gid_TR[gid_CI] >= 0].copy()
+    detected_groups["overlap"] = o[detected_groups["gross_group_id"].values]
+    detected_groups["group_id_TR"] = gid_TR[detected_groups["gross_group_id"].values]
 
     # Make a colormap
     cmap, norm = make_color_map(0.2, 0.4, 1)
@@ -235,4 +199,5 @@ if __name__ == "__main__":
     plt.yticks(np.arange(0, 23), np.arange(1, 23))
 
     # Save figure
-    fig.savefig(OUTPUT, bbox_inches="tight", dpi=300)
+    with tracing.span("save figure"):
+        fig.savefig(OUTPUT, bbox_inches="tight", dpi=300)
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import warnings
+
+warnings.simplefilter(action="ignore")
+import pandas as pd
+import numpy as np
+import sys, os
+import utils
+import tracing
+
+sys.path.append(os.path.abspath(os.path.join("libs/cidre")))
+from cidre import render
+
+
+if __name__ == "__main__":
+    NET_DATA_DIR = sys.argv[1]  # "../../data/networks"
+    CARTEL_DIR = sys.argv[2]  # "../../data/cartels"
+    THETA = float(sys.argv[3])
+    LAYOUT_CACHE_DIR = sys.argv[4]
+    N_JOBS = int(sys.argv[5])
+    OUTPUT = sys.argv[6]
+
+    years = np.arange(2000, 2020)
+
+    # Load the detected cartels and the journal names
+    journal_names = pd.read_csv("%s/journal_names.csv" % NET_DATA_DIR, sep="\t")
+    cartel_table = utils.load_detected_cartels(years, CARTEL_DIR)
+    cartel_table = pd.merge(
+        cartel_table,
+        journal_names,
+        left_on="mag_journal_id",
+        right_on="mag_journal_id",
+        how="left",
+    )
+    cartel_table["name"] = cartel_table["name"].fillna("").astype(str)
+
+    # Load each network once
+    A_list = {}
+    for year in np.unique(cartel_table["year"].values):
+        A, _, _ = utils.load_network(year, NET_DATA_DIR)
+        A_list[year] = A
+
+    with tracing.span("render", inputs=[cartel_table], n_jobs=N_JOBS):
+        render.render_cartels(
+            A_list,
+            cartel_table,
+            THETA,
+            pdf_file=OUTPUT,
+            layout_cache_dir=LAYOUT_CACHE_DIR,
+            n_jobs=N_JOBS,
+        )
@@ -2,28 +2,14 @@
 # coding: utf-8
 
 import numpy as np
-import pandas as pd
 from scipy import sparse
 import matplotlib.pyplot as plt
 import seaborn as sns
 import sys
 import matplotlib.colors as colors
 from matplotlib import cm
-
-
-def load_detected_cartels(years, cartel_dir):
-    cartel_table_list = []
-    group_id_offset = 0
-    for year in years:
-        cartel_table = pd.read_csv(
-            "{root}/cartels-{year}.csv".format(root=cartel_dir, year=year), sep="\t"
-        )
-        cartel_table["year"] = year
-        cartel_table["group_id"] += group_id_offset
-        group_id_offset = np.max(cartel_table["group_id"].values) + 1
-        cartel_table_list += [cartel_table]
-    cartel_table = pd.concat(cartel_table_list, ignore_index=True)
-    return cartel_table
+import utils
+import tracing
 
 
 if __name__ == "__main__":
@@ -31,31 +17,21 @@ if __name__ == "__main__":
     CARTEL_DIR = sys.argv[1]
     OUTPUT = sys.argv[2]
 
-    cartel_table = load_detected_cartels(np.arange(2000, 2020), CARTEL_DIR)
+    with tracing.span("load cartels") as sp:
+        store = utils.load_cartel_store(CARTEL_DIR)
+        group_stats = store.group_stats(np.arange(2000, 2020))
+        sp.output(group_stats)
 
     # Count the number of detected groups in each year
     num_cartel = (
-        cartel_table.groupby("year")
-        .apply(lambda x: x[["group_id"]].drop_duplicates().shape[0])
-        .reset_index()
-        .rename(columns={0: "num_cartel"})
+        group_stats.groupby("year").size().reset_index().rename(columns={0: "num_cartel"})
     )
 
     # Compute the size
-    cartel_sz = (
-        cartel_table.groupby(["year", "group_id"])
-        .apply(lambda x: x.shape[0])
-        .reset_index()
-        .rename(columns={0: "sz"})
-    )
+    cartel_sz = group_stats[["year", "group_id", "size"]].rename(columns={"size": "sz"})
 
     # Compute the maximum size for each year
-    maxsz = (
-        cartel_sz.groupby("year")
-        .apply(lambda dg: dg["sz"].max())
-        .reset_index()
-        .rename(columns={0: "sz"})
-    )
+    maxsz = cartel_sz.groupby("year")["sz"].max().reset_index()
     maxsz["year"] = maxsz["year"] - 2000
 
     # Set up the canvas
@@ -107,4 +83,5 @@ if __name__ == "__main__":
     axes[0].annotate('(a)', xy=(0.01, 0.9), textcoords = "axes fraction", fontsize = 30)
     axes[1].text(0.01, 0.9, '(b)', transform = axes[1].transAxes, fontsize = 30)
 
-    plt.savefig(OUTPUT, bbox_inches="tight", dpi=300)
+    with tracing.span("save figure"):
+        plt.savefig(OUTPUT, bbox_inches="tight", dpi=300)
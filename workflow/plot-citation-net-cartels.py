@@ -14,12 +14,13 @@ import textwrap
 import re
 import sys, os
 import utils
+import tracing
 
 sys.path.append(os.path.abspath(os.path.join("libs/cidre")))
 from cidre import draw
 
 sys.path.append(os.path.abspath(os.path.join("libs/iso4")))
-from iso4 import abbreviate
+from iso4 import abbreviate_many
 import nltk
 
 nltk.download("wordnet")
@@ -31,7 +32,8 @@ def load_sampled_cartel(net_data_dir, cartel_dir, sampled_cartel_file):
 
     # Load the cartels in each category
     df_sampled = pd.read_csv(sampled_cartel_file, sep="\t")
-    df_2019 = utils.load_detected_cartels([2019], cartel_dir)
+    store = utils.load_cartel_store(cartel_dir)
+    df_2019 = store.year(2019)
 
     sampled_cartel = []
     sampled_cartel = [(r["group_id"], r["year"]) for i, r in df_sampled.iterrows()]
@@ -44,7 +46,7 @@ def load_sampled_cartel(net_data_dir, cartel_dir, sampled_cartel_file):
         group_id = row["group_id"]
         year = row["year"]
 
-        cartel = utils.load_detected_cartels([year], cartel_dir)
+        cartel = store.year(year)
         cartel = cartel[cartel.group_id == group_id]
         A, Araw, nodes = utils.load_network(year, net_data_dir)
 
@@ -59,7 +61,7 @@ def load_sampled_cartel(net_data_dir, cartel_dir, sampled_cartel_file):
 
     # Load the cartels that are detected in 2019
     year = 2019
-    cartel_table = utils.load_detected_cartels([year], cartel_dir)
+    cartel_table = store.year(year)
     A, Araw, nodes = utils.load_network(year, net_data_dir)
 
     # Compute the recipient score using the general citations
@@ -84,7 +86,9 @@ if __name__ == "__main__":
     ]  # "../../data/classified-cartels/case-study-cartels.csv"
     OUTPUT = sys.argv[4]
 
-    cartel_list = load_sampled_cartel(NET_DATA_DIR, CARTEL_DIR, SAMPLED_CARTEL_FILE)
+    with tracing.span("load cartels", inputs=[SAMPLED_CARTEL_FILE]) as sp:
+        cartel_list = load_sampled_cartel(NET_DATA_DIR, CARTEL_DIR, SAMPLED_CARTEL_FILE)
+        sp.output(cartel_list)
 
     alias_name = {
         "acta crystallographica section c crystal structure communications": "acta crystallographica section c",
@@ -96,23 +100,25 @@ if __name__ == "__main__":
         "acta crystallographica section e crystallographic communications": "Acta Crystallogr. Sect. E",
     }
 
-    def abbreviate_journal_title(title):
+    def abbreviate_journal_titles(titles):
         # Abbreviation of journal titles according to NLM
         # See http://wayback.archive-it.org/org-350/20130705122245/http://www.nlm.nih.gov/pubs/factsheets/constructitle.html
-        abbrev_title = abbreviate(title)
-
-        if title in preset_name.keys():
-            abbrev_title = preset_name[title]
-        else:
-            title = alias_name.get(title, title)
-            abbrev_title = abbreviate(title)
-            abbrev_title = re.sub(
-                "(?<=^)[a-z]|(?<=\s)[a-z]", "{}", abbrev_title
-            ).format(
-                *map(str.upper, re.findall("(?<=^)[a-z]|(?<=\s)[a-z]", abbrev_title))
-            )
-        abbrev_title = re.sub(" +", " ", abbrev_title)
-        return abbrev_title
+        titles = list(titles)
+        abbrev_titles = abbreviate_many([alias_name.get(title, title) for title in titles])
+
+        retval = []
+        for title, abbrev_title in zip(titles, abbrev_titles):
+            if title in preset_name.keys():
+                abbrev_title = preset_name[title]
+            else:
+                abbrev_title = re.sub(
+                    "(?<=^)[a-z]|(?<=\s)[a-z]", "{}", abbrev_title
+                ).format(
+                    *map(str.upper, re.findall("(?<=^)[a-z]|(?<=\s)[a-z]", abbrev_title))
+                )
+            abbrev_title = re.sub(" +", " ", abbrev_title)
+            retval += [abbrev_title]
+        return retval
 
     # Load the class for drawing a cartel
     dc = draw.DrawCartel()
@@ -143,7 +149,8 @@ if __name__ == "__main__":
         figid += 1
 
         # Abbreviate the journal names
-        cartel["name"] = cartel["name"].apply(lambda x: abbreviate_journal_title(x))
+        with tracing.span("abbreviate", inputs=[cartel]):
+            cartel["name"] = abbreviate_journal_titles(cartel["name"].values)
 
         # Sort the cartels based on the lebgth of the abbreviated names
         cartel["char_num"] = cartel["name"].apply(lambda x: len(x))
@@ -160,15 +167,16 @@ if __name__ == "__main__":
             dc.node_size = 0.15
             dc.label_node_margin = 0.45  # 0.31
 
-        dc.draw(
-            A,
-            cartel.node_id.values.tolist(),
-            cartel.donor_score.values.tolist(),
-            cartel.recipient_score.values.tolist(),
-            threshold,
-            cartel.name.values.tolist(),
-            ax=ax,
-        )
+        with tracing.span("draw", inputs=[cartel]):
+            dc.draw(
+                A,
+                cartel.node_id.values.tolist(),
+                cartel.donor_score.values.tolist(),
+                cartel.recipient_score.values.tolist(),
+                threshold,
+                cartel.name.values.tolist(),
+                ax=ax,
+            )
         ax.text(
             0.01,
             1.05,
@@ -189,4 +197,5 @@ if __name__ == "__main__":
     box.x1 = box.x1 - 0.0
     axes[1, 2].set_position(box)
 
-    fig.savefig(OUTPUT, bbox_inches="tight")
+    with tracing.span("save figure"):
+        fig.savefig(OUTPUT, bbox_inches="tight")
@@ -0,0 +1,381 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # About this code
+#
+# Tracing of the stages of the workflow scripts. A stage is wrapped in a
+# span, which records the wall time, CPU time, peak RSS of the process, and
+# the sizes of the inputs and outputs:
+#
+#   import tracing
+#   with tracing.span("load networks") as sp:
+#       A, Araw, nodes = utils.load_network(year, net_dir)
+#       sp.output(A)
+#
+# Spans can be nested. Every script that imports this module also records
+# a span for the whole script. Database queries run by utils.run_query are
+# recorded as spans of kind "query".
+#
+# The spans are appended as JSON lines to
+# $WORKFLOW_TRACE_DIR/$WORKFLOW_RUN_ID/<script>-<pid>.jsonl. Nothing is
+# written if WORKFLOW_TRACE_DIR is not set. The Snakefile sets both
+# variables so that all scripts in a Snakemake run share the run id.
+#
+# Summarize the spans of a run:
+#   python3 workflow/tracing.py summarize data/mag/traces/<run id> [--folded]
+#
+import os
+import sys
+import json
+import time
+import atexit
+import resource
+import argparse
+from contextlib import contextmanager
+
+TRACE_DIR_ENV = "WORKFLOW_TRACE_DIR"
+RUN_ID_ENV = "WORKFLOW_RUN_ID"
+
+SCRIPT = os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else "python"
+
+# Names of the open spans
+_stack = []
+
+# Trace file of the process, reopened in the child processes after fork
+_trace = {"pid": None, "file": None}
+
+
+class Span:
+    """
+    Record of a stage
+    """
+
+    def __init__(self, name, kind):
+        self.name = name
+        self.kind = kind
+        self.inputs = []
+        self.outputs = []
+        self.attrs = {}
+
+    def input(self, *objs):
+        """
+        Record the sizes of the inputs
+        """
+        self.inputs += [size_of(x) for x in objs]
+
+    def output(self, *objs):
+        """
+        Record the sizes of the outputs
+        """
+        self.outputs += [size_of(x) for x in objs]
+
+    def set(self, **attrs):
+        """
+        Record additional attributes
+        """
+        self.attrs.update(attrs)
+
+
+@contextmanager
+def span(name, kind="stage", inputs=(), **attrs):
+    """
+    Trace a stage
+
+    Parameters
+    ----------
+    name : str
+        Name of the stage
+    kind : str
+        Kind of the stage, e.g., "stage" or "query"
+    inputs : list
+        Inputs of the stage whose sizes are recorded. See size_of.
+    attrs : dict
+        Additional attributes
+
+    Yields
+    ------
+    span : Span
+    """
+    sp = Span(name, kind)
+    sp.input(*inputs)
+    sp.set(**attrs)
+
+    _stack.append(name)
+    path = ";".join([SCRIPT] + _stack)
+    start = time.time()
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    error = None
+    try:
+        yield sp
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        _stack.pop()
+        _write(
+            {
+                "path": path,
+                "name": name,
+                "kind": kind,
+                "start": start,
+                "wall": time.perf_counter() - wall,
+                "cpu": time.process_time() - cpu,
+                "max_rss": max_rss(),
+                "inputs": sp.inputs,
+                "outputs": sp.outputs,
+                "attrs": sp.attrs,
+                "error": error,
+            }
+        )
+
+
+def size_of(x):
+    """
+    Size of a table, matrix, array, file or list
+    """
+    if hasattr(x, "memory_usage") and hasattr(x, "shape"):  # pandas
+        return {"rows": int(x.shape[0]), "bytes": int(x.memory_usage(index=True).sum())}
+    if hasattr(x, "nnz"):  # scipy sparse matrix
+        nbytes = sum(
+            getattr(x, a).nbytes for a in ["data", "indices", "indptr"] if hasattr(x, a)
+        )
+        return {"rows": int(x.shape[0]), "nnz": int(x.nnz), "bytes": int(nbytes)}
+    if hasattr(x, "nbytes") and hasattr(x, "shape"):  # numpy
+        return {"rows": int(x.shape[0]) if x.ndim else 1, "bytes": int(x.nbytes)}
+    if isinstance(x, str) and os.path.isfile(x):
+        return {"file": x, "bytes": os.path.getsize(x)}
+    if hasattr(x, "__len__"):
+        return {"rows": len(x)}
+    return {"value": repr(x)}
+
+
+def max_rss():
+    """
+    Peak resident set size of this process in bytes
+    """
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def trace_file():
+    """
+    Trace file of this process, or None if tracing is disabled
+    """
+    trace_dir = os.environ.get(TRACE_DIR_ENV)
+    if not trace_dir:
+        return None
+    if _trace["pid"] != os.getpid():
+        run_dir = os.path.join(trace_dir, os.environ.get(RUN_ID_ENV, "default"))
+        os.makedirs(run_dir, exist_ok=True)
+        _trace["pid"] = os.getpid()
+        _trace["file"] = os.path.join(
+            run_dir, "%s-%d.jsonl" % (os.path.splitext(SCRIPT)[0], os.getpid())
+        )
+    return _trace["file"]
+
+
+def _write(record):
+    filename = trace_file()
+    if filename is None:
+        return
+    record["pid"] = os.getpid()
+    with open(filename, "a") as f:
+        f.write(json.dumps(record, default=str) + "\n")
+
+
+#
+# Span of the whole script
+#
+_script_start = (time.time(), time.perf_counter(), time.process_time(), os.getpid())
+
+
+def _write_script_span():
+    start, wall, cpu, pid = _script_start
+    if pid != os.getpid():  # Worker process
+        return
+    _write(
+        {
+            "path": SCRIPT,
+            "name": SCRIPT,
+            "kind": "script",
+            "start": start,
+            "wall": time.perf_counter() - wall,
+            "cpu": time.process_time() - cpu,
+            "max_rss": max_rss(),
+            "inputs": [],
+            "outputs": [],
+            "attrs": {"argv": sys.argv[1:]},
+            "error": None,
+        }
+    )
+
+
+atexit.register(_write_script_span)
+
+
+#
+# Summary
+#
+def load_spans(run_dir):
+    spans = []
+    for filename in sorted(os.listdir(run_dir)):
+        if not filename.endswith(".jsonl"):
+            continue
+        with open(os.path.join(run_dir, filename), "r") as f:
+            spans += [json.loads(line) for line in f if line.strip()]
+    return spans
+
+
+def aggregate(spans):
+    """
+    Aggregate the spans by path
+
+    Returns
+    -------
+    stats : dict
+        stats[path] is a dict with the number of calls, total wall and CPU
+        time, self time, peak RSS, total input and output rows, and the
+        number and total time of the database queries
+    """
+    stats = {}
+    for s in spans:
+        st = stats.setdefault(
+            s["path"],
+            {
+                "kind": s["kind"],
+                "calls": 0,
+                "wall": 0.0,
+                "cpu": 0.0,
+                "child_wall": 0.0,
+                "max_rss": 0,
+                "rows_in": 0,
+                "rows_out": 0,
+                "queries": 0,
+                "query_time": 0.0,
+                "errors": 0,
+            },
+        )
+        st["calls"] += 1
+        st["wall"] += s["wall"]
+        st["cpu"] += s["cpu"]
+        st["max_rss"] = max(st["max_rss"], s["max_rss"])
+        st["rows_in"] += sum(x.get("rows", 0) for x in s["inputs"])
+        st["rows_out"] += sum(x.get("rows", 0) for x in s["outputs"])
+        st["errors"] += s["error"] is not None
+
+    # Time spent in the children and in the queries under each path
+    for path, st in stats.items():
+        parts = path.split(";")
+        for i in range(1, len(parts)):
+            parent = ";".join(parts[:i])
+            if parent not in stats:
+                continue
+            if i == len(parts) - 1:
+                stats[parent]["child_wall"] += st["wall"]
+            if st["kind"] == "query":
+                stats[parent]["queries"] += st["calls"]
+                stats[parent]["query_time"] += st["wall"]
+    for st in stats.values():
+        st["self"] = max(st["wall"] - st["child_wall"], 0.0)
+    return stats
+
+
+def format_size(n):
+    for unit in ["B", "K", "M", "G"]:
+        if n < 1024:
+            return "%.1f%s" % (n, unit)
+        n /= 1024
+    return "%.1fT" % n
+
+
+def print_tree(stats, bar_width=30, file=sys.stdout):
+    """
+    Print the aggregated spans as an indented tree, where the bars show the
+    share of the wall time of the scripts
+    """
+    total = sum(st["wall"] for path, st in stats.items() if ";" not in path)
+    total = max(total, 1e-9)
+    print(
+        "%-40s %6s %10s %10s %10s %9s %10s %10s %8s %10s  %s"
+        % (
+            "span",
+            "calls",
+            "wall",
+            "cpu",
+            "self",
+            "max_rss",
+            "rows_in",
+            "rows_out",
+            "queries",
+            "query",
+            "share",
+        ),
+        file=file,
+    )
+
+    def children(path):
+        depth = path.count(";") + 1 if path else 0
+        keys = [
+            k
+            for k in stats
+            if k.count(";") == depth and (not path or k.startswith(path + ";"))
+        ]
+        return sorted(keys, key=lambda k: -stats[k]["wall"])
+
+    def visit(path):
+        st = stats[path]
+        name = "  " * path.count(";") + path.split(";")[-1]
+        bar = "#" * int(round(bar_width * min(st["wall"] / total, 1.0)))
+        print(
+            "%-40s %6d %9.2fs %9.2fs %9.2fs %9s %10d %10d %8d %9.2fs  %s"
+            % (
+                name[:40],
+                st["calls"],
+                st["wall"],
+                st["cpu"],
+                st["self"],
+                format_size(st["max_rss"]),
+                st["rows_in"],
+                st["rows_out"],
+                st["queries"],
+                st["query_time"],
+                bar,
+            ),
+            file=file,
+        )
+        for child in children(path):
+            visit(child)
+
+    for root in children(""):
+        visit(root)
+
+
+def print_folded(stats, file=sys.stdout):
+    """
+    Print the self time of the spans in the folded format of flamegraph.pl
+    and speedscope, in milliseconds
+    """
+    for path, st in sorted(stats.items()):
+        print("%s %d" % (path, round(st["self"] * 1000)), file=file)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize the traced spans")
+    parser.add_argument("command", choices=["summarize"])
+    parser.add_argument("run_dir", help="Directory of the trace files of a run")
+    parser.add_argument(
+        "--folded", action="store_true", help="Print the folded stacks for flame graphs"
+    )
+    args = parser.parse_args(argv)
+
+    stats = aggregate(load_spans(args.run_dir))
+    if args.folded:
+        print_folded(stats)
+    else:
+        print_tree(stats)
+
+
+if __name__ == "__main__":
+    atexit.unregister(_write_script_span)
+    main()
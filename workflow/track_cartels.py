@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # About this code
+#
+# Link the cartels of consecutive years and assign the lineage ids that
+# persist over the years (see cidre.lineage). The lineage table is written
+# into LINEAGE_FILE and into LINEAGE_DIR (see CartelStore.save_lineage),
+# from which CartelStore.group_lineage reads it, and the links between the
+# groups into LINK_FILE. The store itself is not modified.
+#
+# Usage:
+#   python3 workflow/track_cartels.py STORE_DIR MIN_JACCARD LINEAGE_FILE LINK_FILE LINEAGE_DIR
+#
+import sys, os
+import tracing
+
+sys.path.append(os.path.abspath(os.path.join("libs/cidre")))
+from cidre import lineage
+from cidre.store import CartelStore
+
+if __name__ == "__main__":
+
+    STORE_DIR = sys.argv[1]
+    MIN_JACCARD = float(sys.argv[2])
+    LINEAGE_FILE = sys.argv[3]
+    LINK_FILE = sys.argv[4]
+    LINEAGE_DIR = sys.argv[5]
+
+    store = CartelStore.open(STORE_DIR)
+    with tracing.span("track", num_rows=int(store.num_rows)) as sp:
+        lineage_table, link_table = lineage.track(
+            store.table(), node_col=store.node_col, min_jaccard=MIN_JACCARD
+        )
+        sp.output(lineage_table, link_table)
+
+    store.with_lineage(lineage_table).save_lineage(LINEAGE_DIR)
+    lineage_table.to_csv(LINEAGE_FILE, sep="\t", index=False)
+    link_table.to_csv(LINK_FILE, sep="\t", index=False)
+
+    print(
+        "%d groups in %d lineages: %s"
+        % (
+            lineage_table.shape[0],
+            lineage_table["lineage_id"].nunique(),
+            ", ".join(
+                "%d %s" % (n, event)
+                for event, n in lineage_table["event"].value_counts().items()
+            ),
+        )
+    )
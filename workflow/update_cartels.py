@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # About this code
+#
+# Detect the cartels for a year whose network is updated by new batches
+# of citations. The intermediate results of the last run are kept in
+# STATE_FILE (see cidre.incremental). If the state is found for the same
+# journals and parameters, the difference between the current network and
+# the one in the state is applied as an edge delta, and only the affected
+# p-values and nodes are recomputed. Otherwise, the cartels are detected
+# from scratch and the state is created. The results are the same as those
+# of detect_cartels.py.
+#
+# If STORE_DIR and UPDATED_STORE_DIR are given, the cartel store in
+# STORE_DIR with the year replaced is saved in UPDATED_STORE_DIR. The store
+# in STORE_DIR is not modified since other rules read it while this runs.
+#
+# Usage:
+#   python3 workflow/update_cartels.py YEAR NETWORK_DIR THETA ALPHA COMMUNITY_FILE STATE_FILE OUTPUT [STORE_DIR UPDATED_STORE_DIR]
+#
+import numpy as np
+import utils
+import tracing
+import sys, os
+from detect_cartels import load_community_table, find_community_ids
+
+sys.path.append(os.path.abspath(os.path.join("libs/cidre")))
+from cidre import cidre
+from cidre import cache as cidre_cache
+from cidre.incremental import DetectionState
+from cidre.store import CartelStore
+
+REF_FRAC_WEIGHT = 0.5
+MIN_GROUP_EDGE_NUM = 50
+
+
+def load_state(state_file, nodes, node_community_ids, params):
+    """
+    Load the state if it is for the same journals, communities and parameters.
+    Otherwise, return None.
+    """
+    if not os.path.exists(state_file):
+        return None
+    state = DetectionState.load(state_file)
+    if (
+        state.node_labels is None
+        or not np.array_equal(state.node_labels, nodes)
+        or not np.array_equal(state.community_ids, node_community_ids)
+        or state.params != params
+    ):
+        return None
+    return state
+
+
+if __name__ == "__main__":
+
+    YEAR = int(sys.argv[1])
+    NETWORK_DIR = sys.argv[2]
+    THETA = float(sys.argv[3])
+    ALPHA = float(sys.argv[4])
+    COMMUNITY_FILE = sys.argv[5]
+    STATE_FILE = sys.argv[6]
+    OUTPUT = sys.argv[7]
+    STORE_DIR = sys.argv[8] if len(sys.argv) > 8 else None  # Optional
+    UPDATED_STORE_DIR = sys.argv[9] if len(sys.argv) > 9 else None
+    if STORE_DIR is not None and (
+        UPDATED_STORE_DIR is None
+        or os.path.abspath(UPDATED_STORE_DIR) == os.path.abspath(STORE_DIR)
+    ):
+        sys.exit("UPDATED_STORE_DIR must be given and differ from STORE_DIR")
+
+    journal_index, community_ids = load_community_table(COMMUNITY_FILE)
+    A_eff, A_gen, nodes = utils.load_network(YEAR, NETWORK_DIR, cache=cidre_cache.from_env())
+    node_community_ids = find_community_ids(nodes, journal_index, community_ids)
+    params = {
+        "threshold": THETA,
+        "alpha": ALPHA,
+        "ref_frac_weight": REF_FRAC_WEIGHT,
+        "min_group_edge_num": MIN_GROUP_EDGE_NUM,
+    }
+
+    state = load_state(STATE_FILE, nodes, node_community_ids, params)
+    if state is None:
+        with tracing.span("detect_full", inputs=[A_eff, A_gen], year=YEAR):
+            state = DetectionState.from_network(
+                A_eff, A_gen, node_community_ids, node_labels=nodes, **params
+            )
+    else:
+        with tracing.span("detect_incremental", inputs=[A_eff, A_gen], year=YEAR) as sp:
+            dA = A_eff - state.A
+            dA_gen = A_gen - state.A_ref
+            sp.set(delta_edges=int(dA.count_nonzero()))
+            state.update(dA, dA_gen)
+            print("year", YEAR, "applied a delta of", dA.count_nonzero(), "edges")
+    state.save(STATE_FILE)
+
+    cartel_table = state.table()
+    group_stats = cidre.summarize(A_eff, cartel_table)
+    cartel_table["mag_journal_id"] = nodes[cartel_table["node_id"].values]
+    cartel_table.to_csv(OUTPUT, sep="\t")
+
+    if STORE_DIR is not None:
+        if os.path.isdir(STORE_DIR):
+            store = CartelStore.open(STORE_DIR).with_tables(
+                {YEAR: cartel_table}, {YEAR: group_stats}
+            )
+        else:
+            store = CartelStore.from_tables({YEAR: cartel_table}, group_stats={YEAR: group_stats})
+        store.save(UPDATED_STORE_DIR)
@@ -3,8 +3,17 @@ import py2neo
 import pandas as pd
 import networkx as nx
 from scipy import sparse
+import sys, os
+import re
+import tracing
+
+sys.path.append(os.path.abspath(os.path.join("libs/cidre")))
+from cidre import cache as cidre_cache
+from cidre.store import CartelStore
 
 DATA_DIR = "data/mag"
+CARTEL_STORE_NAME = "store"
+CARTEL_LINEAGE_NAME = "store-lineage"
 
 
 def get_db():
@@ -15,6 +24,17 @@ def get_db():
     return graph
 
 
+def run_query(graph, query):
+    """
+    Run a query and return the result as a pandas.DataFrame.
+    The duration and the number of rows are recorded by tracing.
+    """
+    with tracing.span("query", kind="query", query=" ".join(query.split())[:200]) as sp:
+        result = graph.run(query).to_data_frame()
+        sp.output(result)
+    return result
+
+
 def construct_adjacency_matrix(nodes, edges):
 
     # Compute the mapping from node ids to id
@@ -39,7 +59,30 @@ def construct_adjacency_matrix(nodes, edges):
     return A
 
 
-def load_network(years, net_data_dir=None):
+def load_network(years, net_data_dir=None, cache=None):
+    """
+    Load the citation networks for years
+
+    Parameters
+    ----------
+    years : int or list of int
+        Years of the networks. The networks for the years are aggregated.
+    net_data_dir : str (Optional; Default None)
+        Directory of the network files
+    cache : cidre.cache.ArtifactCache (Optional; Default None)
+        Cache for the parsed networks, keyed by the contents of the network
+        files. If None, the cache given by the environment variables
+        (see cidre.cache.from_env) is used if any.
+
+    Returns
+    -------
+    A : scipy sparse matrix
+        Adjacency matrix
+    Araw : scipy sparse matrix
+        Adjacency matrix of the raw network
+    nodes : numpy.ndarray
+        nodes[i] is the ID of the ith node
+    """
 
     if hasattr(years, "__len__") == False:
         years = [years]
@@ -47,21 +90,42 @@ def load_network(years, net_data_dir=None):
     if net_data_dir is None:
         net_data_dir = "%s/networks/" % DATA_DIR
 
+    if cache is None:
+        cache = cidre_cache.from_env()
+
+    files = [
+        "{root}/{name}-{year}.csv".format(root=net_data_dir, name=name, year=year)
+        for year in years
+        for name in ["nodes", "edges", "raw-edges"]
+    ]
+
+    def compute():
+        A, Araw, nodes = _load_network(files)
+        arrays = {"nodes": nodes}
+        arrays.update(cidre_cache.csr_to_arrays(A, "A"))
+        arrays.update(cidre_cache.csr_to_arrays(Araw, "Araw"))
+        return arrays
+
+    with tracing.span("load_network", inputs=files, years=[int(y) for y in years]) as sp:
+        if cache is None:
+            A, Araw, nodes = _load_network(files)
+        else:
+            key = cache.key("network", cidre_cache.hash_files(files))
+            arrays = cidre_cache.cached(cache, key, compute)
+            A = cidre_cache.csr_from_arrays(arrays, "A")
+            Araw = cidre_cache.csr_from_arrays(arrays, "Araw")
+            nodes = np.array(arrays["nodes"])
+        sp.output(A, Araw, nodes)
+    return A, Araw, nodes
+
+
+def _load_network(files):
+
     # Load the node and edge files
     df_nodes = []
     df_edges = []
     df_raw_edges = []
-    for year in years:
-
-        node_file = "{root}/nodes-{year}.csv".format(
-            root=net_data_dir, year=year
-        )
-        edge_file = "{root}/edges-{year}.csv".format(
-            root=net_data_dir, year=year
-        )
-        raw_edge_file = "{root}/raw-edges-{year}.csv".format(
-            root=net_data_dir, year=year
-        )
+    for node_file, edge_file, raw_edge_file in zip(files[::3], files[1::3], files[2::3]):
 
         _df_nodes = pd.read_csv(node_file, sep="\t")
         _df_edges = pd.read_csv(edge_file, sep="\t")
@@ -96,7 +160,7 @@ def neo4jid2mag_journalid(neo4jids):
     where ID(j) in [{neo4jids}]
     return ID(j) as neo4jid, j.JournalId as journal_id 
     """.format(neo4jids = ",".join(["%d" % x for x in neo4jids]))
-    df = graph.run(query).to_data_frame()
+    df = run_query(graph, query)
     return df.set_index("neo4jid").loc[neo4jids,"journal_id"].values
 
 
@@ -117,22 +181,73 @@ def to_networkx_graph(A, nodes, create_using=nx.DiGraph):
     return nx.relabel_nodes(G, dict(zip(np.arange(nodes.size), nodes)))
 
 
+def load_cartel_store(cartel_dir):
+    """
+    Store of the cartels detected in all years
+
+    The store saved in {cartel_dir}/store by detect_cartels_all.py is
+    memory-mapped, with the lineage saved in {cartel_dir}/store-lineage by
+    track_cartels.py if it exists. If there is no store, it is built from the files
+    {cartel_dir}/cartels-{year}.csv, once per process as long as the files
+    are unchanged.
+
+    The gross_group_ids of the store are numbered over all the years in
+    the store. See load_detected_cartels for those numbered over given years.
+
+    Returns
+    -------
+    store : cidre.store.CartelStore
+    """
+    store_dir = os.path.join(cartel_dir, CARTEL_STORE_NAME)
+    lineage_dir = os.path.join(cartel_dir, CARTEL_LINEAGE_NAME)
+    if os.path.isdir(store_dir):
+        return CartelStore.open(
+            store_dir, lineage_path=lineage_dir if os.path.isdir(lineage_dir) else None
+        )
+
+    files = {}
+    for filename in sorted(os.listdir(cartel_dir)):
+        m = re.match(r"cartels-(\d+)\.csv$", filename)
+        if m is not None:
+            files[int(m.group(1))] = os.path.join(cartel_dir, filename)
+    signature = tuple(
+        (year, os.stat(path).st_mtime_ns, os.stat(path).st_size) for year, path in files.items()
+    )
+    key = os.path.abspath(cartel_dir)
+    if key in _csv_cartel_stores and _csv_cartel_stores[key][0] == signature:
+        return _csv_cartel_stores[key][1]
+
+    tables = {year: pd.read_csv(path, sep="\t") for year, path in files.items()}
+    store = CartelStore.from_tables(tables)
+    _csv_cartel_stores[key] = (signature, store)
+    return store
+
+
+# Stores built from the csv files by load_cartel_store, keyed by the directory
+_csv_cartel_stores = {}
+
+
 def load_detected_cartels(years, cartel_dir):
-    cartel_table_list = []
-    group_id_offset = 0
+    """
+    Table of the cartels detected in the years, with the columns year and
+    gross_group_id
+
+    The gross_group_ids are numbered over the given years in the given
+    order, i.e., the group_id of a year is shifted by one plus the largest
+    gross_group_id of the preceding given years. They coincide with those
+    of the cartel store only if the years are all the years in the store.
+    """
+    store = load_cartel_store(cartel_dir)
+    tables = []
+    offset = 0
     for year in years:
-        cartel_table = pd.read_csv(
-            "{root}/cartels-{year}.csv".format(root=cartel_dir, year=year), sep="\t"
-        )
-        cartel_table["year"] = year
-        #cartel_table["group_id"] += group_id_offset
-        cartel_table["gross_group_id"] = cartel_table["group_id"]
-        cartel_table["gross_group_id"] += group_id_offset
-        group_id_offset = np.max(cartel_table["gross_group_id"].values) + 1
-        cartel_table_list += [cartel_table]
-    cartel_table = pd.concat(cartel_table_list, ignore_index=True)
-    return cartel_table
+        table = store.year(year)
+        table["gross_group_id"] = table["group_id"].values + offset
+        offset = np.max(table["gross_group_id"].values, initial=offset - 1) + 1
+        tables.append(table)
+    return pd.concat(tables, ignore_index=True)
+
 
 def slice_groups(T, group_ids, group_id_col):
-    s = T[group_id_col].apply(lambda x: x in group_ids).values
-    return T[s]
\ No newline at end of file
+    s = np.isin(T[group_id_col].values, np.asarray(list(group_ids)))
+    return T[s]